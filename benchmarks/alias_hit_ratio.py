@@ -0,0 +1,89 @@
+"""Доля попаданий в кеш на воспроизведённом журнале запросов.
+
+Журнал содержит одни и те же города в разных написаниях: регистр, пробелы,
+полноширинные символы и локальные названия. Для старой схемы (ключ — сырая
+строка запроса) доля попаданий считается по журналу: запрос попадает, если
+такая же строка уже встречалась. Для новой схемы журнал проигрывается через
+WeatherService и считаются реальные обращения к fake OpenWeatherMap.
+
+Бенчмарк очищает кеш и пишет алиасы в настроенную БД.
+
+    python -m benchmarks.alias_hit_ratio --requests 2000 --cities 50
+"""
+
+import argparse
+import random
+
+from benchmarks.common import print_report, setup_django
+from tests.fake_owm import CITY_ALIASES, GEO_PATH, ONECALL_PATH, FakeOpenWeatherMap
+
+
+def spelling_variants(city: str) -> list[str]:
+    variants = [city, city.lower(), city.upper(), f'  {city} ', city.replace(' ', '  ')]
+    # Полноширинные латинские символы (U+FF01…U+FF5E).
+    variants.append(city.translate({code: code + 0xFEE0 for code in range(0x21, 0x7F)}))
+    variants.extend(local.title() for local, name in CITY_ALIASES.items() if name == city.lower())
+    return variants
+
+
+def build_log(requests: int, cities: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    names = [name.title() for name in CITY_ALIASES.values()] + [f'City {index}' for index in range(cities)]
+    names = names[:cities]
+    return [rng.choice(spelling_variants(rng.choice(names))) for _ in range(requests)]
+
+
+def raw_key_hit_ratio(log: list[str]) -> dict:
+    seen = set()
+    hits = 0
+    for city in log:
+        hits += city in seen
+        seen.add(city)
+    return {'distinct_keys': len(seen), 'hit_ratio': round(hits / len(log), 4)}
+
+
+def canonical_hit_ratio(log: list[str]) -> dict:
+    from django.core.cache import cache
+    from django.core.management import call_command
+
+    from weather.services.open_weather_map import OpenWeatherBase, WeatherService
+    from weather.services.tiered_cache import get_tiered_cache
+
+    call_command('migrate', verbosity=0)
+    cache.clear()
+    get_tiered_cache().local.clear()
+
+    with FakeOpenWeatherMap() as server:
+        OpenWeatherBase.BASE_URL = server.url
+        service = WeatherService()
+        ok = sum(service.get_current_weather(city).is_ok for city in log)
+
+    return {
+        'ok': ok,
+        'geocoding_calls': server.calls[GEO_PATH],
+        'weather_calls': server.calls[ONECALL_PATH],
+        'hit_ratio': round(1 - server.calls[ONECALL_PATH] / len(log), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    log = build_log(args.requests, args.cities, args.seed)
+    print_report(
+        {
+            'requests': len(log),
+            'cities': args.cities,
+            'raw_keys': raw_key_hit_ratio(log),
+            'canonical_keys': canonical_hit_ratio(log),
+        }
+    )
+
+
+if __name__ == '__main__':
+    main()
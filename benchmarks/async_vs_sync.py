@@ -0,0 +1,100 @@
+"""Синхронный и асинхронный путь получения текущей погоды при задержке upstream.
+
+Каждый запрос идёт по уникальному городу (холодный кеш), поэтому время
+определяется ожиданием fake OpenWeatherMap. Синхронный путь ограничен
+числом потоков воркера, асинхронный — числом соединений транспорта.
+Fake-сервер запускается в отдельном процессе, чтобы не делить GIL с клиентом.
+
+    python -m benchmarks.async_vs_sync --requests 200 --latency 0.2 --threads 16
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import latency_summary, print_report, setup_django
+from tests.fake_owm import fake_owm_process
+
+
+def run_sync(cities: list[str], threads: int) -> dict:
+    from weather.services.open_weather_map import WeatherService
+
+    latencies = []
+
+    def request(city: str) -> bool:
+        started = time.perf_counter()
+        result = WeatherService().get_current_weather(city)
+        latencies.append(time.perf_counter() - started)
+        return result.is_ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        ok = sum(executor.map(request, cities))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'ok': ok,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(cities) / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+def run_async(cities: list[str], connections: int) -> dict:
+    from weather.services.http import AsyncHttpTransport
+    from weather.services.open_weather_map import WeatherService
+
+    latencies = []
+
+    async def request(service: WeatherService, city: str) -> bool:
+        started = time.perf_counter()
+        result = await service.aget_current_weather(city)
+        latencies.append(time.perf_counter() - started)
+        return result.is_ok
+
+    async def run() -> int:
+        transport = AsyncHttpTransport(max_connections=connections)
+        service = WeatherService(async_transport=transport)
+        results = await asyncio.gather(*(request(service, city) for city in cities))
+        await transport.aclose()
+        return sum(results)
+
+    started = time.perf_counter()
+    ok = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    return {
+        'ok': ok,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(cities) / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help='задержка upstream, с')
+    parser.add_argument('--threads', type=int, default=16, help='потоков синхронного воркера')
+    parser.add_argument('--connections', type=int, default=256, help='соединений асинхронного транспорта')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+
+    from weather.services.open_weather_map import OpenWeatherBase
+
+    with fake_owm_process(latency=args.latency) as upstream_url:
+        OpenWeatherBase.BASE_URL = upstream_url
+
+        cache.clear()
+        sync_report = run_sync([f'sync-city-{index}' for index in range(args.requests)], args.threads)
+        cache.clear()
+        async_report = run_async([f'async-city-{index}' for index in range(args.requests)], args.connections)
+
+    print_report({'config': vars(args), 'sync': sync_report, 'async': async_report})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Размер значений кеша и время кодирования: pickle (django-redis по умолчанию) и CompactSerializer.
+
+Значения — конверты CacheEntry, как их пишет WeatherService: текущая погода,
+прогноз на день и координаты города.
+
+    python -m benchmarks.cache_encoding --iterations 100000
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.common import print_report, setup_django
+
+
+def sample_values(count: int, seed: int) -> dict[str, list[dict]]:
+    rng = random.Random(seed)
+    fresh_until = time.time() + 600
+
+    def temperature() -> float:
+        return round(rng.uniform(-30, 40), 2)
+
+    return {
+        'current_weather': [
+            {
+                'data': {
+                    'temperature': temperature(),
+                    'local_time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+                },
+                'fresh_until': fresh_until,
+            }
+            for _ in range(count)
+        ],
+        'forecast': [
+            {'data': {'min': temperature(), 'max': temperature()}, 'fresh_until': fresh_until} for _ in range(count)
+        ],
+        'geo_coords': [
+            {
+                'data': {
+                    'lat': round(rng.uniform(-90, 90), 4),
+                    'lon': round(rng.uniform(-180, 180), 4),
+                    'location_id': rng.randrange(1, 10**6),
+                },
+                'fresh_until': fresh_until,
+            }
+            for _ in range(count)
+        ],
+    }
+
+
+def measure(serializer, values: list[dict]) -> dict:
+    started = time.perf_counter()
+    encoded = [serializer.dumps(value) for value in values]
+    encode_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for item in encoded:
+        serializer.loads(item)
+    decode_time = time.perf_counter() - started
+
+    return {
+        'bytes_per_key': round(sum(map(len, encoded)) / len(encoded), 1),
+        'encode_us': round(encode_time / len(values) * 1e6, 3),
+        'decode_us': round(decode_time / len(values) * 1e6, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django_redis.serializers.pickle import PickleSerializer
+
+    from weather.services.cache_codec import CompactSerializer
+
+    serializers = {'pickle': PickleSerializer({}), 'compact': CompactSerializer({})}
+    report = {'values_per_family': args.iterations}
+    for family, values in sample_values(args.iterations, args.seed).items():
+        report[family] = {name: measure(serializer, values) for name, serializer in serializers.items()}
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
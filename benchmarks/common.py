@@ -0,0 +1,34 @@
+import json
+import os
+import statistics
+
+import django
+
+
+def setup_django() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    # Бенчмарки меряют приложение на fake-сервере, квота реального API к ним не относится.
+    os.environ.setdefault('OPENWEATHERMAP_RATE_LIMIT_ENABLED', 'false')
+    django.setup()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """Сводка задержек в миллисекундах."""
+    return {
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,119 @@
+"""Прогноз в Redis: ключ на каждый день и хеш на место.
+
+Для cities мест в кеш пишется прогноз на days дней в обеих раскладках, затем
+чтение диапазона каждого места (без L1) повторяется rounds раз. Считаются
+обращения к Redis на запрос диапазона и память на место: MEMORY USAGE, если
+сервер его поддерживает, иначе только размер имен ключей и значений.
+
+Бенчмарк очищает кеш.
+
+    python -m benchmarks.forecast_hash --cities 100 --days 10
+"""
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import latency_summary, print_report, setup_django
+from tests.helpers import count_round_trips
+
+
+def redis_memory(keys: list[str]) -> dict:
+    from django.core.cache import cache
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    client = get_redis_connection('default')
+    redis_keys = [cache.client.make_key(key) for key in keys]
+    try:
+        return {'memory_usage_bytes': sum(client.memory_usage(key) or 0 for key in redis_keys)}
+    except RedisError:
+        # MEMORY USAGE поддерживают не все серверы (например, fakeredis).
+        payload = 0
+        for key in redis_keys:
+            if client.type(key) == b'hash':
+                payload += len(key) + sum(len(field) + len(value) for field, value in client.hgetall(key).items())
+            else:
+                payload += len(key) + len(client.get(key) or b'')
+        return {'payload_bytes': payload}
+
+
+def run(cities: int, days: int, rounds: int, seed: int) -> dict:
+    from django.core.cache import cache
+
+    from weather.services.caching import read_entry, read_fields, write_entry, write_fields
+    from weather.services.open_weather_map import WeatherService
+    from weather.services.tiered_cache import get_tiered_cache
+
+    rng = random.Random(seed)
+    today = date.today()
+    dates = [today + timedelta(days=offset) for offset in range(days)]
+    locations = [
+        {'lat': round(rng.uniform(-60, 60), 4), 'lon': round(rng.uniform(-180, 180), 4)} for _ in range(cities)
+    ]
+
+    cache.clear()
+    get_tiered_cache().local.clear()
+
+    def day_key(coords: dict, day: date) -> str:
+        # Раскладка до хешей: forecast_{место}_{dd.mm.yyyy}.
+        return f'{WeatherService.forecast_cache_key(coords)}_{WeatherService.forecast_field(day)}'
+
+    def forecast() -> dict:
+        return {'min': round(rng.uniform(-30, 20), 2), 'max': round(rng.uniform(20, 40), 2)}
+
+    for coords in locations:
+        days_data = {day: forecast() for day in dates}
+        for day, data in days_data.items():
+            write_entry(day_key(coords, day), data)
+        write_fields(
+            WeatherService.forecast_cache_key(coords),
+            {WeatherService.forecast_field(day): data for day, data in days_data.items()},
+        )
+
+    def read_keys(coords: dict) -> None:
+        for day in dates:
+            read_entry(day_key(coords, day), local=False)
+
+    def read_hash(coords: dict) -> None:
+        key = WeatherService.forecast_cache_key(coords)
+        read_fields({key: [WeatherService.forecast_field(day) for day in dates]}, local=False)
+
+    report = {'cities': cities, 'days': days, 'rounds': rounds}
+    layouts = {
+        'key_per_day': (read_keys, [day_key(coords, day) for coords in locations for day in dates]),
+        'hash_per_location': (read_hash, [WeatherService.forecast_cache_key(coords) for coords in locations]),
+    }
+    for name, (read, keys) in layouts.items():
+        latencies = []
+        with count_round_trips() as counter:
+            for _ in range(rounds):
+                for coords in locations:
+                    started = time.perf_counter()
+                    read(coords)
+                    latencies.append(time.perf_counter() - started)
+        memory = redis_memory(keys)
+        report[name] = {
+            'round_trips_per_range': round(counter['round_trips'] / len(latencies), 2),
+            'redis_keys_per_city': len(keys) // cities,
+            **{f'{metric}_per_city': round(value / cities, 1) for metric, value in memory.items()},
+            **latency_summary(latencies),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=100)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    print_report(run(args.cities, args.days, args.rounds, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Привязка мест к сетке WEATHER_GRID: экономия обращений к One Call и отклонение температуры.
+
+Журнал запросов проигрывается через WeatherService дважды: без сетки (погода
+кешируется по координатам каждого места) и с сеткой cell_degrees. Считаются
+обращения к One Call в обоих прогонах и расхождение ответов: для каждого
+запроса — модуль разницы текущей температуры или min/max прогноза.
+
+Журнал — JSON {"places": {город: [lat, lon]}, "requests": [{"kind": "current"
+или "forecast", "city": ..., "days_ahead": ...}]}, например выгруженный из
+журнала запросов и GeoLocation. Без --workload строится синтетический: metros
+центров с suburbs пригородами в радиусе radius_km, города выбираются по закону
+Ципфа. Координаты журнала отдает fake OpenWeatherMap; с --base-url запросы
+идут на указанный сервер (настоящий API расходует квоту).
+
+Бенчмарк очищает кеш и пишет алиасы в настроенную БД.
+
+    python -m benchmarks.grid_snapping --metros 20 --suburbs 10 --requests 3000
+    python -m benchmarks.grid_snapping --workload workload.json --cell-degrees 0.05
+"""
+
+import argparse
+import json
+import math
+import random
+from contextlib import nullcontext
+from datetime import date, timedelta
+from pathlib import Path
+
+from benchmarks.common import percentile, print_report, setup_django
+from benchmarks.load_test import zipf_weights
+from tests.fake_owm import DAILY_DAYS, GEO_PATH, FakeOpenWeatherMap
+
+# Километров в градусе широты.
+KM_PER_DEGREE = 111.2
+
+
+def build_workload(
+    metros: int, suburbs: int, radius_km: float, requests: int, forecast_share: float, seed: int
+) -> dict:
+    rng = random.Random(seed)
+    places = {}
+    for metro in range(metros):
+        lat, lon = rng.uniform(-55, 65), rng.uniform(-180, 180)
+        places[f'Metro {metro}'] = [round(lat, 4), round(lon, 4)]
+        for suburb in range(suburbs):
+            distance, bearing = radius_km * math.sqrt(rng.random()), rng.uniform(0, 2 * math.pi)
+            dlat = distance * math.cos(bearing) / KM_PER_DEGREE
+            dlon = distance * math.sin(bearing) / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+            places[f'Metro {metro} suburb {suburb}'] = [round(lat + dlat, 4), round(lon + dlon, 4)]
+
+    cities = list(places)
+    weights = zipf_weights(len(cities), 1.0)
+    log = []
+    for _ in range(requests):
+        city = rng.choices(cities, cum_weights=weights)[0]
+        if rng.random() < forecast_share:
+            log.append({'kind': 'forecast', 'city': city, 'days_ahead': rng.randrange(DAILY_DAYS)})
+        else:
+            log.append({'kind': 'current', 'city': city})
+    return {'places': places, 'requests': log}
+
+
+def replay(workload: dict, grid: dict) -> tuple[list[list[float] | None], int]:
+    """Температуры по запросам журнала и число обращений к One Call."""
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    from weather.services import metrics
+    from weather.services.metrics import Metrics
+    from weather.services.open_weather_map import WeatherService
+    from weather.services.rate_limit import ONECALL
+    from weather.services.tiered_cache import get_tiered_cache
+
+    cache.clear()
+    get_tiered_cache().local.clear()
+    metrics._metrics = Metrics()
+    today = date.today()
+
+    temperatures = []
+    # Обращения считаются по метрикам upstream: так же и для fake, и для настоящего API.
+    with override_settings(WEATHER_GRID=grid, WEATHER_METRICS={**settings.WEATHER_METRICS, 'ENABLED': True}):
+        service = WeatherService()
+        for request in workload['requests']:
+            if request['kind'] == 'forecast':
+                result = service.get_forecast(request['city'], today + timedelta(days=request['days_ahead']))
+                values = [result.data['min'], result.data['max']] if result.is_ok else None
+            else:
+                result = service.get_current_weather(request['city'])
+                values = [result.data['temperature']] if result.is_ok else None
+            temperatures.append(values)
+
+    calls = sum(
+        count
+        for (name, labels), count in metrics._metrics.counters.items()
+        if name == metrics.UPSTREAM_RESPONSES and ('endpoint', ONECALL) in labels
+    )
+    return temperatures, calls
+
+
+def deviation(exact: list, snapped: list) -> dict:
+    deltas = [
+        abs(value - snapped_value)
+        for values, snapped_values in zip(exact, snapped)
+        if values is not None and snapped_values is not None
+        for value, snapped_value in zip(values, snapped_values)
+    ]
+    return {
+        'compared_values': len(deltas),
+        'max_abs_deviation': round(max(deltas, default=0.0), 3),
+        'p95_abs_deviation': round(percentile(deltas, 95), 3),
+        'mean_abs_deviation': round(sum(deltas) / len(deltas), 3) if deltas else 0.0,
+    }
+
+
+def run(workload: dict, cell_degrees: float, base_url: str | None) -> dict:
+    from django.core.management import call_command
+    from django.test import override_settings
+
+    from weather.services.locations import grid_cell
+    from weather.services.open_weather_map import OpenWeatherBase
+
+    call_command('migrate', verbosity=0)
+    grid = {'ENABLED': True, 'CELL_DEGREES': cell_degrees}
+    places = {city: tuple(coords) for city, coords in workload['places'].items()}
+
+    server = nullcontext() if base_url else FakeOpenWeatherMap(places=places)
+    with server:
+        OpenWeatherBase.BASE_URL = base_url or server.url
+        exact, exact_calls = replay(workload, {**grid, 'ENABLED': False})
+        snapped, snapped_calls = replay(workload, grid)
+
+    with override_settings(WEATHER_GRID=grid):
+        cells = {grid_cell({'lat': lat, 'lon': lon}) for lat, lon in places.values()}
+    report = {
+        'requests': len(workload['requests']),
+        'places': len(places),
+        'cells': len(cells),
+        'cell_degrees': cell_degrees,
+        'onecall_calls': {'exact': exact_calls, 'grid': snapped_calls},
+        'onecall_reduction': round(1 - snapped_calls / exact_calls, 4) if exact_calls else 0.0,
+        'temperature': deviation(exact, snapped),
+    }
+    if not base_url:
+        report['geocoding_calls'] = server.calls[GEO_PATH]
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workload', type=Path, default=None, help='журнал запросов в JSON')
+    parser.add_argument('--save-workload', type=Path, default=None, help='сохранить синтетический журнал')
+    parser.add_argument('--metros', type=int, default=20)
+    parser.add_argument('--suburbs', type=int, default=10, help='пригородов на центр')
+    parser.add_argument('--radius-km', type=float, default=15, help='радиус пригородов, км')
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--forecast-share', type=float, default=0.3, help='доля запросов прогноза')
+    parser.add_argument('--cell-degrees', type=float, default=0.1, help='размер ячейки сетки, градусы')
+    parser.add_argument('--base-url', default=None, help='сервер OpenWeatherMap вместо fake')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.workload:
+        workload = json.loads(args.workload.read_text())
+    else:
+        workload = build_workload(
+            args.metros, args.suburbs, args.radius_km, args.requests, args.forecast_share, args.seed
+        )
+    if args.save_workload:
+        args.save_workload.write_text(json.dumps(workload, ensure_ascii=False))
+
+    setup_django()
+    print_report(run(workload, args.cell_degrees, args.base_url))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Нагрузочный тест /api/weather/current/ и /api/weather/forecast/ на fake OpenWeatherMap.
+
+Запросы поступают с заданной частотой rps в течение duration секунд (открытая
+модель: пуассоновский поток, следующий запрос не ждет ответа на предыдущий) и
+выполняются тестовым клиентом Django в concurrency потоках. Города выбираются
+по закону Ципфа с показателем zipf_s: город ранга k запрашивается с весом 1/k^s.
+Задержка считается от запланированного момента запроса, поэтому ожидание
+свободного потока в нее входит.
+
+Fake-сервер запускается в отдельном процессе с задержкой latency, случайной
+добавкой до jitter и долей ошибок error_rate. В отчете: пропускная способность,
+p50/p95/p99, статусы ответов, обращения к upstream на запрос и доля попаданий
+в кеш (L1 и Redis). Отчет сохраняется в JSON; --compare печатает изменения
+относительно прошлого отчета.
+
+Бенчмарк очищает кеш и пишет алиасы в настроенную БД.
+
+    python -m benchmarks.load_test --rps 200 --duration 30 --cities 500 --latency 0.1 --jitter 0.05
+    python -m benchmarks.load_test --compare benchmarks/results/load_test-20260101-120000.json
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from urllib.request import urlopen
+
+from benchmarks.common import latency_summary, print_report, setup_django
+from tests.fake_owm import RESET_PATH, STATS_PATH, fake_owm_process
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+# Метрики, которые --compare сравнивает с прошлым отчетом.
+COMPARED_METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate', 'upstream_calls_per_request')
+# Прогноз запрашивается на сегодня и дни вперед в пределах validate_forecast_date.
+FORECAST_DAYS = 8
+
+
+def zipf_weights(count: int, exponent: float) -> list[float]:
+    """Накопленные веса городов по закону Ципфа для random.choices."""
+    total, weights = 0.0, []
+    for rank in range(1, count + 1):
+        total += 1 / rank**exponent
+        weights.append(total)
+    return weights
+
+
+def schedule(args: argparse.Namespace) -> list[tuple[float, str, dict]]:
+    """Момент отправки, маршрут и параметры каждого запроса."""
+    rng = random.Random(args.seed)
+    cities = [f'City {rank}' for rank in range(1, args.cities + 1)]
+    weights = zipf_weights(args.cities, args.zipf_s)
+    today = date.today()
+
+    requests, at = [], 0.0
+    while True:
+        at += rng.expovariate(args.rps)
+        if at >= args.duration:
+            return requests
+        city = rng.choices(cities, cum_weights=weights)[0]
+        if rng.random() < args.forecast_share:
+            day = today + timedelta(days=rng.randrange(FORECAST_DAYS))
+            requests.append((at, 'forecast', {'city': city, 'date': day.strftime('%d.%m.%Y')}))
+        else:
+            requests.append((at, 'current', {'city': city}))
+
+
+def upstream_stats(url: str, path: str = STATS_PATH) -> dict:
+    with urlopen(f'{url}{path}') as response:
+        return json.load(response)
+
+
+def cache_counters() -> Counter:
+    from weather.services.tiered_cache import get_tiered_cache
+
+    stats = get_tiered_cache().stats()
+    return Counter(
+        {
+            'hits': stats['l1'].get('hits', 0) + stats['l2'].get('hits', 0),
+            'misses': stats['l2'].get('misses', 0),
+        }
+    )
+
+
+def ratio(part: float, total: float, digits: int = 4) -> float:
+    return round(part / total, digits) if total else 0.0
+
+
+def summarize(results: list[tuple[int, float]], elapsed: float) -> dict:
+    statuses = Counter(status for status, _ in results)
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        'requests': len(results),
+        'rps': round(len(results) / elapsed, 1),
+        **latency_summary([latency for _, latency in results]),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'error_rate': ratio(errors, len(results)),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.test import Client
+    from django.urls import reverse
+
+    from weather.services.open_weather_map import OpenWeatherBase
+    from weather.services.tiered_cache import get_tiered_cache
+
+    call_command('migrate', verbosity=0)
+    cache.clear()
+    get_tiered_cache().local.clear()
+
+    urls = {'current': reverse('current-weather'), 'forecast': reverse('forecast-weather')}
+    planned = schedule(args)
+    results = defaultdict(list)
+    clients = threading.local()
+
+    def request(at: float, route: str, params: dict) -> None:
+        client = getattr(clients, 'client', None)
+        if client is None:
+            client = clients.client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+        status = client.get(urls[route], params).status_code
+        # Список общий для потоков: append атомарен под GIL.
+        results[route].append((status, time.perf_counter() - started - at))
+
+    with fake_owm_process(args.latency, args.jitter, args.error_rate, args.seed) as url:
+        OpenWeatherBase.BASE_URL = url
+        upstream_stats(url, RESET_PATH)
+        cache_before = cache_counters()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for at, route, params in planned:
+                delay = started + at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(request, at, route, params)
+        elapsed = time.perf_counter() - started
+
+        upstream = upstream_stats(url)
+        cache_after = cache_counters()
+
+    total = [result for route_results in results.values() for result in route_results]
+    upstream_calls = sum(upstream['calls'].values())
+    hits, misses = (cache_after[name] - cache_before[name] for name in ('hits', 'misses'))
+    return {
+        'total': {
+            **summarize(total, elapsed),
+            'upstream_calls_per_request': ratio(upstream_calls, len(total)),
+        },
+        **{route: summarize(route_results, elapsed) for route, route_results in sorted(results.items())},
+        'upstream': {
+            'calls': upstream_calls,
+            'calls_per_request': {path: ratio(calls, len(total)) for path, calls in sorted(upstream['calls'].items())},
+            'errors': upstream['errors'],
+        },
+        'cache': {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': ratio(hits, hits + misses),
+        },
+        'elapsed_s': round(elapsed, 3),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, previous: dict) -> dict:
+    """Изменения метрик относительно прошлого отчета: маршрут -> метрика -> [было, стало]."""
+    changes = {}
+    for section in ('total', 'current', 'forecast'):
+        if section in report and section in previous:
+            changes[section] = {
+                metric: [previous[section][metric], report[section][metric]]
+                for metric in COMPARED_METRICS
+                if metric in report[section] and metric in previous[section]
+            }
+    changes['cache_hit_ratio'] = [previous['cache']['hit_ratio'], report['cache']['hit_ratio']]
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rps', type=float, default=100, help='запросов в секунду')
+    parser.add_argument('--duration', type=float, default=30, help='длительность, с')
+    parser.add_argument('--concurrency', type=int, default=32, help='потоков, выполняющих запросы')
+    parser.add_argument('--cities', type=int, default=500, help='число разных городов')
+    parser.add_argument('--zipf-s', type=float, default=1.1, help='показатель распределения Ципфа')
+    parser.add_argument('--forecast-share', type=float, default=0.3, help='доля запросов прогноза')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка upstream, с')
+    parser.add_argument('--jitter', type=float, default=0.05, help='случайная добавка к задержке upstream, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов upstream с ошибкой 503')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, default=None, help='файл отчета (по умолчанию в benchmarks/results)')
+    parser.add_argument('--compare', type=Path, default=None, help='прошлый отчет для сравнения')
+    args = parser.parse_args()
+
+    setup_django()
+    config = {name: value for name, value in vars(args).items() if name not in ('output', 'compare')}
+    started_at = datetime.now()
+    results = run(args)
+    report = {
+        'benchmark': 'load_test',
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'config': config,
+        'results': results,
+    }
+
+    output = args.output or RESULTS_DIR / f'load_test-{started_at:%Y%m%d-%H%M%S}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    print_report(report)
+    if args.compare:
+        print_report(
+            {'compared_with': str(args.compare), **compare(results, json.loads(args.compare.read_text())['results'])}
+        )
+    print(f'Report saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
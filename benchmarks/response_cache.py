@@ -0,0 +1,91 @@
+"""Пропускная способность /api/weather/current/ и /api/weather/forecast/ при попадании в кеш.
+
+Данные погоды заранее прогреты в кеше сервисов, поэтому сравнивается только
+работа фреймворка: полный путь через DRF и сервисы (без кеша ответов),
+отдача сохраненных байтов ResponseCacheMiddleware и 304 на условный GET.
+Запросы выполняются тестовым клиентом Django в одном потоке, без сети.
+
+Бенчмарк очищает кеш и пишет алиасы в настроенную БД.
+
+    python -m benchmarks.response_cache --requests 5000
+"""
+
+import argparse
+import time
+from datetime import date
+
+from benchmarks.common import latency_summary, print_report, setup_django
+from tests.fake_owm import FakeOpenWeatherMap
+
+MIDDLEWARE_PATH = 'weather.middleware.ResponseCacheMiddleware'
+
+
+def measure(client, url: str, params: dict, requests: int, **headers) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = client.get(url, params, **headers)
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'status': response.status_code,
+        'rps': round(requests / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+def run(requests: int) -> dict:
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    from weather.services.open_weather_map import OpenWeatherBase
+    from weather.services.tiered_cache import get_tiered_cache
+
+    call_command('migrate', verbosity=0)
+    cache.clear()
+    get_tiered_cache().local.clear()
+
+    routes = {
+        'current': (reverse('current-weather'), {'city': 'Moscow'}),
+        'forecast': (reverse('forecast-weather'), {'city': 'Moscow', 'date': date.today().strftime('%d.%m.%Y')}),
+    }
+    without_response_cache = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE_PATH]
+
+    report = {}
+    with FakeOpenWeatherMap() as server:
+        OpenWeatherBase.BASE_URL = server.url
+
+        for name, (url, params) in routes.items():
+            with override_settings(MIDDLEWARE=without_response_cache):
+                client = Client(SERVER_NAME='localhost')
+                client.get(url, params)
+                baseline = measure(client, url, params, requests)
+
+            client = Client(SERVER_NAME='localhost')
+            etag = client.get(url, params)['ETag']
+            report[name] = {
+                'without_response_cache': baseline,
+                'response_cache': measure(client, url, params, requests),
+                'not_modified': measure(client, url, params, requests, HTTP_IF_NONE_MATCH=etag),
+            }
+        report['upstream_calls'] = server.total_calls
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    print_report({'requests': args.requests, **run(args.requests)})
+
+
+if __name__ == '__main__':
+    main()
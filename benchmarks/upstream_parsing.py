@@ -0,0 +1,165 @@
+"""CPU на разбор ответа upstream: старый и новый путь.
+
+Старый путь: тело целиком в f-строку лога (response.text), затем повторный
+разбор response.json(). Новый: один разбор response.content через orjson и
+сводка status/bytes/latency в логе. Ответы — записанные по формату One Call 3.0
+полные payload'ы (current, minutely, hourly, daily, alerts) и ответы
+day_summary, логирование включено на уровне INFO.
+
+    python -m benchmarks.upstream_parsing --iterations 2000
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import requests
+
+from benchmarks.common import print_report, setup_django
+from tests.fake_owm import temperature_at
+
+logger = logging.getLogger('benchmarks.upstream_parsing')
+
+
+def onecall_payload(lat: float = 55.75, lon: float = 37.62) -> dict:
+    """Полный ответ One Call: как у реального API без exclude."""
+    now = 1717766400
+    weather = [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}]
+
+    def point(dt: int, offset: float) -> dict:
+        return {
+            'dt': dt,
+            'temp': temperature_at(lat, lon, offset),
+            'feels_like': temperature_at(lat, lon, offset - 1),
+            'pressure': 1015,
+            'humidity': 60,
+            'dew_point': 8.5,
+            'uvi': 3.2,
+            'clouds': 10,
+            'visibility': 10000,
+            'wind_speed': 3.6,
+            'wind_deg': 250,
+            'wind_gust': 5.1,
+            'weather': weather,
+        }
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'timezone': 'Europe/Moscow',
+        'timezone_offset': 10800,
+        'current': {**point(now, 0), 'sunrise': now - 20000, 'sunset': now + 30000},
+        'minutely': [{'dt': now + minute * 60, 'precipitation': 0} for minute in range(61)],
+        'hourly': [{**point(now + hour * 3600, hour / 10), 'pop': 0.1} for hour in range(48)],
+        'daily': [
+            {
+                'dt': now + day * 86400,
+                'sunrise': now - 20000,
+                'sunset': now + 30000,
+                'summary': 'Expect a day of partly cloudy with clear spells',
+                'temp': {
+                    'day': temperature_at(lat, lon, day),
+                    'min': temperature_at(lat, lon, day - 5),
+                    'max': temperature_at(lat, lon, day + 5),
+                    'night': temperature_at(lat, lon, day - 3),
+                    'eve': temperature_at(lat, lon, day + 1),
+                    'morn': temperature_at(lat, lon, day - 2),
+                },
+                'pressure': 1015,
+                'humidity': 60,
+                'wind_speed': 3.6,
+                'weather': weather,
+                'pop': 0.2,
+            }
+            for day in range(8)
+        ],
+        'alerts': [{'sender_name': 'Roshydromet', 'event': 'Wind', 'start': now, 'end': now + 3600, 'tags': []}],
+    }
+
+
+def day_summary_payload(lat: float = 55.75, lon: float = 37.62) -> dict:
+    return {
+        'lat': lat,
+        'lon': lon,
+        'tz': '+03:00',
+        'date': '2024-06-07',
+        'units': 'metric',
+        'cloud_cover': {'afternoon': 0},
+        'humidity': {'afternoon': 33},
+        'precipitation': {'total': 0},
+        'temperature': {
+            'min': temperature_at(lat, lon, -5),
+            'max': temperature_at(lat, lon, 5),
+            'afternoon': 18,
+            'night': 9,
+            'evening': 16,
+            'morning': 11,
+        },
+        'pressure': {'afternoon': 1015},
+        'wind': {'max': {'speed': 8.7, 'direction': 120}},
+    }
+
+
+def recorded_response(payload: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response._content = json.dumps(payload).encode()
+    return response
+
+
+def old_path(response: requests.Response) -> dict:
+    logger.info(f'OpenWeatherMap response - {response.status_code}, {response.text}')
+    return response.json()
+
+
+def new_path(response: requests.Response) -> dict:
+    from weather.services.payload import loads, log_body
+
+    started = time.monotonic()
+    body = response.content
+    logger.info(
+        f'OpenWeatherMap response - endpoint=onecall status={response.status_code} bytes={len(body)} '
+        f'latency_ms={round((time.monotonic() - started) * 1000, 1)}',
+    )
+    log_body('get', 'url', body, 0)
+    return loads(body)
+
+
+def measure(path, response: requests.Response, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        path(response)
+    return (time.perf_counter() - started) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    # Лог пишется, но никуда не выводится: в замер попадает форматирование сообщения.
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    report = {'iterations': args.iterations}
+    for name, data in (('onecall', onecall_payload()), ('day_summary', day_summary_payload())):
+        response = recorded_response(data)
+        assert old_path(response) == new_path(response)
+        old, new = measure(old_path, response, args.iterations), measure(new_path, response, args.iterations)
+        report[name] = {
+            'body_bytes': len(response.content),
+            'old_us_per_call': round(old * 1e6, 2),
+            'new_us_per_call': round(new * 1e6, 2),
+            'saved_us_per_call': round((old - new) * 1e6, 2),
+            'speedup': round(old / new, 2),
+        }
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -37,13 +37,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'weather.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'weather.middleware.ResponseCacheMiddleware',
+    'weather.middleware.UpstreamDeadlineMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'weather.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -130,7 +134,160 @@ CACHES = {
         'LOCATION': f'redis://{os.getenv("REDIS_HOST", "127.0.0.1")}:{os.getenv("REDIS_PORT", "6379")}',
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # Компактное кодирование значений кеша погоды; записи в pickle читаются по-прежнему.
+            'SERIALIZER': 'weather.services.cache_codec.CompactSerializer',
         },
         'TIMEOUT': 60 * 10,
     }
 }
+
+# HTTP-клиент OpenWeatherMap: пул keep-alive соединений, таймауты (connect, read) и повторы для GET.
+# ASYNC_MAX_CONNECTIONS — предел одновременных запросов асинхронного клиента (keep-alive — POOL_MAXSIZE).
+# DEADLINE — общий срок в секундах на все обращения к API за один запрос (геокодирование и погода).
+# LATENCY_WINDOW — окно скользящих гистограмм задержек ответов по эндпоинтам, в секундах.
+# LOG_BODY_SAMPLE_RATE — доля ответов, тело которых пишется в DEBUG-лог (по умолчанию только сводка).
+OPENWEATHERMAP_HTTP = {
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': int(os.getenv('OPENWEATHERMAP_POOL_MAXSIZE', '32')),
+    'POOL_BLOCK': True,
+    'ASYNC_MAX_CONNECTIONS': 256,
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 15,
+    'RETRIES': 2,
+    'BACKOFF_FACTOR': 0.3,
+    'DEADLINE': 8,
+    'LATENCY_WINDOW': 60,
+    'LOG_BODY_SAMPLE_RATE': float(os.getenv('OPENWEATHERMAP_LOG_BODY_SAMPLE_RATE', '0')),
+}
+
+# Дублирующие запросы (hedging): если GET не получил ответа за PERCENTILE-й процентиль задержки эндпоинта,
+# отправляется копия и берется первый ответ. Порог считается не раньше MIN_SAMPLES замеров. Копий не больше
+# BUDGET_RATIO от запросов (накопленный запас — до MAX_CREDITS), лимитер обращений они проходят без ожидания.
+OPENWEATHERMAP_HEDGING = {
+    'ENABLED': os.getenv('OPENWEATHERMAP_HEDGING_ENABLED', 'false').lower() == 'true',
+    'PERCENTILE': 95,
+    'MIN_SAMPLES': 50,
+    'BUDGET_RATIO': 0.05,
+    'MAX_CREDITS': 10,
+}
+
+# Автоматы отключения OpenWeatherMap по эндпоинтам (в каждом процессе свои).
+# FAILURE_THRESHOLD неудачных вызовов подряд (ошибка, 429/5xx или ответ дольше SLOW_CALL_DURATION секунд)
+# открывают автомат: вызовы OPEN_SECONDS секунд сразу завершаются ошибкой, клиенту отдается устаревшее
+# значение из кеша, если оно есть. Затем HALF_OPEN_PROBES пробных вызовов решают, закрыть ли автомат.
+OPENWEATHERMAP_CIRCUIT_BREAKER = {
+    'ENABLED': True,
+    'ENDPOINTS': {
+        'geo': {'FAILURE_THRESHOLD': 5, 'SLOW_CALL_DURATION': 3, 'OPEN_SECONDS': 30, 'HALF_OPEN_PROBES': 1},
+        'onecall': {'FAILURE_THRESHOLD': 5, 'SLOW_CALL_DURATION': 5, 'OPEN_SECONDS': 30, 'HALF_OPEN_PROBES': 1},
+    },
+}
+
+# Ограничение обращений к OpenWeatherMap, общее для всех воркеров (token bucket в Redis).
+# BUDGETS: запросов в минуту и допустимый всплеск отдельно для geo и One Call.
+# При исчерпании бюджета устаревшее значение отдается из кеша, промах ждет токен не дольше
+# QUEUE_TIMEOUT секунд (0 — отказ сразу), фоновые обновления не ждут.
+OPENWEATHERMAP_RATE_LIMIT = {
+    'ENABLED': os.getenv('OPENWEATHERMAP_RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    'BUDGETS': {
+        'geo': {'PER_MINUTE': int(os.getenv('OPENWEATHERMAP_GEO_PER_MINUTE', '600')), 'BURST': 100},
+        'onecall': {'PER_MINUTE': int(os.getenv('OPENWEATHERMAP_ONECALL_PER_MINUTE', '600')), 'BURST': 100},
+    },
+    'QUEUE_TIMEOUT': 2,
+}
+
+# Кеш данных погоды.
+# POLICIES: время жизни по семействам ключей. FRESH_TTL — значение актуально, ещё STALE_TTL — значение
+# отдаётся клиенту сразу, а ключ обновляется в фоне. Ключи без политики живут CACHES['default']['TIMEOUT'].
+# LOCAL: LRU-кеш процесса перед Redis, согласованный через pub/sub канал INVALIDATION_CHANNEL.
+# ASYNC_REDIS_MAX_CONNECTIONS: размер пула redis.asyncio асинхронных обработчиков.
+# LOCK_*: блокировка пересборки ключа между воркерами (single-flight).
+WEATHER_CACHE = {
+    'POLICIES': {
+        'geo_coords_': {'FRESH_TTL': 60 * 60 * 24 * 30, 'STALE_TTL': 60 * 60 * 24 * 30},
+        'current_weather_': {'FRESH_TTL': 60 * 10, 'STALE_TTL': 60 * 50},
+        'forecast_': {'FRESH_TTL': 60 * 60 * 3, 'STALE_TTL': 60 * 60 * 9},
+        # Переопределения прогноза сбрасываются при записи, TTL лишь ограничивает устаревание.
+        'overrides_': {'FRESH_TTL': 60 * 60, 'STALE_TTL': 0},
+    },
+    'LOCAL': {'MAX_SIZE': 2048, 'TTL': 30, 'INVALIDATION_CHANNEL': 'weather_cache_invalidate'},
+    'REFRESH_WORKERS': 4,
+    'ASYNC_REDIS_MAX_CONNECTIONS': 64,
+    'LOCK_TIMEOUT': 60,
+    'LOCK_WAIT_TIMEOUT': 20,
+    'LOCK_POLL_INTERVAL': 0.05,
+}
+
+# Снимки полученных от API данных в таблице WeatherSnapshot — запасной уровень кеша, переживающий
+# сброс Redis. Текущая погода и прогноз по дням пишутся фоновым потоком пачками по BATCH_SIZE; при
+# переполнении очереди (MAX_QUEUE) снимки отбрасываются. При промахе Redis снимок, не старше срока
+# хранения ключа по WEATHER_CACHE['POLICIES'], возвращается в кеш со своим временем получения и
+# обновляется в фоне, если уже неактуален. Раз в MAINTENANCE_INTERVAL секунд один из процессов удаляет
+# снимки старше RETENTION_DAYS дней (в MySQL — секции) и добавляет секции на PARTITIONS_AHEAD дней вперед.
+# Кеш после сброса Redis заполняется командой restore_weather_cache.
+WEATHER_SNAPSHOTS = {
+    'ENABLED': os.getenv('WEATHER_SNAPSHOTS_ENABLED', 'false').lower() == 'true',
+    'BATCH_SIZE': 500,
+    'MAX_QUEUE': 10000,
+    'RETENTION_DAYS': int(os.getenv('WEATHER_SNAPSHOTS_RETENTION_DAYS', '7')),
+    'PARTITIONS_AHEAD': 3,
+    'MAINTENANCE_INTERVAL': 60 * 60,
+}
+
+# Сетка мест для кеша погоды: координаты города привязываются к ячейке CELL_DEGREES x CELL_DEGREES градусов,
+# текущая погода и прогноз кешируются по ячейке и запрашиваются у API для ее центра. Пригороды и разные
+# названия в пределах ячейки делят одно обращение к One Call. 0.1° — около 11 км по широте.
+# Переопределения прогноза по-прежнему привязаны к месту. Оценка: python -m benchmarks.grid_snapping.
+WEATHER_GRID = {
+    'ENABLED': os.getenv('WEATHER_GRID_ENABLED', 'false').lower() == 'true',
+    'CELL_DEGREES': float(os.getenv('WEATHER_GRID_CELL_DEGREES', '0.1')),
+}
+
+# Кеш готовых ответов API (ResponseCacheMiddleware). ROUTES: путь -> имя семейства ключей и время жизни
+# ответа в секундах. Синхронный и асинхронный обработчики одного ответа делят семейство.
+WEATHER_RESPONSE_CACHE = {
+    'ROUTES': {
+        '/api/weather/current/': {'NAME': 'current', 'TTL': 60},
+        '/api/weather/async/current/': {'NAME': 'current', 'TTL': 60},
+        '/api/weather/forecast/': {'NAME': 'forecast', 'TTL': 60 * 5},
+        '/api/weather/async/forecast/': {'NAME': 'forecast', 'TTL': 60 * 5},
+    },
+}
+
+# Заблаговременное обновление кеша популярных городов (manage.py run_refresh_scheduler).
+# WINDOW: окно учета частоты запросов в секундах, популярность считается по двум последним окнам.
+# TOP_N: число обновляемых городов; CALLS_PER_MINUTE: бюджет обращений к upstream;
+# REFRESH_AHEAD: за сколько секунд до конца актуальности обновлять ключ; INTERVAL: период прохода.
+# RECORD_FLUSH_INTERVAL: как часто процесс отправляет накопленный учет запросов в Redis, секунды.
+WEATHER_REFRESH = {
+    'WINDOW': 300,
+    'TOP_N': 50,
+    'CALLS_PER_MINUTE': 60,
+    'REFRESH_AHEAD': 120,
+    'INTERVAL': 15,
+    'RECORD_FLUSH_INTERVAL': 1,
+}
+
+# Метрики процесса в формате Prometheus (/metrics): длительность стадий запросов, попадания в кеш по
+# семействам ключей, статусы ответов OpenWeatherMap, запросы в обработке. В каждом процессе свои значения.
+# SERVER_TIMING — добавлять к ответам заголовок Server-Timing с длительностью стадий.
+WEATHER_METRICS = {
+    'ENABLED': os.getenv('WEATHER_METRICS_ENABLED', 'true').lower() == 'true',
+    'SERVER_TIMING': os.getenv('WEATHER_SERVER_TIMING', 'true').lower() == 'true',
+}
+
+# Профилирование запросов cProfile (ProfilingMiddleware). Выключенное ничего не стоит: middleware нет в цепочке.
+# Профилируется доля SAMPLE_RATE запросов к PATHS и любой запрос с заголовком X-Weather-Profile: TOKEN.
+# Последние BUFFER_SIZE профилей хранятся в Redis TTL секунд; список и скачивание — /api/weather/profiles/
+# с тем же заголовком или для сотрудника.
+WEATHER_PROFILING = {
+    'ENABLED': os.getenv('WEATHER_PROFILING_ENABLED', 'false').lower() == 'true',
+    'SAMPLE_RATE': float(os.getenv('WEATHER_PROFILING_SAMPLE_RATE', '0')),
+    'TOKEN': os.getenv('WEATHER_PROFILING_TOKEN', ''),
+    'PATHS': ('/api/weather/current/', '/api/weather/forecast/'),
+    'BUFFER_SIZE': 20,
+    'TTL': 60 * 60 * 24,
+}
+
+# Число городов, запрашиваемых одновременно в /api/weather/current/bulk/.
+WEATHER_BULK_CONCURRENCY = 8
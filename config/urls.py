@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from weather.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/weather/', include('weather.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,250 @@
+"""Локальная замена OpenWeatherMap API для тестов и бенчмарков."""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Self
+from urllib.parse import parse_qs, urlsplit
+
+GEO_PATH = '/geo/1.0/direct'
+ONECALL_PATH = '/data/3.0/onecall'
+DAY_SUMMARY_PATH = '/data/3.0/onecall/day_summary'
+# One Call отдаёт daily на сегодня и 7 дней вперёд.
+DAILY_DAYS = 8
+# Служебные эндпоинты для запуска сервера в отдельном процессе.
+STATS_PATH = '/_stats'
+RESET_PATH = '/_reset'
+
+
+# Локальные названия, которые геокодер сводит к тем же координатам.
+CITY_ALIASES = {
+    'москва': 'moscow',
+    'санкт-петербург': 'saint petersburg',
+    'лондон': 'london',
+    'париж': 'paris',
+    'берлин': 'berlin',
+    'рим': 'rome',
+}
+
+
+def city_coordinates(city: str) -> tuple[float, float]:
+    """Детерминированные координаты для названия города."""
+    name = ' '.join(city.split()).lower()
+    checksum = zlib.crc32(CITY_ALIASES.get(name, name).encode())
+    return round((checksum % 18000) / 100 - 90, 4), round((checksum // 18000 % 36000) / 100 - 180, 4)
+
+
+def temperature_at(lat: float, lon: float, offset: float = 0.0) -> float:
+    """Детерминированная температура для точки."""
+    return round(30 - abs(lat) / 2 + (lon % 7) + offset, 2)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь по умолчанию (5) не выдерживает сотни одновременных подключений.
+    request_queue_size = 1024
+
+
+class FakeOpenWeatherMap:
+    """HTTP-сервер с эндпоинтами geo и One Call, считающий обращения.
+
+    К задержке latency добавляется случайная от 0 до jitter секунд; доля error_rate
+    обращений получает error_status вместо данных.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        missing_cities: tuple[str, ...] = (),
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int | None = None,
+        places: dict[str, tuple[float, float]] | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.missing_cities = {city.lower() for city in missing_cities}
+        # Заданные координаты городов вместо city_coordinates, например записанные из GeoLocation.
+        self.places = {city.lower(): coords for city, coords in (places or {}).items()}
+        # Статус ответа API вместо данных, чтобы изобразить сбой upstream.
+        self.failure_status: int | None = None
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._calls_lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self) -> Self:
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset(self) -> None:
+        with self._calls_lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _record(self, path: str) -> tuple[float, int | None]:
+        """Учитывает обращение; возвращает его задержку и статус сбоя (None — ответить данными)."""
+        with self._calls_lock:
+            self.calls[path] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            status = self.failure_status
+            if status is None and self.error_rate and self._random.random() < self.error_rate:
+                status = self.error_status
+            if status is not None:
+                self.errors[path] += 1
+        return delay, status
+
+    def _respond(self, path: str, query: dict) -> tuple[int, object]:
+        if path == STATS_PATH:
+            return 200, {'calls': dict(self.calls), 'errors': dict(self.errors)}
+        if path == RESET_PATH:
+            self.reset()
+            return 200, {}
+
+        if path == GEO_PATH:
+            city = query.get('q', '')
+            if city.lower() in self.missing_cities:
+                return 200, []
+            lat, lon = self.places.get(city.lower()) or city_coordinates(city)
+            return 200, [{'name': city, 'lat': lat, 'lon': lon, 'country': 'XX'}]
+
+        lat, lon = float(query.get('lat', 0)), float(query.get('lon', 0))
+        if path == ONECALL_PATH:
+            exclude = query.get('exclude', '').split(',')
+            payload = {'lat': lat, 'lon': lon, 'timezone_offset': 0}
+            if 'current' not in exclude:
+                payload['current'] = {'dt': int(time.time()), 'temp': temperature_at(lat, lon)}
+            if 'daily' not in exclude:
+                noon = int(time.time()) // 86400 * 86400 + 43200
+                payload['daily'] = [
+                    {
+                        'dt': noon + day * 86400,
+                        'temp': {'min': temperature_at(lat, lon, day - 5), 'max': temperature_at(lat, lon, day + 5)},
+                    }
+                    for day in range(DAILY_DAYS)
+                ]
+            return 200, payload
+        if path == DAY_SUMMARY_PATH:
+            day_offset = int(query.get('date', '0000.00.00').replace('.', '')) % 5
+            return 200, {
+                'lat': lat,
+                'lon': lon,
+                'date': query.get('date'),
+                'temperature': {
+                    'min': temperature_at(lat, lon, day_offset - 5),
+                    'max': temperature_at(lat, lon, day_offset + 5),
+                },
+            }
+        return 404, {'cod': 404, 'message': 'Not found'}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                failure = None
+                if parts.path not in (STATS_PATH, RESET_PATH):
+                    delay, failure = fake._record(parts.path)
+                    if delay:
+                        time.sleep(delay)
+
+                if failure:
+                    status, payload = failure, {'cod': failure, 'message': 'Failure'}
+                else:
+                    status, payload = fake._respond(parts.path, query)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент не дождался ответа: дедлайн запроса или выигравшая копия.
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@contextmanager
+def fake_owm_process(latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int | None = None):
+    """Fake-сервер в отдельном процессе; возвращает его URL."""
+    command = [sys.executable, '-m', 'tests.fake_owm', '--latency', str(latency), '--jitter', str(jitter)]
+    command += ['--error-rate', str(error_rate)]
+    if seed is not None:
+        command += ['--seed', str(seed)]
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        yield process.stdout.readline().strip()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fake OpenWeatherMap API')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке от 0 до jitter, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов со статусом --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeOpenWeatherMap(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    ).start()
+    print(server.url, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
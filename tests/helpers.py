@@ -0,0 +1,30 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from unittest.mock import patch
+
+
+@contextmanager
+def count_round_trips():
+    """Обращения синхронного клиента к Redis из текущего потока: команда вне конвейера
+    и конвейер целиком — по одному. Фоновые потоки (обновление кеша, инвалидация) не считаются.
+    """
+    from redis import Redis
+    from redis.client import Pipeline
+
+    counter = Counter()
+    thread = threading.get_ident()
+    execute_command, execute = Redis.execute_command, Pipeline.execute
+
+    def counted_command(self, *args, **options):
+        if threading.get_ident() == thread:
+            counter['round_trips'] += 1
+        return execute_command(self, *args, **options)
+
+    def counted_execute(self, *args, **options):
+        if threading.get_ident() == thread:
+            counter['round_trips'] += 1
+        return execute(self, *args, **options)
+
+    with patch.object(Redis, 'execute_command', counted_command), patch.object(Pipeline, 'execute', counted_execute):
+        yield counter
@@ -4,10 +4,25 @@ import pytest
 from django.core.cache import cache
 from rest_framework.test import APIClient
 
+from tests.fake_owm import FakeOpenWeatherMap
+from weather.services.hot_cities import get_hot_cities
+from weather.services.open_weather_map import OpenWeatherBase
+from weather.services.tiered_cache import get_tiered_cache
+
 
 @pytest.fixture(autouse=True)
 def clear_cache_before_test():
+    # Учет городов, накопленный в процессе предыдущими тестами, уходит в Redis и стирается вместе с ним.
+    get_hot_cities().flush()
     cache.clear()
+    get_tiered_cache().local.clear()
+
+
+@pytest.fixture
+def fake_owm(monkeypatch, transactional_db):
+    with FakeOpenWeatherMap() as server:
+        monkeypatch.setattr(OpenWeatherBase, 'BASE_URL', server.url)
+        yield server
 
 
 @pytest.fixture
@@ -83,3 +98,12 @@ def forecast_response_body_data_too_far(forecast_body_base, data_too_far):
 @pytest.fixture
 def forecast_response_body_data_in_the_past(forecast_body_base, data_in_the_past):
     return {**forecast_body_base, 'date': data_in_the_past}
+
+
+@pytest.fixture
+def forecast_range_params(today):
+    return {
+        'city': ['BlaBla', 'Other', 'BlaBla'],
+        'date_from': today,
+        'date_to': (date.today() + timedelta(days=9)).strftime('%d.%m.%Y'),
+    }
@@ -1,5 +1,6 @@
 import pytest
 
+from weather.services.http import get_transport
 from weather.services.open_weather_map import ServiceResult
 
 
@@ -13,9 +14,15 @@ def geo_incorrect_response():
     return [{'name': 'Beverly Hills', 'lat': 34.0901}]
 
 
+@pytest.fixture
+def without_rate_limit(monkeypatch):
+    # Token bucket — отдельное обращение к Redis на каждый вызов API, к кешу оно не относится.
+    monkeypatch.setattr(get_transport(), 'limiter', None)
+
+
 @pytest.fixture
 def coords_result():
-    return ServiceResult.ok({'lat': 34.0901, 'lon': -118.4065})
+    return ServiceResult.ok({'lat': 34.0901, 'lon': -118.4065, 'location_id': 1})
 
 
 @pytest.fixture
@@ -0,0 +1,62 @@
+import pickle
+import time
+
+import pytest
+from django.core.cache import cache
+
+from weather.services.cache_codec import COORDINATES, CURRENT_WEATHER, FORECAST, MSGPACK, CompactSerializer
+
+
+@pytest.fixture
+def serializer():
+    return CompactSerializer({})
+
+
+@pytest.mark.parametrize(
+    'data, tag, size',
+    [
+        ({'temperature': 18.5, 'local_time': '07:05'}, CURRENT_WEATHER, 19),
+        ({'min': 12.3, 'max': 22.7}, FORECAST, 25),
+        ({'lat': 34.0901, 'lon': -118.4065, 'location_id': 42}, COORDINATES, 33),
+    ],
+)
+def test_weather_entries_are_packed(serializer, data, tag, size):
+    value = {'data': data, 'fresh_until': time.time()}
+
+    encoded = serializer.dumps(value)
+
+    assert encoded[0] == tag
+    assert len(encoded) == size
+    assert serializer.loads(encoded) == value
+
+
+def test_other_values_keep_their_types(serializer):
+    values = [
+        # Целые температуры не должны стать дробными.
+        {'data': {'min': 12, 'max': 22.7}, 'fresh_until': 1.5},
+        {'data': {'lat': 1.0, 'lon': 2.0}, 'fresh_until': 1.5},
+        {'body': b'{}', 'content_type': 'application/json', 'etag': '"abc"'},
+        {'data': {'1': [10, 20]}, 'fresh_until': 1.5},
+    ]
+
+    for value in values:
+        encoded = serializer.dumps(value)
+        assert encoded[0] == MSGPACK
+        assert serializer.loads(encoded) == value
+
+    # Кортежи msgpack не сохраняет, такие значения уходят в pickle.
+    assert serializer.loads(serializer.dumps((1, 2))) == (1, 2)
+
+
+def test_pickled_entries_are_readable(serializer):
+    value = {'data': {'min': 12.3, 'max': 22.7}, 'fresh_until': 1.5}
+
+    assert serializer.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) == value
+
+
+def test_cache_uses_compact_serializer():
+    value = {'data': {'min': 12.3, 'max': 22.7}, 'fresh_until': 1.5}
+    cache.set('forecast_1_01.01.2025', value)
+
+    assert cache.get('forecast_1_01.01.2025') == value
+    assert len(cache.client.get_client().get(cache.make_key('forecast_1_01.01.2025'))) == 25
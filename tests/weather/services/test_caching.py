@@ -0,0 +1,315 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.core.cache import cache
+
+from tests.fake_owm import GEO_PATH, ONECALL_PATH
+from weather.services.caching import (
+    AsyncSingleFlight,
+    CachePolicy,
+    SingleFlight,
+    get_or_load,
+    get_policy,
+    get_refresher,
+    read_entry,
+    read_fields,
+    write_entry,
+    write_fields,
+)
+from weather.services.open_weather_map import ServiceResult, WeatherService
+from weather.services.tiered_cache import cache_session, get_tiered_cache
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        results[index] = target(index)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_misses_make_single_upstream_call(fake_owm):
+    fake_owm.latency = 0.2
+
+    results = run_concurrently(20, lambda _: WeatherService().get_current_weather('Moscow'))
+
+    assert all(result.is_ok for result in results)
+    assert len({result.data['temperature'] for result in results}) == 1
+    assert fake_owm.calls[GEO_PATH] == 1
+    assert fake_owm.calls[ONECALL_PATH] == 1
+
+
+def test_redis_lock_coalesces_across_workers(fake_owm):
+    fake_owm.latency = 0.2
+    # Отдельный SingleFlight на поток имитирует независимые воркеры.
+    workers = [SingleFlight(poll_interval=0.01) for _ in range(5)]
+    service = WeatherService()
+
+    results = run_concurrently(
+        5, lambda index: get_or_load('coalesced', lambda: service.get_current_weather('Paris'), workers[index])
+    )
+
+    assert all(result.is_ok for result in results)
+    assert fake_owm.calls[ONECALL_PATH] == 1
+
+
+def test_failed_load_is_not_cached():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return ServiceResult.fail('Upstream error')
+
+    assert not get_or_load('failing', loader).is_ok
+    assert not get_or_load('failing', loader).is_ok
+    assert len(calls) == 2
+
+
+def test_policy_per_key_family(settings):
+    assert get_policy('geo_coords_moscow').fresh_ttl == settings.WEATHER_CACHE['POLICIES']['geo_coords_']['FRESH_TTL']
+    assert get_policy('unknown_key').fresh_ttl == settings.CACHES['default']['TIMEOUT']
+
+
+def test_stale_value_is_served_and_refreshed_in_background():
+    key = 'current_weather_Stale'
+    write_entry(key, {'temperature': 1}, CachePolicy(fresh_ttl=-1, stale_ttl=60))
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.wait(1)
+        return ServiceResult.ok({'temperature': 2})
+
+    started = time.monotonic()
+    result = get_or_load(key, loader)
+
+    assert time.monotonic() - started < 0.5
+    assert result.data == {'temperature': 1}
+
+    refreshed.set()
+    get_refresher().schedule(key, lambda: None).result(timeout=5)
+    entry = read_entry(key)
+    assert entry.data == {'temperature': 2}
+    assert entry.is_fresh
+
+
+def test_fresh_value_is_not_refreshed():
+    key = 'current_weather_Fresh'
+    write_entry(key, {'temperature': 1})
+
+    result = get_or_load(key, lambda: pytest.fail('loader must not be called'))
+
+    assert result.data == {'temperature': 1}
+
+
+def test_expired_hash_fields_are_ignored():
+    key = 'forecast_Expired'
+    write_fields(key, {'01.01.2025': {'min': 1.0, 'max': 2.0}}, CachePolicy(fresh_ttl=-120, stale_ttl=60))
+    write_fields(key, {'02.01.2025': {'min': 3.0, 'max': 4.0}}, CachePolicy(fresh_ttl=-1, stale_ttl=60))
+
+    entries = read_fields({key: ['01.01.2025', '02.01.2025']})[key]
+
+    assert list(entries) == ['02.01.2025']
+    assert not entries['02.01.2025'].is_fresh
+
+
+def test_waiter_loads_when_lock_is_released_without_value():
+    single_flight = SingleFlight(wait_timeout=5, poll_interval=0.01)
+    lock = cache.lock('lock_abandoned', timeout=60, thread_local=False)
+    lock.acquire()
+    threading.Timer(0.1, lock.release).start()
+
+    started = time.monotonic()
+    result = single_flight.do('abandoned', lambda: ServiceResult.ok({'value': 1}), lambda: None)
+
+    assert result.data == {'value': 1}
+    assert time.monotonic() - started < 1
+
+
+def test_session_releases_its_leases_before_waiting_for_foreign_lock():
+    single_flight = SingleFlight(wait_timeout=5, poll_interval=0.01)
+    lock = cache.lock('lock_foreign', timeout=60, thread_local=False)
+    lock.acquire()
+    threading.Timer(0.1, lock.release).start()
+    held_while_waiting = []
+
+    def lookup():
+        held_while_waiting.append(cache.get('lock_own') is not None or cache.get('own') is None)
+
+    with cache_session() as session:
+        get_tiered_cache().prefetch(session, keys=['own'])
+        assert session.holds_lease('own')
+        write_entry('own', {'value': 1})
+
+        single_flight.do('foreign', lambda: ServiceResult.ok({'value': 2}), lookup)
+
+        # Записи сессии и снятие ее блокировок ушли в Redis до ожидания чужой блокировки.
+        assert not session.leases
+    assert held_while_waiting and not any(held_while_waiting)
+    assert read_entry('own', local=False).data == {'value': 1}
+
+
+def start_leader(single_flight, key, *args, **kwargs):
+    leader = ThreadPoolExecutor(max_workers=1).submit(single_flight.do, key, *args, **kwargs)
+    while key not in single_flight._calls:
+        time.sleep(0.001)
+    return leader
+
+
+def test_followers_get_leader_error(monkeypatch):
+    single_flight = SingleFlight()
+    follower_waiting = threading.Event()
+    # Ожидающий вызов отпускает блокировки сессии прямо перед ожиданием первого.
+    monkeypatch.setattr('weather.services.caching._release_session_leases', follower_waiting.set)
+
+    def loader():
+        follower_waiting.wait(5)
+        raise ConnectionError('Redis is unavailable')
+
+    leader = start_leader(single_flight, 'failing_leader', loader, lambda: None)
+
+    with pytest.raises(ConnectionError):
+        single_flight.do('failing_leader', lambda: pytest.fail('follower must not load'), lambda: None)
+    with pytest.raises(ConnectionError):
+        leader.result(timeout=5)
+
+
+def test_follower_stops_waiting_for_hung_leader():
+    single_flight = SingleFlight(wait_timeout=0.1)
+    released = threading.Event()
+
+    def hung_loader():
+        released.wait(5)
+        return ServiceResult.ok({'value': 1})
+
+    leader = start_leader(single_flight, 'hung_leader', hung_loader, lambda: None)
+
+    started = time.monotonic()
+    result = single_flight.do('hung_leader', lambda: ServiceResult.ok({'value': 2}), lambda: None)
+
+    assert result.data == {'value': 2}
+    assert time.monotonic() - started < 1
+    released.set()
+    assert leader.result(timeout=5).data == {'value': 1}
+
+
+def test_follower_loads_when_background_leader_gives_up(monkeypatch):
+    single_flight = SingleFlight()
+    follower_waiting = threading.Event()
+    monkeypatch.setattr('weather.services.caching._release_session_leases', follower_waiting.set)
+    load_exclusive = single_flight._load_exclusive
+
+    def give_up(*args):
+        # Фоновое обновление не ждет, пока ключ пересобирает другой воркер.
+        follower_waiting.wait(5)
+        monkeypatch.setattr(single_flight, '_load_exclusive', load_exclusive)
+
+    monkeypatch.setattr(single_flight, '_load_exclusive', give_up)
+    leader = start_leader(single_flight, 'given_up', lambda: ServiceResult.ok({'value': 1}), lambda: None, wait=False)
+
+    result = single_flight.do('given_up', lambda: ServiceResult.ok({'value': 2}), lambda: None)
+
+    assert leader.result(timeout=5) is None
+    assert result.data == {'value': 2}
+
+
+def test_async_follower_loads_when_background_leader_gives_up(monkeypatch):
+    single_flight = AsyncSingleFlight()
+
+    async def load_exclusive(key, loader, lookup, wait):
+        # Блокировка Redis свободна: повторный вызов грузит сам.
+        return await loader()
+
+    async def run():
+        follower_waiting = asyncio.Event()
+
+        async def release_session_leases():
+            follower_waiting.set()
+
+        async def give_up(*args):
+            await follower_waiting.wait()
+            monkeypatch.setattr(single_flight, '_load_exclusive', load_exclusive)
+
+        monkeypatch.setattr('weather.services.caching._arelease_session_leases', release_session_leases)
+        monkeypatch.setattr(single_flight, '_load_exclusive', give_up)
+
+        async def load():
+            return ServiceResult.ok({'value': 2})
+
+        async def lookup():
+            return None
+
+        leader = asyncio.create_task(single_flight.do('given_up', load, lookup, wait=False))
+        await asyncio.sleep(0)
+        return await asyncio.gather(leader, single_flight.do('given_up', load, lookup))
+
+    leader_result, result = asyncio.run(run())
+
+    assert leader_result is None
+    assert result.data == {'value': 2}
+
+
+def test_async_follower_stops_waiting_for_hung_leader():
+    single_flight = AsyncSingleFlight(wait_timeout=0.1)
+
+    async def run():
+        released = asyncio.Event()
+
+        async def hung_load():
+            await released.wait()
+            return ServiceResult.ok({'value': 1})
+
+        async def load():
+            return ServiceResult.ok({'value': 2})
+
+        async def lookup():
+            return None
+
+        leader = asyncio.create_task(single_flight.do('hung_leader', hung_load, lookup))
+        await asyncio.sleep(0.01)
+        result = await single_flight.do('hung_leader', load, lookup)
+        released.set()
+        return result, await leader
+
+    result, leader_result = asyncio.run(run())
+
+    assert result.data == {'value': 2}
+    assert leader_result.data == {'value': 1}
+
+
+def test_async_followers_survive_cancelled_leader():
+    single_flight = AsyncSingleFlight()
+
+    async def run():
+        started = asyncio.Event()
+
+        async def hung_load():
+            started.set()
+            await asyncio.Event().wait()
+
+        async def load():
+            return ServiceResult.ok({'value': 2})
+
+        async def lookup():
+            return None
+
+        leader = asyncio.create_task(single_flight.do('cancelled_leader', hung_load, lookup))
+        await started.wait()
+        follower = asyncio.create_task(single_flight.do('cancelled_leader', load, lookup))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()).data == {'value': 2}
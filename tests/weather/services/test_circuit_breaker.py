@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+
+from tests.fake_owm import GEO_PATH, ONECALL_PATH
+from weather.services.caching import CachePolicy, write_entry
+from weather.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from weather.services.deadline import DeadlineExceeded, limit_timeout, request_deadline
+from weather.services.http import AsyncHttpTransport, HttpTransport
+from weather.services.open_weather_map import WeatherService
+from weather.services.rate_limit import GEO, ONECALL
+
+
+def make_service(**options) -> WeatherService:
+    breakers = {
+        endpoint: CircuitBreaker(endpoint, failure_threshold=2, open_seconds=60, **options)
+        for endpoint in (GEO, ONECALL)
+    }
+    return WeatherService(
+        transport=HttpTransport(retries=0, breakers=breakers),
+        async_transport=AsyncHttpTransport(retries=0, breakers=breakers),
+    )
+
+
+def test_breaker_opens_and_probes():
+    breaker = CircuitBreaker(ONECALL, failure_threshold=2, open_seconds=0.05)
+
+    breaker.record(False, 0.1)
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    time.sleep(0.05)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    # Пока идет пробный вызов, остальные отклоняются.
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+    time.sleep(0.05)
+    breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats() == {'state': CLOSED, 'failures': 0, 'rejected': 2}
+
+
+def test_slow_call_counts_as_failure():
+    breaker = CircuitBreaker(ONECALL, failure_threshold=1, slow_call_duration=1)
+
+    breaker.record(True, 2)
+
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast(fake_owm):
+    service = make_service()
+    fake_owm.failure_status = 500
+
+    for _ in range(2):
+        assert not service.get_current_weather('Abc').is_ok
+    fake_owm.reset()
+    result = service.get_current_weather('Abc')
+
+    assert not result.is_ok
+    assert fake_owm.total_calls == 0
+
+
+def test_open_circuit_serves_stale_entry(fake_owm):
+    service = make_service()
+    coords = service.geo_client.get_coordinates('Abc').data
+    key = service.current_weather_cache_key(coords)
+    write_entry(key, {'temperature': 1, 'local_time': '00:00'}, CachePolicy(fresh_ttl=0, stale_ttl=60))
+    fake_owm.failure_status = 500
+    for _ in range(2):
+        service.refresh_current_weather(coords)
+    fake_owm.reset()
+
+    assert service.get_current_weather('Abc').data == {'temperature': 1, 'local_time': '00:00'}
+    assert fake_owm.calls[ONECALL_PATH] == 0
+
+
+def test_async_open_circuit_fails_fast(fake_owm):
+    service = make_service()
+    fake_owm.failure_status = 503
+
+    async def run():
+        return [await service.aget_current_weather('Abc') for _ in range(3)]
+
+    results = asyncio.run(run())
+
+    assert not any(result.is_ok for result in results)
+    assert fake_owm.calls[GEO_PATH] == 2
+
+
+def test_unexpected_error_frees_probe_slot(monkeypatch):
+    breaker = CircuitBreaker(ONECALL, failure_threshold=1, open_seconds=0)
+    breaker.record(False, 0.1)
+    transport = HttpTransport(retries=0, breakers={ONECALL: breaker})
+
+    def broken_send(*args):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(transport, '_send', broken_send)
+
+    with pytest.raises(RuntimeError):
+        transport.request('GET', 'http://upstream', endpoint=ONECALL)
+
+    assert breaker.state == HALF_OPEN
+    # Пробный слот освобожден: следующий вызов пропускается.
+    breaker.before_call()
+
+
+def test_limit_timeout():
+    assert limit_timeout((3, 15)) == (3, 15)
+    with request_deadline(1):
+        connect, read = limit_timeout((3, 15))
+        assert connect <= 1 and read <= 1
+    with request_deadline(0), pytest.raises(DeadlineExceeded):
+        limit_timeout((3, 15))
+
+
+def test_expired_deadline_skips_upstream(fake_owm):
+    service = make_service()
+
+    with request_deadline(0):
+        result = service.get_current_weather('Abc')
+
+    assert not result.is_ok
+    assert fake_owm.total_calls == 0
@@ -1,14 +1,34 @@
+import io
+from datetime import date, timedelta
 from unittest.mock import patch
 
-from weather.services.forecast import get_forecast
-from weather.services.open_weather_map import ServiceResult
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
 
+from tests.helpers import count_round_trips
+from weather.models import ForecastOverride, GeoLocation
+from weather.services.forecast import aget_forecast, get_forecast, get_forecast_range, save_forecast_override
+from weather.services.open_weather_map import ServiceResult, WeatherService
+from weather.services.overrides import find_override, overrides_cache_key
+from weather.services.tiered_cache import get_tiered_cache
 
-@patch('weather.services.forecast.ForecastOverride.objects.filter')
+
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+@patch('weather.services.forecast.find_override')
 @patch('weather.services.forecast.WeatherService.get_forecast')
-def test_get_forecast_uses_override(mock_get_forecast, mock_filter, override_forecast_object):
-    mock_filter.return_value.first.return_value = override_forecast_object
-    is_error, data = get_forecast({'city': 'BlaBla', 'date': ''})
+def test_get_forecast_uses_override(
+    mock_get_forecast, mock_find_override, mock_coords, coords_result, override_forecast_object
+):
+    mock_coords.return_value = coords_result
+    mock_find_override.return_value = [
+        override_forecast_object.min_temperature,
+        override_forecast_object.max_temperature,
+    ]
+    is_error, data = get_forecast({'city': 'BlaBla', 'date': date.today()})
 
     assert not is_error
     assert data['min_temperature'] == override_forecast_object.min_temperature
@@ -16,14 +36,16 @@ def test_get_forecast_uses_override(mock_get_forecast, mock_filter, override_for
     mock_get_forecast.assert_not_called()
 
 
-@patch('weather.services.forecast.ForecastOverride.objects.filter')
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+@patch('weather.services.forecast.find_override')
 @patch('weather.services.forecast.WeatherService.get_forecast')
-def test_get_forecast_uses_api_success(mock_get_forecast, mock_filter):
+def test_get_forecast_uses_api_success(mock_get_forecast, mock_find_override, mock_coords, coords_result):
     min_temp, max_temp = 0, 1
+    mock_coords.return_value = coords_result
 
-    mock_filter.return_value.first.return_value = None
+    mock_find_override.return_value = None
     mock_get_forecast.return_value = ServiceResult.ok({'min': min_temp, 'max': max_temp})
-    is_error, data = get_forecast({'city': 'BlaBla', 'date': ''})
+    is_error, data = get_forecast({'city': 'BlaBla', 'date': date.today()})
 
     assert not is_error
     assert data['min_temperature'] == min_temp
@@ -31,11 +53,278 @@ def test_get_forecast_uses_api_success(mock_get_forecast, mock_filter):
     mock_get_forecast.assert_called_once()
 
 
-@patch('weather.services.forecast.ForecastOverride.objects.filter')
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+@patch('weather.services.forecast.find_override')
 @patch('weather.services.forecast.WeatherService.get_forecast')
-def test_get_forecast_uses_api_fail(mock_get_forecast, mock_filter):
-    mock_filter.return_value.first.return_value = None
+def test_get_forecast_uses_api_fail(mock_get_forecast, mock_find_override, mock_coords, coords_result):
+    mock_coords.return_value = coords_result
+    mock_find_override.return_value = None
     mock_get_forecast.return_value = ServiceResult.fail('')
-    is_error, _ = get_forecast({'city': 'BlaBla', 'date': ''})
+    is_error, _ = get_forecast({'city': 'BlaBla', 'date': date.today()})
 
     assert is_error
+
+
+@pytest.fixture
+def location():
+    return GeoLocation.objects.create(name='BlaBla', latitude=1.0, longitude=2.0)
+
+
+def location_coords(location):
+    return ServiceResult.ok({'lat': location.latitude, 'lon': location.longitude, 'location_id': location.pk})
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+@patch('weather.services.forecast.WeatherService.get_forecast_ranges')
+def test_get_forecast_range_merges_overrides_in_one_query(mock_range, mock_coords, location, django_assert_num_queries):
+    today = date.today()
+    tomorrow = today + timedelta(days=1)
+    ForecastOverride.objects.create(city='BlaBla', location=location, date=today, min_temperature=8, max_temperature=18)
+    mock_coords.return_value = location_coords(location)
+    mock_range.return_value = {'BlaBla': {tomorrow: ServiceResult.ok({'min': 0, 'max': 1})}}
+
+    with django_assert_num_queries(1):
+        is_error, data = get_forecast_range({'city': ['BlaBla'], 'date_from': today, 'date_to': tomorrow})
+
+    assert not is_error
+    assert [day['min_temperature'] for day in data['BlaBla']] == [8, 0]
+    mock_range.assert_called_once_with({'BlaBla': [tomorrow]})
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+@patch('weather.services.forecast.WeatherService.get_forecast_ranges')
+def test_get_forecast_range_isolates_city_errors(mock_range, mock_coords, coords_result):
+    today = date.today()
+    mock_coords.return_value = coords_result
+    mock_range.side_effect = lambda missing: {
+        city: {
+            day: ServiceResult.ok({'min': 0, 'max': 1}) if city == 'Good' else ServiceResult.fail('Not found')
+            for day in dates
+        }
+        for city, dates in missing.items()
+    }
+
+    is_error, data = get_forecast_range({'city': ['Good', 'Bad'], 'date_from': today, 'date_to': today})
+
+    assert not is_error
+    assert data['Good'][0]['max_temperature'] == 1
+    assert 'error' in data['Bad']
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_save_forecast_override_links_location(mock_coords, location):
+    mock_coords.return_value = location_coords(location)
+    today = date.today()
+
+    for city in ('BlaBla', 'blabla '):
+        is_error, _ = save_forecast_override({'city': city, 'date': today, 'min_temperature': 1, 'max_temperature': 2})
+        assert not is_error
+
+    assert ForecastOverride.objects.get(location=location, date=today).city == 'blabla '
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_save_forecast_override_without_location_matches_by_city(mock_coords, location):
+    mock_coords.return_value = ServiceResult.fail('Geocoding API is unavailable')
+    today = date.today()
+
+    for city, max_temperature in (('BlaBla', 2), ('blabla ', 3)):
+        is_error, _ = save_forecast_override(
+            {'city': city, 'date': today, 'min_temperature': 1, 'max_temperature': max_temperature}
+        )
+        assert not is_error
+
+    override = ForecastOverride.objects.get(date=today)
+    assert override.location is None
+    # Запись без места применяется по названию, в том числе когда место у города уже есть.
+    assert find_override(location_coords(location).data, today, 'BLABLA') == [1, 3]
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.aget_coordinates')
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_override_is_served_when_geocoding_fails(mock_coords, mock_acoords):
+    mock_coords.return_value = mock_acoords.return_value = ServiceResult.fail('City Atlantis not found.')
+    today = date.today()
+    save_forecast_override({'city': 'Atlantis', 'date': today, 'min_temperature': 1, 'max_temperature': 2})
+
+    assert get_forecast({'city': 'atlantis', 'date': today}) == (False, {'min_temperature': 1, 'max_temperature': 2})
+    assert async_to_sync(aget_forecast)({'city': 'Atlantis', 'date': today})[1] == {
+        'min_temperature': 1,
+        'max_temperature': 2,
+    }
+    is_error, data = get_forecast_range(
+        {'city': ['Atlantis', 'Lemuria'], 'date_from': today, 'date_to': today + timedelta(days=1)}
+    )
+    assert is_error
+    # Переопределения нет на все даты — город без места остается ошибкой геокодирования.
+    assert 'error' in data['Atlantis'] and 'error' in data['Lemuria']
+
+    is_error, data = get_forecast_range({'city': ['Atlantis'], 'date_from': today, 'date_to': today})
+    assert not is_error
+    assert data['Atlantis'] == [{'date': today.strftime('%d.%m.%Y'), 'min_temperature': 1, 'max_temperature': 2}]
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_link_forecast_overrides_command(mock_coords, location):
+    mock_coords.side_effect = lambda city: location_coords(location) if city == 'BlaBla' else ServiceResult.fail('')
+    today = date.today()
+    ForecastOverride.objects.create(city='BlaBla', date=today, min_temperature=1, max_temperature=2)
+    ForecastOverride.objects.create(city='Nowhere', date=today, min_temperature=1, max_temperature=2)
+
+    with pytest.raises(CommandError, match='Nowhere'):
+        call_command('link_forecast_overrides', stdout=io.StringIO())
+
+    assert ForecastOverride.objects.get(city='BlaBla').location == location
+    assert ForecastOverride.objects.get(city='BlaBla').city_key is None
+    assert ForecastOverride.objects.get(city='Nowhere').location is None
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_link_forecast_overrides_keeps_newer_value(mock_coords, location):
+    mock_coords.return_value = location_coords(location)
+    today, tomorrow = date.today(), date.today() + timedelta(days=1)
+    # Сегодня запись по названию (например, при недоступном геокодере) новее привязанной, завтра — старше.
+    ForecastOverride.objects.create(city='BlaBla', location=location, date=today, min_temperature=8, max_temperature=18)
+    ForecastOverride.objects.create(city='blabla', date=today, min_temperature=1, max_temperature=2)
+    ForecastOverride.objects.create(city='blabla', date=tomorrow, min_temperature=1, max_temperature=2)
+    ForecastOverride.objects.create(
+        city='BlaBla', location=location, date=tomorrow, min_temperature=8, max_temperature=18
+    )
+
+    assert find_override(location_coords(location).data, today, 'BlaBla') == [1, 2]
+    assert find_override(location_coords(location).data, tomorrow, 'BlaBla') == [8, 18]
+
+    call_command('link_forecast_overrides', stdout=io.StringIO())
+
+    assert ForecastOverride.objects.filter(location__isnull=True).count() == 0
+    assert ForecastOverride.objects.get(date=today).min_temperature == 1
+    assert ForecastOverride.objects.get(date=tomorrow).min_temperature == 8
+
+
+@pytest.mark.django_db
+def test_overrides_without_location_are_unique_by_city_name():
+    today = date.today()
+    ForecastOverride.objects.create(city='BlaBla', date=today, min_temperature=1, max_temperature=2)
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        ForecastOverride.objects.create(city=' blabla', date=today, min_temperature=1, max_temperature=3)
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.aget_coordinates')
+@patch('weather.services.forecast.WeatherService.aget_forecast')
+def test_aget_forecast_uses_override(mock_aget_forecast, mock_coords, location):
+    today = date.today()
+    ForecastOverride.objects.create(city='BlaBla', location=location, date=today, min_temperature=8, max_temperature=18)
+    mock_coords.return_value = location_coords(location)
+
+    is_error, data = async_to_sync(aget_forecast)({'city': 'BlaBla', 'date': today})
+
+    assert not is_error
+    assert data == {'min_temperature': 8, 'max_temperature': 18}
+    mock_aget_forecast.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_save_forecast_override_is_single_upsert(mock_coords, location, django_assert_num_queries):
+    mock_coords.return_value = location_coords(location)
+    today = date.today()
+    ForecastOverride.objects.create(city='BlaBla', location=location, date=today, min_temperature=8, max_temperature=18)
+
+    with django_assert_num_queries(1):
+        save_forecast_override({'city': 'BlaBla', 'date': today, 'min_temperature': 1, 'max_temperature': 2})
+
+    override = ForecastOverride.objects.get(location=location, date=today)
+    assert (override.min_temperature, override.max_temperature) == (1, 2)
+
+    # Запись без места — тоже один upsert, по индексу (city_key, date).
+    mock_coords.return_value = ServiceResult.fail('Geocoding API is unavailable')
+    ForecastOverride.objects.create(city='Atlantis', date=today, min_temperature=8, max_temperature=18)
+    with django_assert_num_queries(1):
+        save_forecast_override({'city': ' atlantis', 'date': today, 'min_temperature': 1, 'max_temperature': 2})
+
+    override = ForecastOverride.objects.get(location=None, date=today)
+    assert (override.city, override.min_temperature, override.max_temperature) == (' atlantis', 1, 2)
+
+
+@pytest.mark.django_db
+@patch('weather.services.open_weather_map.GeoService.get_coordinates')
+def test_import_forecast_overrides_command(mock_coords, location, tmp_path):
+    mock_coords.side_effect = lambda city: location_coords(location) if city == 'BlaBla' else ServiceResult.fail('')
+    today = date.today()
+    rows = ['city,date,min_temperature,max_temperature']
+    rows += [f'BlaBla,{(today + timedelta(days=offset)).strftime("%d.%m.%Y")},1,2' for offset in range(5)]
+    rows += [f'Nowhere,{today.strftime("%d.%m.%Y")},1,2', f'BlaBla,{today.strftime("%d.%m.%Y")},5,1']
+    path = tmp_path / 'overrides.csv'
+    path.write_text('\n'.join(rows))
+    stdout, stderr = io.StringIO(), io.StringIO()
+
+    call_command('import_forecast_overrides', str(path), batch_size=2, stdout=stdout, stderr=stderr)
+
+    assert ForecastOverride.objects.filter(location=location).count() == 5
+    assert 'Imported 5' in stdout.getvalue()
+    assert 'Line 8 skipped' in stderr.getvalue()
+    assert 'City Nowhere skipped' in stderr.getvalue()
+
+
+def test_cached_forecast_makes_no_queries(fake_owm, django_assert_num_queries):
+    request = {'city': 'BlaBla', 'date': date.today()}
+    get_forecast(request)
+
+    with django_assert_num_queries(0):
+        is_error, _ = get_forecast(request)
+
+    assert not is_error
+
+
+def test_override_writes_invalidate_cached_lookup(fake_owm):
+    today = date.today()
+    _, forecast = get_forecast({'city': 'BlaBla', 'date': today})
+
+    save_forecast_override({'city': 'blabla', 'date': today, 'min_temperature': -50, 'max_temperature': 50})
+    assert get_forecast({'city': 'BlaBla', 'date': today}) == (False, {'min_temperature': -50, 'max_temperature': 50})
+
+    # Удаление через модель (как из админки) тоже сбрасывает кеш.
+    ForecastOverride.objects.get(date=today).delete()
+    assert get_forecast({'city': 'BlaBla', 'date': today}) == (False, forecast)
+
+
+def test_moving_override_to_another_date_invalidates_both(fake_owm):
+    today, tomorrow = date.today(), date.today() + timedelta(days=1)
+    _, forecast = get_forecast({'city': 'BlaBla', 'date': today})
+    save_forecast_override({'city': 'BlaBla', 'date': today, 'min_temperature': -50, 'max_temperature': 50})
+    get_forecast({'city': 'BlaBla', 'date': tomorrow})
+
+    override = ForecastOverride.objects.get(date=today)
+    override.date = tomorrow
+    override.save()
+
+    assert get_forecast({'city': 'BlaBla', 'date': today}) == (False, forecast)
+    assert get_forecast({'city': 'BlaBla', 'date': tomorrow}) == (
+        False,
+        {'min_temperature': -50, 'max_temperature': 50},
+    )
+
+
+def test_cold_forecast_takes_two_redis_round_trips(fake_owm, without_rate_limit):
+    service = WeatherService()
+    get_forecast({'city': 'Abc', 'date': date.today()})
+    coords = service.geo_client.get_coordinates('Abc').data
+    cache.delete_many(
+        [service.geo_client.cache_key('Abc'), service.forecast_cache_key(coords), overrides_cache_key(date.today())]
+    )
+    get_tiered_cache().local.clear()
+
+    with count_round_trips() as counter:
+        is_error, _ = get_forecast({'city': 'Abc', 'date': date.today()})
+
+    assert not is_error
+    assert counter['round_trips'] == 2
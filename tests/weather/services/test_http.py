@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import ClassVar
+from urllib.parse import urlsplit
+
+import pytest
+
+from weather.services.deadline import DeadlineExceeded, request_deadline
+from weather.services.hedging import EndpointLatency, Hedging, LatencyHistogram
+from weather.services.http import AsyncHttpTransport, HttpTransport, get_transport
+from weather.services.rate_limit import ONECALL, RateLimiter
+
+
+@pytest.fixture
+def local_server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Обработчик создается на каждый запрос, поэтому настройки сервера — атрибуты класса.
+        statuses: ClassVar[list[int]] = []
+        delays: ClassVar[list[float]] = []
+        # Задержка по строке запроса: не зависит от порядка, в котором запросы дошли до сервера.
+        query_delays: ClassVar[dict[str, float]] = {}
+        hits = 0
+
+        def do_GET(self):
+            Handler.hits += 1
+            status = Handler.statuses.pop(0) if Handler.statuses else 200
+            if Handler.delays:
+                time.sleep(Handler.delays.pop(0))
+            time.sleep(Handler.query_delays.get(urlsplit(self.path).query, 0))
+            body = b'{}'
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', Handler
+    server.shutdown()
+    server.server_close()
+
+
+def test_transport_reuses_connections(local_server):
+    url, _ = local_server
+    transport = HttpTransport(retries=0)
+
+    for _ in range(3):
+        assert transport.request('get', url).status_code == 200
+
+    stats = transport.stats()
+    assert stats['requests'] == 3
+    assert stats['new_connections'] == 1
+    assert stats['pool_hits'] == 2
+    transport.close()
+
+
+def test_transport_retries_get(local_server):
+    url, handler = local_server
+    handler.statuses = [503, 503]
+    transport = HttpTransport(retries=2, backoff_factor=0)
+
+    response = transport.request('get', url)
+
+    assert response.status_code == 200
+    assert handler.hits == 3
+    transport.close()
+
+
+def test_transport_retries_within_deadline(local_server):
+    url, handler = local_server
+    handler.delays = [0.6, 0.6, 0.6]
+    transport = HttpTransport(retries=2, backoff_factor=0)
+
+    started = time.monotonic()
+    with request_deadline(0.3), pytest.raises(DeadlineExceeded):
+        transport.request('get', url)
+
+    # Первая попытка истратила весь срок: повторы не отправляются.
+    assert time.monotonic() - started < 0.5
+    assert handler.hits == 1
+    transport.close()
+
+
+def test_retries_take_rate_limit_tokens(local_server):
+    url, handler = local_server
+    handler.statuses = [503, 503, 503]
+    limiter = RateLimiter({ONECALL: {'PER_MINUTE': 60, 'BURST': 2}}, queue_timeout=0)
+    transport = HttpTransport(retries=2, backoff_factor=0, limiter=limiter)
+
+    # Токенов два: первая попытка и один повтор, без токена результат — последний ответ.
+    assert transport.request('get', url, endpoint=ONECALL).status_code == 503
+    assert handler.hits == 2
+    assert limiter.stats()[ONECALL] == {'admitted': 2, 'rejected': 1}
+    transport.close()
+
+
+def test_async_retries_take_rate_limit_tokens(local_server):
+    url, handler = local_server
+    handler.statuses = [503, 503, 503]
+    limiter = RateLimiter({ONECALL: {'PER_MINUTE': 60, 'BURST': 2}}, queue_timeout=0)
+    transport = AsyncHttpTransport(retries=2, backoff_factor=0, limiter=limiter)
+
+    async def run():
+        try:
+            return await transport.request('get', url, endpoint=ONECALL)
+        finally:
+            await transport.aclose()
+
+    assert asyncio.run(run()).status_code == 503
+    assert handler.hits == 2
+    assert limiter.stats()[ONECALL] == {'admitted': 2, 'rejected': 1}
+
+
+def test_transport_is_shared():
+    assert get_transport() is get_transport()
+
+
+def make_hedging(budget_ratio: float = 1) -> Hedging:
+    latency = EndpointLatency()
+    for _ in range(10):
+        latency.observe('onecall', 0.01)
+    return Hedging(latency, percentile=95, min_samples=10, budget_ratio=budget_ratio)
+
+
+def test_latency_histogram_percentile():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(95) is None
+
+    for _ in range(95):
+        histogram.observe(0.01)
+    for _ in range(5):
+        histogram.observe(1)
+
+    assert 0.01 <= histogram.percentile(95) < 0.02
+    assert 1 <= histogram.percentile(99) < 1.5
+    assert histogram.percentile(99, min_samples=101) is None
+
+
+def test_slow_get_is_hedged(local_server):
+    url, handler = local_server
+    handler.delays = [1]
+    hedging = make_hedging()
+    transport = HttpTransport(retries=0, hedging=hedging)
+
+    started = time.monotonic()
+    response = transport.request('get', url, endpoint='onecall')
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 0.5
+    assert handler.hits == 2
+    assert hedging.stats() == {'hedges': 1, 'hedge_wins': 1, 'budget_exceeded': 0}
+    transport.close()
+
+
+def test_hedges_are_limited_by_budget(local_server):
+    url, handler = local_server
+    handler.delays = [0.2]
+    hedging = make_hedging(budget_ratio=0)
+    transport = HttpTransport(retries=0, hedging=hedging)
+
+    assert transport.request('get', url, endpoint='onecall').status_code == 200
+    assert handler.hits == 1
+    assert hedging.stats() == {'hedges': 0, 'hedge_wins': 0, 'budget_exceeded': 1}
+    transport.close()
+
+
+def test_hedge_loser_is_cancelled(local_server):
+    url, handler = local_server
+    handler.delays = [0.5]
+    transport = HttpTransport(retries=0, read_timeout=5, hedging=make_hedging())
+    timeouts, responses = [], []
+    session_request = transport.session.request
+
+    def recorded_request(*args, timeout, **kwargs):
+        timeouts.append(timeout)
+        response = session_request(*args, timeout=timeout, **kwargs)
+        responses.append(response)
+        return response
+
+    transport.session.request = recorded_request
+
+    response = transport.request('get', url, endpoint='onecall')
+    deadline = time.monotonic() + 3
+    while len(responses) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Копия получает остаток времени основного запроса, а не таймаут заново.
+    assert timeouts[1][1] < timeouts[0][1] == 5
+    assert response.json() == {}
+    loser = responses[1]
+    # Тело проигравшего запроса не читается.
+    assert loser.raw.tell() == 0
+    transport.close()
+
+
+def test_hedging_does_not_queue_requests(local_server):
+    url, handler = local_server
+    handler.delays = [1, 1]
+    hedging = make_hedging()
+    # Потоков в пуле два: основной запрос и копия заняли их, третий запрос в очередь не встает.
+    transport = HttpTransport(retries=0, pool_maxsize=2, pool_block=False, hedging=hedging)
+    thread = threading.Thread(target=transport.request, args=('get', url), kwargs={'endpoint': 'onecall'})
+    thread.start()
+    deadline = time.monotonic() + 3
+    while handler.hits < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    assert transport.request('get', url, endpoint='onecall').status_code == 200
+
+    assert time.monotonic() - started < 0.5
+    assert hedging.stats()['hedges'] == 1
+    thread.join()
+    transport.close()
+
+
+def test_async_slow_get_is_hedged(local_server):
+    url, handler = local_server
+    handler.query_delays = {'attempt=0': 1}
+    hedging = make_hedging()
+    transport = AsyncHttpTransport(retries=0, hedging=hedging)
+    # Основной запрос и копия помечаются номером в порядке создания: медленным всегда будет основной.
+    attempts, timed_attempts = count(), transport._timed_attempts
+
+    def marked_attempts(method, url, params, timeout, endpoint):
+        return timed_attempts(method, url, {'attempt': next(attempts)}, timeout, endpoint)
+
+    transport._timed_attempts = marked_attempts
+
+    async def run():
+        try:
+            return await transport.request('get', url, endpoint='onecall')
+        finally:
+            await transport.aclose()
+
+    started = time.monotonic()
+    response = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1
+    assert hedging.stats()['hedge_wins'] == 1
+
+
+def test_transport_records_latency(local_server):
+    url, _ = local_server
+    transport = HttpTransport(retries=0)
+
+    transport.request('get', url, endpoint='geo')
+
+    assert transport.latency.percentile('geo', 50) is not None
+    transport.close()
@@ -0,0 +1,67 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from tests.fake_owm import GEO_PATH
+from weather.services import metrics
+from weather.services.metrics import Metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Metrics()
+    monkeypatch.setattr(metrics, '_metrics', registry)
+    return registry
+
+
+def test_histogram_is_rendered_cumulatively():
+    registry = Metrics()
+    registry.observe(metrics.STAGE_DURATION, (('stage', 'redis'),), 0.0002)
+    registry.observe(metrics.STAGE_DURATION, (('stage', 'redis'),), 0.003)
+    registry.inc(metrics.UPSTREAM_RESPONSES, (('endpoint', 'geo'), ('status', 200)))
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE weather_stage_duration_seconds histogram' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="redis",le="0.0005"} 1' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="redis",le="0.005"} 2' in lines
+    assert 'weather_stage_duration_seconds_bucket{stage="redis",le="+Inf"} 2' in lines
+    assert 'weather_stage_duration_seconds_count{stage="redis"} 2' in lines
+    assert 'weather_upstream_responses_total{endpoint="geo",status="200"} 1' in lines
+
+
+def test_forecast_response_carries_stage_timings(fake_owm, client, today, registry):
+    response = client.get(reverse('forecast-weather'), {'city': 'BlaBla', 'date': today})
+
+    stages = [item.split(';')[0] for item in response['Server-Timing'].split(', ')]
+    assert response.status_code == 200
+    assert {'validation', 'redis', 'geocoding', 'upstream_geo', 'upstream_onecall', 'overrides'} <= set(stages)
+    assert stages[-1] == 'total'
+
+    # Повтор отдается из кеша ответов, но тоже получает заголовок и попадает в метрики.
+    cached = client.get(reverse('forecast-weather'), {'city': 'BlaBla', 'date': today})
+    assert cached['Server-Timing'].startswith('total;dur=')
+
+    lines = client.get(reverse('metrics')).content.decode().splitlines()
+    assert 'weather_requests_total{route="forecast-weather",method="GET",status="200"} 2' in lines
+    assert 'weather_upstream_responses_total{endpoint="geo",status="200"} 1' in lines
+    assert 'weather_cache_lookups_total{family="forecast",result="miss"} 1' in lines
+    assert 'weather_cache_lookups_total{family="response",result="l1_hit"} 1' in lines
+    assert 'weather_requests_in_flight 1' in lines
+    assert 'weather_upstream_in_flight{endpoint="onecall"} 0' in lines
+
+
+def test_upstream_failures_are_counted_by_status(fake_owm, client, registry):
+    fake_owm.failure_status = 500
+
+    client.get(reverse('current-weather'), {'city': 'BlaBla'})
+
+    assert fake_owm.calls[GEO_PATH] == 1
+    assert registry.counters[metrics.UPSTREAM_RESPONSES, (('endpoint', 'geo'), ('status', 500))] == 1
+
+
+def test_disabled_metrics(client):
+    with override_settings(WEATHER_METRICS={'ENABLED': False, 'SERVER_TIMING': True}):
+        response = client.get(reverse('current-weather'))
+        assert not response.has_header('Server-Timing')
+        assert client.get(reverse('metrics')).status_code == 404
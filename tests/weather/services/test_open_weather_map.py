@@ -1,15 +1,31 @@
-from datetime import datetime
-
-from unittest.mock import patch, Mock
-
-from weather.services.open_weather_map import WeatherService, GeoService, ServiceResult
-
-
-@patch('weather.services.open_weather_map.requests.request')
+import asyncio
+import io
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django_redis import get_redis_connection
+
+from tests.fake_owm import DAILY_DAYS, DAY_SUMMARY_PATH, GEO_PATH, ONECALL_PATH
+from tests.helpers import count_round_trips
+from weather.models import CityAlias, GeoLocation
+from weather.services.caching import read_fields, write_fields
+from weather.services.locations import weather_location
+from weather.services.open_weather_map import GeoService, ServiceResult, WeatherService
+from weather.services.tiered_cache import get_tiered_cache
+
+
+@pytest.mark.django_db
+@patch('weather.services.http.HttpTransport.request')
 def test_geo_service_success(mock_request, geo_correct_response):
     response = Mock()
     response.status_code = 200
-    response.json.return_value = geo_correct_response
+    response.content = json.dumps(geo_correct_response).encode()
     mock_request.return_value = response
 
     result = GeoService().get_coordinates('Beverly Hills')
@@ -20,11 +36,12 @@ def test_geo_service_success(mock_request, geo_correct_response):
     assert 'lon' in result.data
 
 
-@patch('weather.services.open_weather_map.requests.request')
+@pytest.mark.django_db
+@patch('weather.services.http.HttpTransport.request')
 def test_geo_service_fail(mock_request, geo_incorrect_response):
     response = Mock()
     response.status_code = 200
-    response.json.return_value = geo_incorrect_response
+    response.content = json.dumps(geo_incorrect_response).encode()
     mock_request.return_value = response
 
     result = GeoService().get_coordinates('Beverly Hills')
@@ -33,14 +50,76 @@ def test_geo_service_fail(mock_request, geo_incorrect_response):
     assert not result.is_ok
 
 
+def test_geo_service_saves_location(fake_owm):
+    result = GeoService().get_coordinates('  Beverly   Hills ')
+
+    alias = CityAlias.objects.select_related('location').get(alias='beverly hills')
+    assert result.data == {
+        'lat': alias.location.latitude,
+        'lon': alias.location.longitude,
+        'location_id': alias.location_id,
+    }
+    assert alias.location.name == 'Beverly   Hills'
+
+
+def test_geo_service_uses_stored_location(fake_owm):
+    location = GeoLocation.objects.create(name='Beverly Hills', latitude=1.0, longitude=2.0)
+    CityAlias.objects.create(alias='beverly hills', location=location)
+    expected = {'lat': 1.0, 'lon': 2.0, 'location_id': location.pk}
+
+    assert GeoService().get_coordinates('BEVERLY HILLS').data == expected
+    assert asyncio.run(GeoService().aget_coordinates('Beverly hills')).data == expected
+    assert fake_owm.calls[GEO_PATH] == 0
+
+
+def test_spelling_variants_share_location_and_cache(fake_owm):
+    service = WeatherService()
+
+    results = [service.get_current_weather(city) for city in ('Moscow', ' moscow ', 'MOSCOW', 'Ｍｏｓｃｏｗ', 'Москва')]
+
+    assert all(result.data == results[0].data for result in results)
+    # Латинские написания нормализуются в один запрос, 'Москва' узнается по координатам.
+    assert fake_owm.calls[GEO_PATH] == 2
+    assert fake_owm.calls[ONECALL_PATH] == 1
+    assert GeoLocation.objects.count() == 1
+    assert set(CityAlias.objects.values_list('alias', flat=True)) == {'moscow', 'москва'}
+
+
+def test_grid_snapping_shares_weather_between_nearby_places(fake_owm, settings):
+    settings.WEATHER_GRID = {'ENABLED': True, 'CELL_DEGREES': 0.1}
+    # Центр и Китай-город в одной ячейке 0.1°, Химки — в соседней.
+    fake_owm.places = {'moscow': (55.7558, 37.6173), 'kitay-gorod': (55.7539, 37.633), 'khimki': (55.8889, 37.4303)}
+    service = WeatherService()
+
+    center, district = service.get_current_weather('Moscow'), service.get_current_weather('Kitay-gorod')
+
+    assert center.data == district.data
+    assert fake_owm.calls[ONECALL_PATH] == 1
+    assert service.get_current_weather('Khimki').is_ok
+    assert fake_owm.calls[ONECALL_PATH] == 2
+
+
+def test_warm_geo_cache_command(fake_owm):
+    location = GeoLocation.objects.create(name='Beverly Hills', latitude=1.0, longitude=2.0)
+    CityAlias.objects.create(alias='beverly hills', location=location)
+
+    call_command('warm_geo_cache', stdout=io.StringIO())
+    GeoLocation.objects.all().delete()
+
+    link = get_redis_connection('default').get(cache.make_key(GeoService.location_link_key('Beverly Hills')))
+    assert link.decode() == str(location.pk)
+    assert GeoService().get_coordinates('Beverly Hills').data == {'lat': 1.0, 'lon': 2.0, 'location_id': location.pk}
+    assert fake_owm.calls[GEO_PATH] == 0
+
+
 @patch.object(GeoService, 'get_coordinates')
-@patch('weather.services.open_weather_map.requests.request')
+@patch('weather.services.http.HttpTransport.request')
 def test_get_current_weather_success(mock_request, mock_coords, coords_result, current_weather_correct_response):
     mock_coords.return_value = coords_result
 
     response = Mock()
     response.status_code = 200
-    response.json.return_value = current_weather_correct_response
+    response.content = json.dumps(current_weather_correct_response).encode()
     mock_request.return_value = response
 
     result = WeatherService().get_current_weather('Abc')
@@ -52,13 +131,13 @@ def test_get_current_weather_success(mock_request, mock_coords, coords_result, c
 
 
 @patch.object(GeoService, 'get_coordinates')
-@patch('weather.services.open_weather_map.requests.request')
+@patch('weather.services.http.HttpTransport.request')
 def test_get_current_weather_fail(mock_request, mock_coords, coords_result, current_weather_incorrect_response):
     mock_coords.return_value = coords_result
 
     response = Mock()
     response.status_code = 200
-    response.json.return_value = current_weather_incorrect_response
+    response.content = json.dumps(current_weather_incorrect_response).encode()
     mock_request.return_value = response
 
     result = WeatherService().get_current_weather('Abc')
@@ -69,13 +148,13 @@ def test_get_current_weather_fail(mock_request, mock_coords, coords_result, curr
 
 
 @patch.object(GeoService, 'get_coordinates')
-@patch('weather.services.open_weather_map.requests.request')
+@patch('weather.services.http.HttpTransport.request')
 def test_get_forecast_success(mock_request, mock_coords, coords_result, forecast_correct_response):
     mock_coords.return_value = coords_result
 
     response = Mock()
     response.status_code = 200
-    response.json.return_value = forecast_correct_response
+    response.content = json.dumps(forecast_correct_response).encode()
     mock_request.return_value = response
 
     date = datetime(2025, 6, 11)
@@ -88,13 +167,13 @@ def test_get_forecast_success(mock_request, mock_coords, coords_result, forecast
 
 
 @patch.object(GeoService, 'get_coordinates')
-@patch('weather.services.open_weather_map.requests.request')
+@patch('weather.services.http.HttpTransport.request')
 def test_get_forecast_fail(mock_request, mock_coords, coords_result, forecast_incorrect_response):
     mock_coords.return_value = coords_result
 
     response = Mock()
     response.status_code = 200
-    response.json.return_value = forecast_incorrect_response
+    response.content = json.dumps(forecast_incorrect_response).encode()
     mock_request.return_value = response
 
     result = WeatherService().get_forecast('Abc', datetime(2025, 6, 11))
@@ -104,7 +183,7 @@ def test_get_forecast_fail(mock_request, mock_coords, coords_result, forecast_in
 
 
 @patch.object(GeoService, 'get_coordinates')
-@patch('weather.services.open_weather_map.requests.request')
+@patch('weather.services.http.HttpTransport.request')
 def test_get_current_weather_caching(mock_request, mock_coords, coords_result, current_weather_correct_response):
     city = 'Abc'
 
@@ -112,7 +191,7 @@ def test_get_current_weather_caching(mock_request, mock_coords, coords_result, c
     mock_coords.return_value = coords_result
     response = Mock()
     response.status_code = 200
-    response.json.return_value = current_weather_correct_response
+    response.content = json.dumps(current_weather_correct_response).encode()
     mock_request.return_value = response
     WeatherService().get_current_weather(city)
     assert mock_request.called
@@ -122,3 +201,189 @@ def test_get_current_weather_caching(mock_request, mock_coords, coords_result, c
     # Второй должен взять из кеша.
     WeatherService().get_current_weather(city)
     mock_request.assert_not_called()
+
+
+def test_get_forecast_range_uses_single_daily_call(fake_owm):
+    today = date.today()
+    dates = [today + timedelta(days=offset) for offset in range(10)]
+    service = WeatherService()
+
+    results = service.get_forecast_range('Abc', dates)
+
+    assert all(result.is_ok for result in results.values())
+    assert fake_owm.calls[GEO_PATH] == 1
+    assert fake_owm.calls[ONECALL_PATH] == 1
+    assert fake_owm.calls[DAY_SUMMARY_PATH] == len(dates) - DAILY_DAYS
+    coords = service.geo_client.get_coordinates('Abc').data
+    key = service.forecast_cache_key(coords)
+    assert len(read_fields({key: [service.forecast_field(day) for day in dates]})[key]) == len(dates)
+
+    fake_owm.reset()
+    service.get_forecast_range('Abc', dates)
+    assert fake_owm.total_calls == 0
+
+
+def test_days_beyond_daily_horizon_skip_one_call(fake_owm):
+    today = date.today()
+    dates = [today + timedelta(days=offset) for offset in range(DAILY_DAYS, DAILY_DAYS + 2)]
+
+    results = WeatherService().get_forecast_range('Abc', dates)
+
+    assert all(result.is_ok for result in results.values())
+    assert fake_owm.calls[ONECALL_PATH] == 0
+    assert fake_owm.calls[DAY_SUMMARY_PATH] == len(dates)
+
+
+def test_range_waits_only_for_daily_days_of_other_worker(fake_owm):
+    today = date.today()
+    dates = [today + timedelta(days=offset) for offset in range(10)]
+    service = WeatherService()
+    coords = service.geo_client.get_coordinates('Abc').data
+    key = service.forecast_cache_key(coords)
+    # Прогноз daily загружает другой воркер: блокировка его, значения появятся чуть позже.
+    cache.lock(f'lock_forecast_daily_{weather_location(coords)}', timeout=60, thread_local=False).acquire()
+    daily = {service.forecast_field(day): {'min': 1.0, 'max': 2.0} for day in dates[:DAILY_DAYS]}
+    threading.Timer(0.1, lambda: write_fields(key, daily)).start()
+
+    started = time.monotonic()
+    results = service.get_forecast_range('Abc', dates)
+
+    assert time.monotonic() - started < 5
+    assert results[today].data == {'min': 1.0, 'max': 2.0}
+    assert fake_owm.calls[ONECALL_PATH] == 0
+    assert fake_owm.calls[DAY_SUMMARY_PATH] == len(dates) - DAILY_DAYS
+
+
+def test_daily_forecast_write_drops_past_days(fake_owm):
+    service = WeatherService()
+    coords = service.geo_client.get_coordinates('Abc').data
+    key = service.forecast_cache_key(coords)
+    yesterday = service.forecast_field(date.today() - timedelta(days=1))
+    write_fields(key, {yesterday: {'min': 1.0, 'max': 2.0}})
+
+    assert service.refresh_daily_forecast(coords).is_ok
+
+    fields = read_fields({key: [yesterday, service.forecast_field(date.today())]}, local=False)[key]
+    assert list(fields) == [service.forecast_field(date.today())]
+
+
+def test_async_forecast_reads_field_written_by_sync(fake_owm):
+    today = date.today()
+    sync_result = WeatherService().get_forecast_range('Abc', [today])[today]
+
+    fake_owm.reset()
+    result = asyncio.run(WeatherService().aget_forecast('Abc', today))
+
+    assert result.data == sync_result.data
+    assert fake_owm.total_calls == 0
+
+
+def test_cold_current_weather_takes_two_redis_round_trips(fake_owm, without_rate_limit):
+    service = WeatherService()
+    result = service.get_current_weather('Abc')
+    coords = service.geo_client.get_coordinates('Abc').data
+    # Координаты и погода вытеснены, в Redis осталась только ссылка города на место.
+    cache.delete_many([service.geo_client.cache_key('Abc'), service.current_weather_cache_key(coords)])
+    get_tiered_cache().local.clear()
+
+    with count_round_trips() as counter:
+        assert service.get_current_weather('Abc').is_ok
+    assert counter['round_trips'] == 2
+    assert fake_owm.calls[ONECALL_PATH] == 2
+
+    get_tiered_cache().local.clear()
+    with count_round_trips() as counter:
+        assert service.get_current_weather('Abc').data == result.data
+    assert counter['round_trips'] == 1
+
+
+def test_async_current_weather_shares_cache_with_sync(fake_owm):
+    result = asyncio.run(WeatherService().aget_current_weather('Abc'))
+
+    assert result.is_ok
+    assert fake_owm.calls[GEO_PATH] == 1
+    assert fake_owm.calls[ONECALL_PATH] == 1
+
+    fake_owm.reset()
+    assert WeatherService().get_current_weather('Abc').data == result.data
+    assert fake_owm.total_calls == 0
+
+
+def test_async_concurrent_misses_make_single_upstream_call(fake_owm):
+    fake_owm.latency = 0.1
+
+    async def run():
+        service = WeatherService()
+        return await asyncio.gather(*(service.aget_forecast('Abc', date.today()) for _ in range(20)))
+
+    results = asyncio.run(run())
+
+    assert all(result.is_ok for result in results)
+    assert fake_owm.calls[DAY_SUMMARY_PATH] == 1
+
+
+def test_async_geocoding_fail(fake_owm):
+    fake_owm.missing_cities = {'nowhere'}
+
+    result = asyncio.run(WeatherService().aget_current_weather('Nowhere'))
+
+    assert not result.is_ok
+    assert fake_owm.calls[ONECALL_PATH] == 0
+
+
+def test_current_weather_bulk_fetches_cities_concurrently(fake_owm):
+    fake_owm.latency = 0.2
+    fake_owm.missing_cities = {'nowhere'}
+    cities = ['Abc', 'Def', 'Ghi', 'Jkl', 'Nowhere']
+
+    started = time.monotonic()
+    results = WeatherService().get_current_weather_bulk(cities, concurrency=5)
+    elapsed = time.monotonic() - started
+
+    # Последовательно: 4 города по два запроса и один геокодинг — 1.8 с.
+    assert elapsed < 1.0
+    assert list(results) == cities
+    assert all(results[city].is_ok for city in cities[:-1])
+    assert not results['Nowhere'].is_ok
+
+
+@patch.object(WeatherService, 'get_current_weather')
+def test_current_weather_bulk_isolates_exceptions(mock_get_weather):
+    mock_get_weather.side_effect = lambda city: ServiceResult.ok({'city': city}) if city == 'Abc' else 1 / 0
+
+    results = WeatherService().get_current_weather_bulk(['Abc', 'Def'])
+
+    assert results['Abc'].is_ok
+    assert not results['Def'].is_ok
+
+
+def test_async_current_weather_bulk(fake_owm):
+    fake_owm.latency = 0.2
+    cities = [f'City {index}' for index in range(10)]
+
+    started = time.monotonic()
+    results = asyncio.run(WeatherService().aget_current_weather_bulk(cities, concurrency=10))
+
+    assert time.monotonic() - started < 1.5
+    assert all(result.is_ok for result in results.values())
+
+
+def test_upstream_response_is_logged_as_summary(fake_owm, caplog):
+    with caplog.at_level('DEBUG'):
+        WeatherService().get_current_weather('Abc')
+
+    summaries = [record for record in caplog.records if record.getMessage().startswith('OpenWeatherMap response')]
+    assert [record.endpoint for record in summaries] == ['geo', 'onecall']
+    assert all(record.status == 200 and record.bytes > 0 for record in summaries)
+    assert not any('response body' in record.getMessage() for record in caplog.records)
+
+
+def test_upstream_body_logging_is_sampled(fake_owm, caplog, settings):
+    settings.OPENWEATHERMAP_HTTP = {**settings.OPENWEATHERMAP_HTTP, 'LOG_BODY_SAMPLE_RATE': 1}
+
+    with caplog.at_level('DEBUG'):
+        WeatherService().get_current_weather('Abc')
+
+    bodies = [record.getMessage() for record in caplog.records if 'response body' in record.getMessage()]
+    assert len(bodies) == 2
+    assert '"temp"' in bodies[1]
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from redis.exceptions import RedisError
+
+from tests.fake_owm import ONECALL_PATH
+from weather.services.http import HttpTransport
+from weather.services.open_weather_map import WeatherService
+from weather.services.rate_limit import GEO, ONECALL, RateLimiter, RateLimitExceeded, without_queueing
+
+
+def make_limiter(per_minute: int = 60, burst: int = 2, queue_timeout: float = 0) -> RateLimiter:
+    budgets = {GEO: {'PER_MINUTE': per_minute, 'BURST': burst}, ONECALL: {'PER_MINUTE': per_minute, 'BURST': burst}}
+    return RateLimiter(budgets, queue_timeout=queue_timeout)
+
+
+def test_burst_admitted_then_rejected():
+    limiter = make_limiter()
+
+    limiter.acquire(ONECALL)
+    limiter.acquire(ONECALL)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(ONECALL)
+
+    # Бюджеты независимы.
+    limiter.acquire(GEO)
+    assert limiter.stats() == {GEO: {'admitted': 1}, ONECALL: {'admitted': 2, 'rejected': 1}}
+
+
+def test_miss_waits_for_token():
+    # 600 в минуту — токен раз в 0.1 с.
+    limiter = make_limiter(per_minute=600, burst=1, queue_timeout=1)
+
+    limiter.acquire(ONECALL)
+    limiter.acquire(ONECALL)
+
+    assert limiter.stats()[ONECALL] == {'admitted': 1, 'queued': 1}
+
+
+def test_background_refresh_does_not_wait():
+    limiter = make_limiter(per_minute=600, burst=1, queue_timeout=1)
+    limiter.acquire(ONECALL)
+
+    with without_queueing(), pytest.raises(RateLimitExceeded):
+        limiter.acquire(ONECALL)
+
+
+def test_async_acquire():
+    limiter = make_limiter(burst=1)
+
+    async def run():
+        await limiter.aacquire(ONECALL)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.aacquire(ONECALL)
+
+    asyncio.run(run())
+    assert limiter.stats()[ONECALL] == {'admitted': 1, 'rejected': 1}
+
+
+def test_limiter_error_admits_call(monkeypatch):
+    limiter = make_limiter(burst=0)
+
+    def take(budget):
+        raise RedisError('Redis is unavailable')
+
+    monkeypatch.setattr(limiter, '_take', take)
+
+    limiter.acquire(ONECALL)
+
+    assert limiter.stats()[ONECALL] == {'limiter_error': 1}
+    # Ошибка в коде лимитера не считается разрешением.
+    monkeypatch.setattr(limiter, '_take', lambda budget: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        limiter.acquire(ONECALL)
+
+
+def test_rejected_call_does_not_reach_upstream(fake_owm):
+    # Геокодирование без ограничения: отклоняется только обращение к One Call.
+    limiter = RateLimiter({ONECALL: {'PER_MINUTE': 60, 'BURST': 1}}, queue_timeout=0)
+    service = WeatherService(transport=HttpTransport(limiter=limiter))
+
+    assert service.get_current_weather('Abc').is_ok
+    assert not service.get_current_weather('Def').is_ok
+    assert fake_owm.calls[ONECALL_PATH] == 1
@@ -0,0 +1,105 @@
+import io
+import time
+from datetime import date
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from tests.fake_owm import GEO_PATH, ONECALL_PATH
+from weather.services.caching import CachePolicy, read_entry, read_fields, write_entry
+from weather.services.hot_cities import CURRENT, FORECAST, HotCities, get_hot_cities
+from weather.services.open_weather_map import ServiceResult, WeatherService
+from weather.services.refresh_scheduler import CallBudget, RefreshScheduler
+
+
+def test_hot_cities_ranks_normalized_names():
+    hot_cities = HotCities()
+    hot_cities.record(CURRENT, ['Abc', ' abc', 'Def'])
+    hot_cities.record(CURRENT, ['Def', 'DEF', 'Ghi'])
+
+    assert hot_cities.top(CURRENT, 2) == ['def', 'abc']
+    assert hot_cities.top(FORECAST, 2) == []
+
+
+def test_hot_cities_flushes_pending_counts_without_new_requests():
+    hot_cities = HotCities(flush_interval=0.05)
+    hot_cities.record(CURRENT, ['Abc'])
+    hot_cities.record(CURRENT, ['Def', 'Def'])
+
+    # Второй вызов попал в интервал и остался в процессе; его отправляет таймер,
+    # поэтому другой процесс видит учет, хотя новых запросов нет.
+    reader = HotCities()
+    deadline = time.monotonic() + 2
+    while reader.top(CURRENT, 2) != ['def', 'abc'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.top(CURRENT, 2) == ['def', 'abc']
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_views_record_requested_cities(mock_get_weather, client):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+
+    for _ in range(2):
+        # Второй ответ отдается кешем ответов, но запрос тоже учитывается.
+        client.get(reverse('current-weather'), {'city': 'Abc'})
+    client.get(reverse('current-weather-bulk'), {'city': ['Def', 'Abc']})
+
+    # Учет копится в процессе, top отправляет его в Redis перед чтением.
+    assert get_hot_cities().top(CURRENT, 2) == ['abc', 'def']
+
+
+def test_call_budget():
+    budget = CallBudget(limit=2, period=60)
+
+    assert [budget.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_scheduler_refreshes_top_cities(fake_owm):
+    hot_cities = HotCities()
+    hot_cities.record(CURRENT, ['Abc', 'Abc', 'Def'])
+    hot_cities.record(FORECAST, ['Abc'])
+    scheduler = RefreshScheduler(hot_cities=hot_cities, top_n=1)
+
+    stats = scheduler.run_once()
+
+    assert stats == {'current_refreshed': 1, 'forecast_refreshed': 1}
+    assert fake_owm.calls[GEO_PATH] == 1
+    assert fake_owm.calls[ONECALL_PATH] == 2
+
+    service = WeatherService()
+    coords = service.geo_client.get_coordinates('Abc').data
+    assert read_entry(service.current_weather_cache_key(coords)).is_fresh
+    key = service.forecast_cache_key(coords)
+    assert read_fields({key: [service.forecast_field(date.today())]})[key][
+        service.forecast_field(date.today())
+    ].is_fresh
+
+    fake_owm.reset()
+    assert scheduler.run_once() == {'current_fresh': 1, 'forecast_fresh': 1}
+    assert fake_owm.total_calls == 0
+
+
+def test_scheduler_refreshes_expiring_entry_within_budget(fake_owm):
+    hot_cities = HotCities()
+    hot_cities.record(CURRENT, ['Abc', 'Abc', 'Def'])
+    service = WeatherService()
+    coords = service.geo_client.get_coordinates('Abc').data
+    write_entry(service.current_weather_cache_key(coords), {'temperature': 0}, CachePolicy(fresh_ttl=10, stale_ttl=60))
+    scheduler = RefreshScheduler(service=service, hot_cities=hot_cities, calls_per_minute=1, refresh_ahead=60)
+
+    stats = scheduler.run_once()
+
+    assert stats == {'current_refreshed': 1, 'budget_exceeded': 1}
+    assert service.get_current_weather('Abc').data != {'temperature': 0}
+
+
+def test_refresh_scheduler_command(fake_owm, settings):
+    settings.WEATHER_REFRESH = {**settings.WEATHER_REFRESH, 'TOP_N': 5}
+    HotCities().record(FORECAST, ['Abc'])
+    stdout = io.StringIO()
+
+    call_command('run_refresh_scheduler', once=True, stdout=stdout)
+
+    assert "'forecast_refreshed': 1" in stdout.getvalue()
+    assert fake_owm.calls[ONECALL_PATH] == 1
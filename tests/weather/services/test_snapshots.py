@@ -0,0 +1,138 @@
+import asyncio
+import io
+import time
+from datetime import date, timedelta
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from tests.fake_owm import DAY_SUMMARY_PATH, ONECALL_PATH
+from weather.models import WeatherSnapshot
+from weather.services.caching import CacheEntry, CachePolicy, arestore_fields, restore_fields, restore_hash_fields
+from weather.services.open_weather_map import WeatherService
+from weather.services.snapshots import get_snapshot_writer, record_current
+from weather.services.tiered_cache import get_tiered_cache
+
+
+@pytest.fixture
+def snapshots(settings):
+    settings.WEATHER_SNAPSHOTS = {**settings.WEATHER_SNAPSHOTS, 'ENABLED': True}
+    return get_snapshot_writer()
+
+
+def flush_redis():
+    cache.clear()
+    get_tiered_cache().local.clear()
+
+
+def test_snapshots_survive_redis_flush(fake_owm, snapshots):
+    service = WeatherService()
+    tomorrow = date.today() + timedelta(days=1)
+    current = service.get_current_weather('Abc')
+    forecast = service.get_forecast('Abc', tomorrow)
+    snapshots.flush()
+    flush_redis()
+    fake_owm.reset()
+
+    assert service.get_current_weather('Abc').data == current.data
+    assert asyncio.run(service.aget_forecast('Abc', tomorrow)).data == forecast.data
+    assert fake_owm.calls[ONECALL_PATH] == 0
+    assert fake_owm.calls[DAY_SUMMARY_PATH] == 0
+    assert set(WeatherSnapshot.objects.values_list('kind', flat=True)) == {'current', 'forecast'}
+
+
+def test_expired_snapshot_is_not_used(fake_owm, snapshots):
+    service = WeatherService()
+    service.get_current_weather('Abc')
+    snapshots.flush()
+    WeatherSnapshot.objects.update(fetched_at=timezone.now() - timedelta(days=1))
+    flush_redis()
+    fake_owm.reset()
+
+    assert service.get_current_weather('Abc').is_ok
+    assert fake_owm.calls[ONECALL_PATH] == 1
+
+
+def test_restore_weather_cache_command(fake_owm, snapshots, monkeypatch):
+    service = WeatherService()
+    dates = [date.today() + timedelta(days=offset) for offset in range(3)]
+    current = service.get_current_weather('Abc')
+    forecast = service.get_forecast_range('Abc', dates)
+    snapshots.flush()
+    flush_redis()
+    call_command('warm_geo_cache', stdout=io.StringIO())
+
+    out = io.StringIO()
+    call_command('restore_weather_cache', stdout=out)
+    fake_owm.reset()
+    # Запасной уровень выключен: значения должны прийти из Redis.
+    monkeypatch.setattr(WeatherService, '_restore_current_weather', lambda self, coords: None)
+    monkeypatch.setattr(WeatherService, '_restore_forecast', lambda self, coords, fields: {})
+
+    assert service.get_current_weather('Abc').data == current.data
+    assert service.get_forecast_range('Abc', dates) == forecast
+    assert fake_owm.total_calls == 0
+    assert 'current weather for 1 of 1 locations' in out.getvalue()
+
+
+def test_writer_survives_unexpected_errors(transactional_db, snapshots, monkeypatch):
+    write = snapshots._write
+
+    def fail_once(batch):
+        monkeypatch.setattr(snapshots, '_write', write)
+        raise ValueError('Unexpected partition name')
+
+    monkeypatch.setattr(snapshots, '_write', fail_once)
+    record_current('1', {'temperature': 1.5})
+    snapshots.flush()
+    record_current('1', {'temperature': 2.5})
+    snapshots.flush()
+
+    assert list(WeatherSnapshot.objects.values_list('data', flat=True)) == [{'temperature': 2.5}]
+
+
+def test_restored_hash_lives_as_long_as_its_latest_field():
+    policy = CachePolicy(fresh_ttl=600, stale_ttl=600)
+    # Значение получено 900 секунд назад: хранить его осталось 300 секунд.
+    entry = CacheEntry(data={'min': 1.5, 'max': 2.5}, fresh_until=time.time() - 300)
+    redis = get_redis_connection('default')
+
+    assert restore_hash_fields({'restored': {'01.01.2025': entry}}, policy) == 1
+    assert 250 < redis.ttl(cache.make_key('restored')) <= 300
+
+    redis.expire(cache.make_key('restored'), 1000)
+    assert restore_hash_fields({'restored': {'02.01.2025': entry}}, policy) == 1
+    assert redis.ttl(cache.make_key('restored')) > 900
+
+
+def test_restored_fields_do_not_extend_hash_to_full_timeout():
+    policy = CachePolicy(fresh_ttl=600, stale_ttl=600)
+    entry = CacheEntry(data={'min': 1.5, 'max': 2.5}, fresh_until=time.time() - 300)
+    redis = get_redis_connection('default')
+    redis.hset(cache.make_key('restored'), 'kept', 'value')
+    redis.expire(cache.make_key('restored'), 100)
+
+    assert restore_fields('restored', ['01.01.2025'], lambda fields: {'01.01.2025': entry}, policy)
+    assert 250 < redis.ttl(cache.make_key('restored')) <= 300
+
+    async def restore(fields):
+        return {'02.01.2025': entry}
+
+    assert asyncio.run(arestore_fields('restored', ['02.01.2025'], restore, policy))
+    assert 250 < redis.ttl(cache.make_key('restored')) <= 300
+    assert redis.hlen(cache.make_key('restored')) == 3
+
+
+def test_prune_weather_snapshots_command(db):
+    now = timezone.now()
+    for days_ago in (0, 3, 10):
+        WeatherSnapshot.objects.create(
+            location='1', kind=WeatherSnapshot.CURRENT, data={}, fetched_at=now - timedelta(days=days_ago)
+        )
+
+    call_command('prune_weather_snapshots', retention_days=7, stdout=io.StringIO())
+
+    assert WeatherSnapshot.objects.count() == 2
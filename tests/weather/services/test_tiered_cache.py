@@ -0,0 +1,143 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.client import Pipeline
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from tests.helpers import count_round_trips
+from weather.services.tiered_cache import CacheSession, LocalCache, TieredCache, cache_session, get_tiered_cache
+
+
+@pytest.fixture
+def workers():
+    caches = [TieredCache(channel='test_invalidate'), TieredCache(channel='test_invalidate')]
+    for tiered in caches:
+        tiered.start_listener()
+        assert tiered.subscribed.wait(5)
+    yield caches
+    for tiered in caches:
+        tiered.stop_listener()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_size=2)
+    local.set('a', 1)
+    local.set('b', 2)
+    local.get('a')
+    local.set('c', 3)
+
+    assert local.get('b') is None
+    assert local.get('a') == 1
+    assert local.counters['evictions'] == 1
+
+
+def test_local_cache_expires_entries():
+    local = LocalCache(ttl=0.05)
+    local.set('a', 1)
+    time.sleep(0.1)
+
+    assert local.get('a') is None
+
+
+def test_publish_swallows_only_redis_errors():
+    tiered = TieredCache(channel='test_invalidate')
+
+    with patch('redis.client.Redis.publish', side_effect=RedisConnectionError('down')):
+        tiered.delete('key')
+    with patch('redis.client.Redis.publish', side_effect=TypeError('bug')), pytest.raises(TypeError):
+        tiered.delete('key')
+
+
+def test_second_read_is_served_from_l1(workers):
+    first, _ = workers
+    first.set('key', {'value': 1})
+    first.local.clear()
+
+    assert first.get('key') == {'value': 1}
+    assert first.get('key') == {'value': 1}
+    assert first.stats()['l1']['hits'] == 1
+    assert first.stats()['l2']['hits'] == 1
+
+
+def test_rewrite_invalidates_other_workers(workers):
+    first, second = workers
+    first.set('key', {'value': 1})
+    assert second.get('key') == {'value': 1}
+
+    first.set('key', {'value': 2})
+
+    assert wait_for(lambda: second.local.get('key') is None)
+    assert second.get('key') == {'value': 2}
+
+
+def test_fields_of_many_hashes_are_read_in_one_round_trip(workers):
+    first, second = workers
+    first.set_fields('hash_a', {'1': {'value': 1}, '2': {'value': 2}}, timeout=60)
+    first.set_fields('hash_b', {'1': {'value': 3}}, timeout=60)
+
+    with patch('redis.client.Pipeline.execute', autospec=True, side_effect=Pipeline.execute) as execute:
+        values = second.get_fields({'hash_a': ['1', '2', '3'], 'hash_b': ['1']})
+
+    assert values == {'hash_a': {'1': {'value': 1}, '2': {'value': 2}}, 'hash_b': {'1': {'value': 3}}}
+    assert execute.call_count == 1
+
+
+def test_deleted_fields_are_invalidated_on_other_workers(workers):
+    first, second = workers
+    first.set_fields('hash', {'old': {'value': 1}}, timeout=60)
+    assert second.get_fields({'hash': ['old']}) == {'hash': {'old': {'value': 1}}}
+
+    first.set_fields('hash', {'new': {'value': 2}}, timeout=60, delete=['old'])
+
+    assert wait_for(lambda: second.local.get('hash:old') is None)
+    assert second.get_fields({'hash': ['old', 'new']}) == {'hash': {'new': {'value': 2}}}
+
+
+def test_session_reads_and_writes_in_one_round_trip_each():
+    tiered = get_tiered_cache()
+    # Первый вызов загружает скрипт в Redis.
+    tiered.prefetch(CacheSession(), keys=['warmup'])
+    tiered.set('present', {'value': 1})
+    tiered.local.clear()
+
+    with count_round_trips() as counter, cache_session() as session:
+        tiered.prefetch(session, keys=['present', 'missing'])
+        assert tiered.get('present') == {'value': 1}
+        assert tiered.get('missing') is None
+        assert session.holds_lease('missing')
+        tiered.set('missing', {'value': 2}, timeout=60)
+        assert tiered.get('missing') == {'value': 2}
+
+    assert counter['round_trips'] == 2
+    assert cache.get('missing') == {'value': 2}
+    assert cache.get('lock_missing') is None
+
+
+def test_session_follows_location_link():
+    tiered = get_tiered_cache()
+    get_redis_connection('default').set(cache.client.make_key('link_city'), '42')
+    tiered.set('weather_42', {'value': 1})
+    tiered.set_fields('forecast_42', {'01.01.2025': {'min': 1}}, timeout=60)
+    tiered.local.clear()
+
+    with cache_session() as session:
+        tiered.prefetch(session, link='link_city', linked={'weather_': None, 'forecast_': ['01.01.2025', '02.01.2025']})
+
+        assert session.links == {'link_city': '42'}
+        assert session.values == {'weather_42': {'value': 1}}
+        assert session.fields == {'forecast_42': {'01.01.2025': {'min': 1}, '02.01.2025': None}}
+        assert session.leases == {'forecast_42_02.01.2025'}
+
+    assert cache.get('lock_forecast_42_02.01.2025') is None
@@ -0,0 +1,178 @@
+import marshal
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.test import AsyncClient
+from django.urls import reverse
+
+from weather.middleware import ProfilingMiddleware
+from weather.services.forecast import save_forecast_override
+from weather.services.open_weather_map import ServiceResult
+from weather.services.profiling import PROFILE_HEADER, PROFILE_ID_HEADER
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_cached_response_skips_view(mock_get_weather, client):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+
+    first = client.get(reverse('current-weather'), {'city': 'BlaBla'})
+    second = client.get(reverse('current-weather'), {'city': ' blabla  '})
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second['ETag'] == first['ETag']
+    assert second.has_header('Last-Modified')
+    mock_get_weather.assert_called_once()
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_conditional_get_returns_not_modified(mock_get_weather, client):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+    first = client.get(reverse('current-weather'), {'city': 'BlaBla'})
+
+    by_etag = client.get(reverse('current-weather'), {'city': 'BlaBla'}, HTTP_IF_NONE_MATCH=first['ETag'])
+    by_date = client.get(reverse('current-weather'), {'city': 'BlaBla'}, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+    changed = client.get(reverse('current-weather'), {'city': 'BlaBla'}, HTTP_IF_NONE_MATCH='"other"')
+
+    assert by_etag.status_code == 304
+    assert by_etag.content == b''
+    assert by_date.status_code == 304
+    assert changed.status_code == 200
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_cached_response_keeps_format_and_headers(mock_get_weather, client):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+    url = reverse('current-weather')
+    first = client.get(url, {'city': 'BlaBla'})
+
+    cached = client.get(url, {'city': 'BlaBla'})
+    html = client.get(url, {'city': 'BlaBla'}, HTTP_ACCEPT='text/html')
+    not_modified = client.get(url, {'city': 'BlaBla'}, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    for name in ('Content-Type', 'Vary', 'Allow', 'X-Frame-Options'):
+        assert cached[name] == first[name]
+    assert html['Content-Type'].startswith('text/html')
+    assert not_modified['Vary'] == first['Vary']
+    assert mock_get_weather.call_count == 2
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_error_response_is_not_cached(mock_get_weather, client):
+    mock_get_weather.return_value = ServiceResult.fail('City not found')
+
+    client.get(reverse('current-weather'), {'city': 'BlaBla'})
+    response = client.get(reverse('current-weather'), {'city': 'BlaBla'})
+
+    assert response.status_code == 400
+    assert not response.has_header('ETag')
+    assert mock_get_weather.call_count == 2
+
+
+def test_override_write_invalidates_forecast_response(fake_owm, client, today):
+    params = {'city': 'BlaBla', 'date': today}
+    client.get(reverse('forecast-weather'), params)
+
+    save_forecast_override({'city': 'BlaBla', 'date': date.today(), 'min_temperature': -50, 'max_temperature': 50})
+    response = client.get(reverse('forecast-weather'), params)
+
+    assert response.json() == {'min_temperature': -50, 'max_temperature': 50}
+
+
+@patch('weather.views.WeatherService.aget_current_weather')
+def test_async_route_shares_cached_response(mock_aget_weather, client):
+    mock_aget_weather.return_value = ServiceResult.ok({'temperature': 1, 'local_time': '00:00'})
+
+    first = async_to_sync(AsyncClient().get)(reverse('current-weather-async'), {'city': 'BlaBla'})
+    second = client.get(reverse('current-weather'), {'city': 'BlaBla'}, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    mock_aget_weather.assert_called_once()
+
+
+def test_upstream_deadline_covers_request(fake_owm, client, settings):
+    settings.OPENWEATHERMAP_HTTP = {**settings.OPENWEATHERMAP_HTTP, 'DEADLINE': 0}
+
+    response = client.get(reverse('current-weather'), {'city': 'Abc'})
+
+    assert response.status_code == 400
+    assert fake_owm.total_calls == 0
+
+
+@pytest.fixture
+def profiling(settings):
+    settings.WEATHER_PROFILING = {**settings.WEATHER_PROFILING, 'ENABLED': True, 'TOKEN': 'secret'}
+    return settings.WEATHER_PROFILING
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_requested_profile_can_be_downloaded(mock_get_weather, client, profiling):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+
+    plain = client.get(reverse('current-weather'), {'city': 'Moscow'})
+    response = client.get(reverse('current-weather'), {'city': 'Paris'}, HTTP_X_WEATHER_PROFILE='secret')
+
+    assert not plain.has_header(PROFILE_ID_HEADER)
+    profile_id = response[PROFILE_ID_HEADER]
+    profiles = client.get(reverse('profiles'), HTTP_X_WEATHER_PROFILE='secret').json()['profiles']
+    assert [(profile['id'], profile['reason'], profile['status']) for profile in profiles] == [
+        (profile_id, 'requested', 200)
+    ]
+
+    url = reverse('profile-download', args=[profile_id])
+    stats = marshal.loads(client.get(url, HTTP_X_WEATHER_PROFILE='secret').content)
+    assert any(name == 'get' and path.endswith('views.py') for path, _, name in stats)
+    assert 'cumulative' in client.get(url, {'format': 'text'}, HTTP_X_WEATHER_PROFILE='secret').content.decode()
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_sampled_profiles_are_bounded(mock_get_weather, client, profiling):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+    profiling.update({'SAMPLE_RATE': 1, 'BUFFER_SIZE': 2})
+
+    ids = [client.get(reverse('current-weather'), {'city': city})[PROFILE_ID_HEADER] for city in ('A', 'B', 'C')]
+
+    profiles = client.get(reverse('profiles'), HTTP_X_WEATHER_PROFILE='secret').json()['profiles']
+    assert [profile['id'] for profile in profiles] == ids[:0:-1]
+    assert {profile['reason'] for profile in profiles} == {'sampled'}
+
+
+@patch('weather.views.WeatherService.get_current_weather')
+def test_profiling_requires_token(mock_get_weather, client, profiling, settings):
+    mock_get_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+
+    response = client.get(reverse('current-weather'), {'city': 'Paris'}, HTTP_X_WEATHER_PROFILE='wrong')
+
+    assert not response.has_header(PROFILE_ID_HEADER)
+    assert client.get(reverse('profiles'), HTTP_X_WEATHER_PROFILE='wrong').status_code == 404
+
+    settings.WEATHER_PROFILING = {**profiling, 'ENABLED': False}
+    assert client.get(reverse('profiles'), HTTP_X_WEATHER_PROFILE='secret').status_code == 404
+
+
+@patch('weather.views.WeatherService.aget_current_weather')
+@patch('weather.views.WeatherService.get_current_weather')
+def test_profiling_under_asgi(mock_get_weather, mock_aget_weather, client, profiling):
+    mock_get_weather.return_value = mock_aget_weather.return_value = ServiceResult.ok(
+        {'temperature': 0, 'local_time': '00:00'}
+    )
+    async_client = AsyncClient()
+
+    async def get_response(request):
+        pass
+
+    # Цепочка остается асинхронной: невыбранный запрос не уходит в поток синхронного кода.
+    assert iscoroutinefunction(ProfilingMiddleware(get_response))
+    plain = async_to_sync(async_client.get)(reverse('current-weather-async'), {'city': 'Moscow'})
+    response = async_to_sync(async_client.get)(
+        reverse('current-weather'), {'city': 'Paris'}, headers={PROFILE_HEADER: 'secret'}
+    )
+
+    assert plain.status_code == 200
+    assert not plain.has_header(PROFILE_ID_HEADER)
+    url = reverse('profile-download', args=[response[PROFILE_ID_HEADER]])
+    stats = marshal.loads(client.get(url, HTTP_X_WEATHER_PROFILE='secret').content)
+    assert any(name == 'get' and path.endswith('views.py') for path, _, name in stats)
@@ -72,6 +72,7 @@ def test_forecast_data_in_the_past(client, forecast_response_params_data_in_the_
 
 @patch('weather.views.save_forecast_override')
 def test_forecast_save_success(mock_save, client, forecast_response_correct_body):
+    mock_save.return_value = (False, {})
     response = client.post(reverse('forecast-weather'), forecast_response_correct_body, format='json')
 
     assert response.status_code == 200
@@ -101,3 +102,87 @@ def test_forecast_save_in_the_past(client, forecast_response_body_data_in_the_pa
 
     assert response.status_code == 400
     assert 'date' in response.data
+
+
+@pytest.mark.django_db
+@patch('weather.views.get_forecast_range')
+def test_forecast_range_success(mock_get_forecast_range, client, forecast_range_params):
+    mock_get_forecast_range.return_value = (False, {'BlaBla': []})
+    response = client.get(reverse('forecast-range'), forecast_range_params)
+
+    assert response.status_code == 200
+    assert 'BlaBla' in response.data
+    assert mock_get_forecast_range.call_args.args[0]['city'] == ['BlaBla', 'Other']
+
+
+@pytest.mark.django_db
+def test_forecast_range_reversed_dates(client, forecast_range_params):
+    forecast_range_params['date_from'], forecast_range_params['date_to'] = (
+        forecast_range_params['date_to'],
+        forecast_range_params['date_from'],
+    )
+    response = client.get(reverse('forecast-range'), forecast_range_params)
+
+    assert response.status_code == 400
+    assert 'date_from' in response.data
+
+
+@patch('weather.views.WeatherService.aget_current_weather')
+def test_current_weather_async_success(mock_aget_weather, client, weather_response_params):
+    mock_aget_weather.return_value = ServiceResult.ok({'temperature': 0, 'local_time': '00:00'})
+    response = client.get(reverse('current-weather-async'), weather_response_params)
+
+    assert response.status_code == 200
+    assert response.json() == {'temperature': 0, 'local_time': '00:00'}
+
+
+def test_current_weather_async_missing_city(client):
+    response = client.get(reverse('current-weather-async'))
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'city parameter is required'
+
+
+@pytest.mark.django_db
+@patch('weather.views.aget_forecast')
+def test_forecast_async_success(mock_aget_forecast, client, forecast_response_correct_params):
+    mock_aget_forecast.return_value = (False, {'min_temperature': 0, 'max_temperature': 1})
+    response = client.get(reverse('forecast-weather-async'), forecast_response_correct_params)
+
+    assert response.status_code == 200
+    assert response.json() == {'min_temperature': 0, 'max_temperature': 1}
+
+
+def test_forecast_async_data_too_far(client, forecast_response_params_data_too_far):
+    response = client.get(reverse('forecast-weather-async'), forecast_response_params_data_too_far)
+
+    assert response.status_code == 400
+    assert 'date' in response.json()
+
+
+@patch('weather.views.WeatherService.get_current_weather_bulk')
+def test_current_weather_bulk_partial_success(mock_bulk, client):
+    mock_bulk.return_value = {
+        'BlaBla': ServiceResult.ok({'temperature': 0, 'local_time': '00:00'}),
+        'Nowhere': ServiceResult.fail('City Nowhere not found.'),
+    }
+    response = client.get(reverse('current-weather-bulk'), {'city': ['BlaBla', 'Nowhere']})
+
+    assert response.status_code == 200
+    assert 'temperature' in response.data['BlaBla']
+    assert 'error' in response.data['Nowhere']
+
+
+@patch('weather.views.WeatherService.get_current_weather_bulk')
+def test_current_weather_bulk_all_failed(mock_bulk, client):
+    mock_bulk.return_value = {'Nowhere': ServiceResult.fail('City Nowhere not found.')}
+    response = client.get(reverse('current-weather-bulk'), {'city': 'Nowhere'})
+
+    assert response.status_code == 400
+
+
+def test_current_weather_bulk_missing_city(client):
+    response = client.get(reverse('current-weather-bulk'))
+
+    assert response.status_code == 400
+    assert 'city' in response.data
@@ -1,5 +1,35 @@
+from django import forms
 from django.contrib import admin
 
-from .models import ForecastOverride
+from .models import CityAlias, ForecastOverride, GeoLocation, WeatherSnapshot
+from .services.open_weather_map import GeoService
 
-admin.site.register(ForecastOverride)
+
+class ForecastOverrideForm(forms.ModelForm):
+    class Meta:
+        model = ForecastOverride
+        fields = ('city', 'location', 'date', 'min_temperature', 'max_temperature')
+
+    def clean(self):
+        """Место города определяется геокодером, если его не выбрали.
+
+        Город, который найти не удалось, сохраняется без места и применяется по названию.
+        """
+        cleaned_data = super().clean()
+        if not cleaned_data.get('location') and cleaned_data.get('city'):
+            coords_result = GeoService().get_coordinates(cleaned_data['city'])
+            location_id = coords_result.data.get('location_id') if coords_result.is_ok else None
+            if location_id:
+                cleaned_data['location'] = GeoLocation.objects.filter(pk=location_id).first()
+        return cleaned_data
+
+
+@admin.register(ForecastOverride)
+class ForecastOverrideAdmin(admin.ModelAdmin):
+    form = ForecastOverrideForm
+    list_display = ('city', 'location', 'date', 'min_temperature', 'max_temperature')
+
+
+admin.site.register(GeoLocation)
+admin.site.register(CityAlias)
+admin.site.register(WeatherSnapshot)
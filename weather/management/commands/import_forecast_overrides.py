@@ -0,0 +1,35 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.serializers import ForecastOverrideSerializer
+from weather.services.forecast import bulk_save_forecast_overrides
+
+
+class Command(BaseCommand):
+    help = 'Импорт переопределений прогноза из CSV (city,date,min_temperature,max_temperature; дата ДД.ММ.ГГГГ)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as file:
+                records = list(csv.DictReader(file))
+        except OSError as err:
+            raise CommandError(f'Cannot read {options["path"]} - {err}')
+
+        rows = []
+        for line, record in enumerate(records, start=2):
+            serializer = ForecastOverrideSerializer(data=record)
+            if serializer.is_valid():
+                rows.append(serializer.validated_data)
+            else:
+                self.stderr.write(f'Line {line} skipped: {dict(serializer.errors)}')
+
+        saved, errors = bulk_save_forecast_overrides(rows, batch_size=options['batch_size'])
+        for city, city_errors in errors.items():
+            self.stderr.write(f'City {city} skipped: {city_errors}')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {saved} forecast overrides'))
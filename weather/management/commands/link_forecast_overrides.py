@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from weather.models import ForecastOverride
+from weather.services.open_weather_map import GeoService
+from weather.services.overrides import invalidate_overrides
+
+
+class Command(BaseCommand):
+    help = 'Привязка переопределений прогноза без места к местам их городов через геокодер'
+
+    def handle(self, *args, **options):
+        geo_service = GeoService()
+        unresolved, linked = {}, 0
+
+        for override in ForecastOverride.objects.filter(location__isnull=True).order_by('id'):
+            coords_result = geo_service.get_coordinates(override.city)
+            location_id = coords_result.data.get('location_id') if coords_result.is_ok else None
+            if not location_id:
+                unresolved[override.city] = coords_result.errors or {'error': 'Location storage is unavailable'}
+                continue
+
+            with transaction.atomic():
+                linked_override = (
+                    ForecastOverride.objects.select_for_update()
+                    .filter(location_id=location_id, date=override.date)
+                    .first()
+                )
+                if linked_override is None:
+                    ForecastOverride.objects.filter(pk=override.pk).update(location_id=location_id, city_key=None)
+                else:
+                    # Для места и даты уже есть привязанная запись: остается более новое значение.
+                    if override.updated_at > linked_override.updated_at:
+                        ForecastOverride.objects.filter(pk=linked_override.pk).update(
+                            city=override.city,
+                            min_temperature=override.min_temperature,
+                            max_temperature=override.max_temperature,
+                            updated_at=override.updated_at,
+                        )
+                    override.delete()
+                linked += 1
+                transaction.on_commit(lambda day=override.date: invalidate_overrides([day]))
+
+        self.stdout.write(self.style.SUCCESS(f'Linked {linked} forecast overrides'))
+        if unresolved:
+            details = '; '.join(f'{city}: {errors}' for city, errors in unresolved.items())
+            raise CommandError(f'Cannot resolve {len(unresolved)} cities, overrides stay matched by name - {details}')
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weather.services.snapshots import prune_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Удаление старых снимков погоды WeatherSnapshot (в MySQL — секций по дням) и добавление секций вперед'
+
+    def add_arguments(self, parser):
+        options = settings.WEATHER_SNAPSHOTS
+        parser.add_argument('--retention-days', type=int, default=options['RETENTION_DAYS'])
+        parser.add_argument('--partitions-ahead', type=int, default=options['PARTITIONS_AHEAD'])
+
+    def handle(self, *args, **options):
+        pruned = prune_snapshots(options['retention_days'], options['partitions_ahead'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned weather snapshots: {pruned}'))
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from weather.models import WeatherSnapshot
+from weather.services.caching import CacheEntry, get_policy, restore_entries, restore_hash_fields
+from weather.services.open_weather_map import CURRENT_WEATHER_PREFIX, FORECAST_PREFIX, WeatherService
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнение кеша текущей погоды и прогнозов последними снимками WeatherSnapshot после сброса Redis; '
+        'ключи, которые уже есть в Redis, не перезаписываются. Координаты городов загружает warm_geo_cache'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        current_policy, forecast_policy = get_policy(CURRENT_WEATHER_PREFIX), get_policy(FORECAST_PREFIX)
+
+        # Последний снимок на ключ (и день прогноза) в пределах срока хранения ключа в кеше.
+        current, forecast = {}, {}
+        for kind, policy, latest in (
+            (WeatherSnapshot.CURRENT, current_policy, current),
+            (WeatherSnapshot.FORECAST, forecast_policy, forecast),
+        ):
+            since = timezone.now() - timedelta(seconds=policy.timeout)
+            snapshots = WeatherSnapshot.objects.filter(kind=kind, fetched_at__gt=since).order_by('fetched_at')
+            for snapshot in snapshots.iterator(chunk_size=batch_size):
+                entry = CacheEntry(data=snapshot.data, fresh_until=snapshot.fetched_at.timestamp() + policy.fresh_ttl)
+                latest[snapshot.location, snapshot.date] = entry
+
+        restored_keys = 0
+        entries = {f'{CURRENT_WEATHER_PREFIX}{location}': entry for (location, _), entry in current.items()}
+        keys = list(entries)
+        for start in range(0, len(keys), batch_size):
+            restored_keys += restore_entries(
+                {key: entries[key] for key in keys[start : start + batch_size]}, current_policy
+            )
+
+        fields_by_key = {}
+        for (location, day), entry in forecast.items():
+            fields_by_key.setdefault(f'{FORECAST_PREFIX}{location}', {})[WeatherService.forecast_field(day)] = entry
+        restored_fields = 0
+        keys = list(fields_by_key)
+        for start in range(0, len(keys), batch_size):
+            batch = {key: fields_by_key[key] for key in keys[start : start + batch_size]}
+            restored_fields += restore_hash_fields(batch, forecast_policy)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Restored current weather for {restored_keys} of {len(current)} locations '
+                f'and {restored_fields} of {len(forecast)} forecast days'
+            )
+        )
@@ -0,0 +1,28 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from weather.services.refresh_scheduler import RefreshScheduler
+
+
+class Command(BaseCommand):
+    help = 'Фоновое обновление кеша погоды для самых запрашиваемых городов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить один проход и завершиться')
+
+    def handle(self, *args, **options):
+        scheduler = RefreshScheduler.from_settings()
+        if options['once']:
+            stats = scheduler.run_once()
+            self.stdout.write(self.style.SUCCESS(f'Refresh pass finished - {dict(stats)}'))
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        self.stdout.write(f'Refreshing top {scheduler.top_n} cities every {scheduler.interval} s')
+        try:
+            scheduler.run(stop)
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from weather.models import CityAlias
+from weather.services.caching import get_policy, write_entries, write_links
+from weather.services.locations import weather_location
+from weather.services.open_weather_map import GeoService
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Загрузка координат известных названий городов из таблицы CityAlias в кеш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        policy = get_policy(GeoService.cache_key(''))
+        batch, links, total = {}, {}, 0
+
+        aliases = CityAlias.objects.values_list('alias', 'location_id', 'location__latitude', 'location__longitude')
+        for alias, location_id, latitude, longitude in aliases.iterator(chunk_size=options['batch_size']):
+            coords = {'lat': latitude, 'lon': longitude, 'location_id': location_id}
+            batch[GeoService.cache_key(alias)] = coords
+            # Ссылка на место нужна prefetch, иначе первый запрос не найдет ключи места.
+            links[GeoService.location_link_key(alias)] = weather_location(coords)
+            if len(batch) >= options['batch_size']:
+                write_entries(batch, policy)
+                write_links(links, policy)
+                total += len(batch)
+                batch, links = {}, {}
+
+        if batch:
+            write_entries(batch, policy)
+            write_links(links, policy)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Cached coordinates for {total} city names'))
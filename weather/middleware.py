@@ -0,0 +1,214 @@
+import time
+from functools import lru_cache
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+from .services import metrics, response_cache
+from .services.deadline import request_deadline
+from .services.hot_cities import get_hot_cities
+from .services.profiling import RequestProfiler
+from .services.tiered_cache import get_tiered_cache
+
+
+class MetricsMiddleware:
+    """Длительность, статусы и число запросов в обработке; заголовок Server-Timing
+    с длительностью стадий запроса (кеш, геокодирование, обращения к API).
+
+    Стоит первым, чтобы учитывать и ответы из ResponseCacheMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.WEATHER_METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        registry, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            registry.add(metrics.REQUESTS_IN_FLIGHT, delta=-1)
+        return self._finish(request, response, registry, token, started)
+
+    async def __acall__(self, request):
+        registry, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            registry.add(metrics.REQUESTS_IN_FLIGHT, delta=-1)
+        return self._finish(request, response, registry, token, started)
+
+    @staticmethod
+    def _start() -> tuple[metrics.Metrics, object, float]:
+        registry = metrics.get_metrics()
+        registry.add(metrics.REQUESTS_IN_FLIGHT)
+        return registry, metrics.start_timings(), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, registry: metrics.Metrics, token, started: float):
+        elapsed = time.perf_counter() - started
+        timings = metrics.finish_timings(token)
+        route = _route_name(request)
+        registry.observe(metrics.REQUEST_DURATION, (('route', route),), elapsed)
+        registry.inc(metrics.REQUESTS, (('route', route), ('method', request.method), ('status', response.status_code)))
+        if settings.WEATHER_METRICS['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing({**timings, 'total': elapsed})
+        return response
+
+
+def _route_name(request) -> str:
+    """Имя маршрута для меток; ответ из кеша отдается до разбора URL, и он разбирается здесь."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return _resolve_route(request.path_info)
+    return match.url_name or 'other'
+
+
+@lru_cache(maxsize=256)
+def _resolve_route(path: str) -> str:
+    # Разбор URL стоит десятки микросекунд — столько же, сколько вся отдача ответа из кеша.
+    try:
+        return resolve(path).url_name or 'other'
+    except Resolver404:
+        return 'not_found'
+
+
+class ResponseCacheMiddleware:
+    """Кеш готовых ответов API погоды с ETag/Last-Modified.
+
+    Попадание отдается до сессий, CSRF, DRF и сервисов: сохраненные байты
+    ответа или 304 на условный GET.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        options = response_cache.route_options(request)
+        if options is None:
+            return self.get_response(request)
+
+        tiered_cache = get_tiered_cache()
+        key = response_cache.cache_key(request, options, response_cache.generation())
+        entry = tiered_cache.get(key)
+        if entry is not None:
+            # Обработчик не вызывается, поэтому популярность города учитывается здесь.
+            get_hot_cities().record(options['NAME'], request.GET.getlist('city'))
+            return response_cache.cached_response(request, entry)
+
+        response = self.get_response(request)
+        entry = response_cache.make_entry(response)
+        if entry is None:
+            return response
+
+        tiered_cache.set(key, entry, timeout=options['TTL'])
+        if response_cache.not_modified(request, entry):
+            return response_cache.cached_response(request, entry)
+        return response_cache.set_validators(response, entry)
+
+    async def __acall__(self, request):
+        options = response_cache.route_options(request)
+        if options is None:
+            return await self.get_response(request)
+
+        tiered_cache = get_tiered_cache()
+        key = response_cache.cache_key(request, options, await response_cache.ageneration())
+        entry = await tiered_cache.aget(key)
+        if entry is not None:
+            await get_hot_cities().arecord(options['NAME'], request.GET.getlist('city'))
+            return response_cache.cached_response(request, entry)
+
+        response = await self.get_response(request)
+        entry = response_cache.make_entry(response)
+        if entry is None:
+            return response
+
+        await tiered_cache.aset(key, entry, timeout=options['TTL'])
+        if response_cache.not_modified(request, entry):
+            return response_cache.cached_response(request, entry)
+        return response_cache.set_validators(response, entry)
+
+
+class UpstreamDeadlineMiddleware:
+    """Общий срок обращений к OpenWeatherMap за время одного запроса к API.
+
+    Геокодирование и запрос погоды делят OPENWEATHERMAP_HTTP['DEADLINE'] секунд;
+    по истечении срока обращения к upstream сразу завершаются ошибкой.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with request_deadline(settings.OPENWEATHERMAP_HTTP['DEADLINE']):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_deadline(settings.OPENWEATHERMAP_HTTP['DEADLINE']):
+            return await self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """cProfile выбранных запросов к обработчикам погоды (WEATHER_PROFILING).
+
+    Стоит последним, поэтому в профиль попадает вызов обработчика, а не остальная
+    цепочка. Выключенный не входит в цепочку вовсе. Под ASGI в поток синхронного
+    кода уходят только выбранные запросы: cProfile видит лишь свой поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.WEATHER_PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.profiler = RequestProfiler.from_settings()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        reason = self.profiler.reason(request)
+        if reason is None:
+            return self.get_response(request)
+        return self.profiler.profile(request, self.get_response, reason)
+
+    async def __acall__(self, request):
+        reason = self.profiler.reason(request)
+        if reason is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.profiler.profile)(request, async_to_sync(self.get_response), reason)
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_city_name(city: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', city).split()).casefold()
+
+
+def create_aliases(apps, schema_editor):
+    """Названия из GeoLocation становятся алиасами, места с одинаковыми координатами объединяются."""
+    GeoLocation = apps.get_model('weather', 'GeoLocation')
+    CityAlias = apps.get_model('weather', 'CityAlias')
+    ForecastOverride = apps.get_model('weather', 'ForecastOverride')
+
+    canonical = {}
+    for location in GeoLocation.objects.order_by('id'):
+        target = canonical.setdefault((location.latitude, location.longitude), location)
+        CityAlias.objects.get_or_create(
+            alias=normalize_city_name(location.normalized_name), defaults={'location': target}
+        )
+        if target.pk != location.pk:
+            location.delete()
+
+    aliases = dict(CityAlias.objects.values_list('alias', 'location_id'))
+    for override in ForecastOverride.objects.filter(location__isnull=True):
+        location_id = aliases.get(normalize_city_name(override.city))
+        if location_id:
+            ForecastOverride.objects.filter(pk=override.pk).update(location_id=location_id)
+
+
+class Migration(migrations.Migration):
+    dependencies = (('weather', '0003_geolocation'),)
+
+    operations = (
+        migrations.CreateModel(
+            name='CityAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=255, unique=True)),
+                (
+                    'location',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='weather.geolocation'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='forecastoverride',
+            name='location',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='forecast_overrides',
+                to='weather.geolocation',
+            ),
+        ),
+        migrations.RunPython(create_aliases, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='geolocation',
+            name='normalized_name',
+        ),
+        migrations.AddConstraint(
+            model_name='geolocation',
+            constraint=models.UniqueConstraint(fields=('latitude', 'longitude'), name='unique_geolocation_coordinates'),
+        ),
+    )
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicates(apps, schema_editor):
+    """Из повторяющихся переопределений места на дату остается последнее записанное."""
+    ForecastOverride = apps.get_model('weather', 'ForecastOverride')
+
+    duplicates = (
+        ForecastOverride.objects.filter(location__isnull=False)
+        .values('location', 'date')
+        .annotate(count=Count('id'), last_id=Max('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        ForecastOverride.objects.filter(location=duplicate['location'], date=duplicate['date']).exclude(
+            id=duplicate['last_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = (('weather', '0004_city_alias'),)
+
+    operations = (
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='forecastoverride',
+            constraint=models.UniqueConstraint(
+                fields=('location', 'date'), name='unique_forecast_override_location_date'
+            ),
+        ),
+    )
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:24
+
+from datetime import UTC, datetime, timedelta
+
+from django.db import migrations, models
+
+# Секции на сегодня и дни вперед; следующие добавляет prune_weather_snapshots.
+INITIAL_PARTITION_DAYS = 7
+
+
+def partition_by_day(apps, schema_editor):
+    """MySQL: секция на каждый день fetched_at и pmax для более поздних строк."""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+
+    table = schema_editor.quote_name(apps.get_model('weather', 'WeatherSnapshot')._meta.db_table)
+    today = datetime.now(UTC).date()
+    days = [today + timedelta(days=offset) for offset in range(INITIAL_PARTITION_DAYS)]
+    partitions = [f"PARTITION p{day:%Y%m%d} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1)}'))" for day in days]
+    # Ключ секционирования должен входить в каждый уникальный ключ таблицы.
+    schema_editor.execute(f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, fetched_at)')
+    schema_editor.execute(
+        f'ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(fetched_at)) '
+        f'({", ".join(partitions)}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = (('weather', '0005_forecastoverride_unique_location_date'),)
+
+    operations = (
+        migrations.CreateModel(
+            name='WeatherSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=64)),
+                (
+                    'kind',
+                    models.CharField(choices=[('current', 'Current weather'), ('forecast', 'Forecast')], max_length=16),
+                ),
+                ('date', models.DateField(blank=True, null=True)),
+                ('data', models.JSONField()),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['location', 'kind', 'date', 'fetched_at'], name='weather_snapshot_lookup'),
+                    models.Index(fields=['fetched_at'], name='weather_snapshot_fetched_at'),
+                ],
+            },
+        ),
+        migrations.RunPython(partition_by_day, migrations.RunPython.noop),
+    )
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:13
+
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def fill_city_keys(apps, schema_editor):
+    """Ключ записей без места — нормализованное название; из повторов города на дату остается последняя запись."""
+    ForecastOverride = apps.get_model('weather', 'ForecastOverride')
+
+    for override in ForecastOverride.objects.filter(location__isnull=True).only('city'):
+        # Как normalize_city_name: NFKC, без регистра и лишних пробелов.
+        override.city_key = ' '.join(unicodedata.normalize('NFKC', override.city).split()).casefold()
+        override.save(update_fields=['city_key'])
+
+    duplicates = (
+        ForecastOverride.objects.filter(city_key__isnull=False)
+        .values('city_key', 'date')
+        .annotate(count=Count('id'), last_id=Max('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        ForecastOverride.objects.filter(city_key=duplicate['city_key'], date=duplicate['date']).exclude(
+            id=duplicate['last_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = (('weather', '0006_weathersnapshot'),)
+
+    operations = (
+        migrations.AddField(
+            model_name='forecastoverride',
+            name='city_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(fill_city_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='forecastoverride',
+            constraint=models.UniqueConstraint(fields=('city_key', 'date'), name='unique_forecast_override_city_date'),
+        ),
+    )
@@ -0,0 +1,15 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = (('weather', '0007_forecastoverride_unique_city_date'),)
+
+    operations = (
+        migrations.AddField(
+            model_name='forecastoverride',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    )
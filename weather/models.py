@@ -1,11 +1,78 @@
 from django.db import models
 
 
+class GeoLocation(models.Model):
+    name = models.CharField(max_length=255)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=['latitude', 'longitude'], name='unique_geolocation_coordinates'),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.latitude}, {self.longitude})'
+
+
+class CityAlias(models.Model):
+    alias = models.CharField(max_length=255, unique=True)
+    location = models.ForeignKey(GeoLocation, on_delete=models.CASCADE, related_name='aliases')
+
+    def __str__(self) -> str:
+        return f'{self.alias} -> {self.location_id}'
+
+
 class ForecastOverride(models.Model):
     city = models.CharField(max_length=255)
+    location = models.ForeignKey(
+        GeoLocation, on_delete=models.CASCADE, related_name='forecast_overrides', null=True, blank=True
+    )
+    # Нормализованное название города у записи без места (заполняет сигнал pre_save), у привязанной — NULL.
+    # NULL не конфликтуют, поэтому уникальность (city_key, date) касается только записей по названию.
+    # Условный уникальный индекс (condition=Q(location__isnull=True)) MySQL не поддерживает.
+    city_key = models.CharField(max_length=255, null=True, blank=True, editable=False)
     date = models.DateField()
     min_temperature = models.FloatField()
     max_temperature = models.FloatField()
+    # Из записи по названию и привязанной записи того же места и даты действует более новая.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=['location', 'date'], name='unique_forecast_override_location_date'),
+            models.UniqueConstraint(fields=['city_key', 'date'], name='unique_forecast_override_city_date'),
+        )
 
     def __str__(self) -> str:
         return f'{self.city} -> {self.date}'
+
+
+class WeatherSnapshot(models.Model):
+    """Полученные от API текущая погода и прогноз на день — запасной источник для кеша.
+
+    Таблица только дописывается. В MySQL она секционирована по дням fetched_at
+    (миграция 0006), старые секции удаляет prune_weather_snapshots, поэтому
+    внешних ключей у нее нет: место задано строкой из ключей кеша.
+    """
+
+    CURRENT = 'current'
+    FORECAST = 'forecast'
+    KIND_CHOICES = ((CURRENT, 'Current weather'), (FORECAST, 'Forecast'))
+
+    location = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # День прогноза; у текущей погоды пусто.
+    date = models.DateField(null=True, blank=True)
+    data = models.JSONField()
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        indexes = (
+            models.Index(fields=['location', 'kind', 'date', 'fetched_at'], name='weather_snapshot_lookup'),
+            models.Index(fields=['fetched_at'], name='weather_snapshot_fetched_at'),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.kind} {self.location} {self.date or ""} at {self.fetched_at}'
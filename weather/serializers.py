@@ -12,6 +12,31 @@ class ForecastRequestSerializer(serializers.Serializer):
         return validate_forecast_date(value)
 
 
+class CurrentWeatherBulkRequestSerializer(serializers.Serializer):
+    city = serializers.ListField(child=serializers.CharField(), min_length=1, max_length=20)
+
+    def validate_city(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ForecastRangeRequestSerializer(serializers.Serializer):
+    city = serializers.ListField(child=serializers.CharField(), min_length=1, max_length=20)
+    date_from = serializers.DateField(input_formats=['%d.%m.%Y'])
+    date_to = serializers.DateField(input_formats=['%d.%m.%Y'])
+
+    def validate_date_from(self, value):
+        return validate_forecast_date(value)
+
+    def validate_date_to(self, value):
+        return validate_forecast_date(value)
+
+    def validate(self, data):
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError({'date_from': 'date_from must be less than or equal to date_to'})
+        data['city'] = list(dict.fromkeys(data['city']))
+        return data
+
+
 class ForecastOverrideSerializer(serializers.ModelSerializer):
     date = serializers.DateField(input_formats=['%d.%m.%Y'])
 
@@ -0,0 +1,23 @@
+import asyncio
+import weakref
+
+import redis.asyncio
+from django.conf import settings
+
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.asyncio.Redis] = weakref.WeakKeyDictionary()
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Асинхронный клиент Redis кеша по умолчанию для текущего event loop.
+
+    Пул блокирующий: при исчерпании соединений задачи ждут освобождения, а не падают.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            settings.CACHES['default']['LOCATION'],
+            max_connections=settings.WEATHER_CACHE['ASYNC_REDIS_MAX_CONNECTIONS'],
+        )
+        client = _clients[loop] = redis.asyncio.Redis(connection_pool=pool)
+    return client
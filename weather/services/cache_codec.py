@@ -0,0 +1,96 @@
+import pickle
+import struct
+from typing import Any
+
+import msgpack
+from django_redis.serializers.base import BaseSerializer
+
+# Первый байт значения — формат. Значения, записанные PickleSerializer, начинаются
+# с метки протокола pickle (0x80) и читаются как раньше.
+CURRENT_WEATHER = 0x01
+FORECAST = 0x02
+COORDINATES = 0x03
+MSGPACK = 0x04
+PICKLE = 0x80
+
+# Формат, fresh_until и поля значения (little-endian, без выравнивания).
+CURRENT_WEATHER_STRUCT = struct.Struct('<BddH')
+FORECAST_STRUCT = struct.Struct('<Bddd')
+COORDINATES_STRUCT = struct.Struct('<Bdddq')
+
+CURRENT_WEATHER_KEYS = ('temperature', 'local_time')
+FORECAST_KEYS = ('min', 'max')
+COORDINATES_KEYS = ('lat', 'lon', 'location_id')
+
+
+def _pack_envelope(data: dict, fresh_until: float) -> bytes | None:
+    """Фиксированная упаковка CacheEntry текущей погоды, прогноза и координат.
+
+    Упаковываются только дробные числа: после чтения целое 18 превратилось бы в 18.0.
+    """
+    if type(data) is not dict or type(fresh_until) is not float:
+        return None
+
+    keys = tuple(data)
+    if keys == CURRENT_WEATHER_KEYS:
+        temperature, local_time = data['temperature'], data['local_time']
+        if type(temperature) is float and type(local_time) is str and len(local_time) == 5 and local_time[2] == ':':
+            hours, minutes = local_time[:2], local_time[3:]
+            if hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60:
+                return CURRENT_WEATHER_STRUCT.pack(
+                    CURRENT_WEATHER, fresh_until, temperature, int(hours) * 60 + int(minutes)
+                )
+    elif keys == FORECAST_KEYS:
+        minimum, maximum = data['min'], data['max']
+        if type(minimum) is float and type(maximum) is float:
+            return FORECAST_STRUCT.pack(FORECAST, fresh_until, minimum, maximum)
+    elif keys == COORDINATES_KEYS:
+        lat, lon, location_id = data['lat'], data['lon'], data['location_id']
+        if type(lat) is float and type(lon) is float and type(location_id) is int:
+            return COORDINATES_STRUCT.pack(COORDINATES, fresh_until, lat, lon, location_id)
+    return None
+
+
+class CompactSerializer(BaseSerializer):
+    """Сериализатор django-redis: компактные форматы вместо pickle для значений кеша погоды.
+
+    Конверты CacheEntry текущей погоды, прогноза и координат упаковываются в
+    фиксированные структуры, остальные значения — в msgpack (если типы представимы
+    без потерь), иначе в pickle.
+    """
+
+    def __init__(self, options):
+        super().__init__(options=options)
+        version = int(options.get('PICKLE_VERSION', pickle.DEFAULT_PROTOCOL))
+        # Протоколы ниже 2 не начинаются с метки PICKLE, и формат значения было бы не определить.
+        self._pickle_version = pickle.HIGHEST_PROTOCOL if version < 0 else max(version, 2)
+
+    def dumps(self, value: Any) -> bytes:
+        if type(value) is dict and len(value) == 2 and 'data' in value and 'fresh_until' in value:
+            packed = _pack_envelope(value['data'], value['fresh_until'])
+            if packed is not None:
+                return packed
+
+        try:
+            # strict_types: кортежи и подклассы не превращаются молча в списки и словари.
+            return bytes([MSGPACK]) + msgpack.packb(value, use_bin_type=True, strict_types=True)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        return pickle.dumps(value, self._pickle_version)
+
+    def loads(self, value: bytes) -> Any:
+        tag = value[0]
+        if tag == CURRENT_WEATHER:
+            _, fresh_until, temperature, minutes = CURRENT_WEATHER_STRUCT.unpack(value)
+            data = {'temperature': temperature, 'local_time': f'{minutes // 60:02d}:{minutes % 60:02d}'}
+        elif tag == FORECAST:
+            _, fresh_until, minimum, maximum = FORECAST_STRUCT.unpack(value)
+            data = {'min': minimum, 'max': maximum}
+        elif tag == COORDINATES:
+            _, fresh_until, lat, lon, location_id = COORDINATES_STRUCT.unpack(value)
+            data = {'lat': lat, 'lon': lon, 'location_id': location_id}
+        elif tag == MSGPACK:
+            return msgpack.unpackb(value[1:], raw=False, strict_map_key=False)
+        else:
+            return pickle.loads(value)
+        return {'data': data, 'fresh_until': fresh_until}
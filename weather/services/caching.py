@@ -0,0 +1,755 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+
+from .async_redis import get_async_redis
+from .deadline import bounded, request_deadline
+from .rate_limit import without_queueing
+from .result import ServiceResult
+from .tiered_cache import current_session, detached_session, get_tiered_cache
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], ServiceResult]
+Lookup = Callable[[], ServiceResult | None]
+AsyncLoader = Callable[[], Awaitable[ServiceResult]]
+AsyncLookup = Callable[[], Awaitable[ServiceResult | None]]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Время жизни ключа: fresh_ttl — значение актуально, ещё stale_ttl — отдаётся с фоновым обновлением."""
+
+    fresh_ttl: int
+    stale_ttl: int = 0
+
+    @property
+    def timeout(self) -> int:
+        return self.fresh_ttl + self.stale_ttl
+
+
+def get_policy(key: str) -> CachePolicy:
+    """Политика кеширования для семейства ключей (по префиксу)."""
+    for prefix, options in settings.WEATHER_CACHE['POLICIES'].items():
+        if key.startswith(prefix):
+            return CachePolicy(fresh_ttl=options['FRESH_TTL'], stale_ttl=options['STALE_TTL'])
+    return CachePolicy(fresh_ttl=settings.CACHES['default']['TIMEOUT'])
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    data: dict
+    fresh_until: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+    def to_cache(self) -> dict:
+        return {'data': self.data, 'fresh_until': self.fresh_until}
+
+    @classmethod
+    def from_cache(cls, value) -> "CacheEntry | None":
+        if value is None:
+            return None
+        if isinstance(value, dict) and value.keys() == {'data', 'fresh_until'}:
+            return cls(data=value['data'], fresh_until=value['fresh_until'])
+        # Значения, записанные до появления политик, считаем актуальными до истечения их TTL.
+        return cls(data=value, fresh_until=float('inf'))
+
+
+# Запасное хранилище для промахов кеша: запись ключа или записи полей хеша по их списку.
+Restore = Callable[[], CacheEntry | None]
+RestoreFields = Callable[[list[str]], dict[str, CacheEntry]]
+AsyncRestore = Callable[[], Awaitable[CacheEntry | None]]
+AsyncRestoreFields = Callable[[list[str]], Awaitable[dict[str, CacheEntry]]]
+
+
+def read_entry(key: str, local: bool = True) -> CacheEntry | None:
+    return CacheEntry.from_cache(get_tiered_cache().get(key, local=local))
+
+
+def _restored_timeout(fresh_until: float, policy: CachePolicy) -> float:
+    # Восстановленное значение живет в кеше столько, сколько ему оставалось бы с момента получения.
+    return max(fresh_until + policy.stale_ttl - time.time(), 1)
+
+
+def write_entry(key: str, data: dict, policy: CachePolicy | None = None, fresh_until: float | None = None) -> None:
+    """Запись значения; fresh_until задается для значения, полученного раньше, чем сейчас."""
+    policy = policy or get_policy(key)
+    if fresh_until is None:
+        entry = CacheEntry(data=data, fresh_until=time.time() + policy.fresh_ttl)
+        timeout = policy.timeout
+    else:
+        entry = CacheEntry(data=data, fresh_until=fresh_until)
+        timeout = _restored_timeout(fresh_until, policy)
+    get_tiered_cache().set(key, entry.to_cache(), timeout=timeout)
+
+
+def fresh_result(key: str, local: bool = True) -> ServiceResult | None:
+    """Актуальное значение ключа из кеша."""
+    entry = read_entry(key, local=local)
+    if entry is not None and entry.is_fresh:
+        return ServiceResult.ok(entry.data)
+    return None
+
+
+def write_entries(entries: dict[str, dict], policy: CachePolicy) -> None:
+    """Запись пачки ключей одного семейства в Redis одним запросом."""
+    fresh_until = time.time() + policy.fresh_ttl
+    cache.set_many(
+        {key: CacheEntry(data=data, fresh_until=fresh_until).to_cache() for key, data in entries.items()},
+        timeout=policy.timeout,
+    )
+
+
+def write_links(links: dict[str, str], policy: CachePolicy) -> None:
+    """Запись пачки ссылок городов на места одним запросом, как их пишет сессия запроса."""
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for key, location in links.items():
+        pipeline.set(cache.client.make_key(key), location, ex=policy.timeout)
+    pipeline.execute()
+
+
+def restore_entries(entries: dict[str, CacheEntry], policy: CachePolicy) -> int:
+    """Запись в Redis восстановленных значений ключей одного семейства, которых там нет.
+
+    Значения получены раньше, чем сейчас: каждое живет по своему fresh_until.
+    Возвращает число записанных ключей.
+    """
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for key, entry in entries.items():
+        milliseconds = int(_restored_timeout(entry.fresh_until, policy) * 1000)
+        pipeline.set(cache.client.make_key(key), cache.client.encode(entry.to_cache()), px=milliseconds, nx=True)
+    return sum(bool(reply) for reply in pipeline.execute())
+
+
+def restore_hash_fields(fields_by_key: dict[str, dict[str, CacheEntry]], policy: CachePolicy) -> int:
+    """Запись в Redis восстановленных полей хешей, которых там нет; возвращает число записанных полей.
+
+    Хеш живет, пока не истечет самое позднее из восстановленных полей. Срок хеша,
+    в котором уже есть более долгие поля, не сокращается.
+    """
+    fields_by_key = {key: entries for key, entries in fields_by_key.items() if entries}
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    _queue_hash_fields(pipeline, fields_by_key, policy)
+    replies = pipeline.execute()
+    return sum(int(reply) for reply in replies[: len(replies) - 2 * len(fields_by_key)])
+
+
+async def arestore_hash_fields(fields_by_key: dict[str, dict[str, CacheEntry]], policy: CachePolicy) -> int:
+    fields_by_key = {key: entries for key, entries in fields_by_key.items() if entries}
+    async with get_async_redis().pipeline(transaction=False) as pipeline:
+        _queue_hash_fields(pipeline, fields_by_key, policy)
+        replies = await pipeline.execute()
+    return sum(int(reply) for reply in replies[: len(replies) - 2 * len(fields_by_key)])
+
+
+def _queue_hash_fields(pipeline, fields_by_key: dict[str, dict[str, CacheEntry]], policy: CachePolicy) -> None:
+    for key, entries in fields_by_key.items():
+        redis_key = cache.client.make_key(key)
+        for name, entry in entries.items():
+            pipeline.hsetnx(redis_key, name, cache.client.encode(entry.to_cache()))
+    for key, entries in fields_by_key.items():
+        redis_key = cache.client.make_key(key)
+        timeout = math.ceil(max(_restored_timeout(entry.fresh_until, policy) for entry in entries.values()))
+        # NX задает срок новому хешу, GT только продлевает уже заданный.
+        pipeline.expire(redis_key, timeout, nx=True)
+        pipeline.expire(redis_key, timeout, gt=True)
+
+
+def prefetch(
+    keys: list[str] = (),
+    fields: dict[str, list[str]] | None = None,
+    link: str | None = None,
+    linked: dict[str, list[str] | None] | None = None,
+) -> None:
+    """Ключи, которые понадобятся запросу, одним обращением к Redis (внутри cache_session)."""
+    session = current_session()
+    if session is not None:
+        lock_timeout = settings.WEATHER_CACHE['LOCK_TIMEOUT']
+        get_tiered_cache().prefetch(session, keys, fields, link, linked, lock_timeout=lock_timeout)
+
+
+async def aprefetch(
+    keys: list[str] = (),
+    fields: dict[str, list[str]] | None = None,
+    link: str | None = None,
+    linked: dict[str, list[str] | None] | None = None,
+) -> None:
+    session = current_session()
+    if session is not None:
+        lock_timeout = settings.WEATHER_CACHE['LOCK_TIMEOUT']
+        await get_tiered_cache().aprefetch(session, keys, fields, link, linked, lock_timeout=lock_timeout)
+
+
+def _field_entries(values: dict, policy: CachePolicy) -> dict[str, CacheEntry]:
+    # Хеш живет, пока в него пишут, поэтому поле старше своего срока хранения отбрасывается здесь.
+    expired_before = time.time() - policy.stale_ttl
+    entries = {name: CacheEntry.from_cache(value) for name, value in values.items()}
+    return {name: entry for name, entry in entries.items() if entry.fresh_until > expired_before}
+
+
+def read_fields(fields_by_key: dict[str, list[str]], local: bool = True) -> dict[str, dict[str, CacheEntry]]:
+    """Записи полей нескольких хешей одним обращением к Redis."""
+    values = get_tiered_cache().get_fields(fields_by_key, local=local)
+    return {key: _field_entries(key_values, get_policy(key)) for key, key_values in values.items()}
+
+
+def write_fields(key: str, data: dict[str, dict], policy: CachePolicy | None = None, delete: list[str] = ()) -> None:
+    """Запись полей хеша; хеш целиком живет policy.timeout с последней записи."""
+    policy = policy or get_policy(key)
+    fresh_until = time.time() + policy.fresh_ttl
+    values = {name: CacheEntry(data=value, fresh_until=fresh_until).to_cache() for name, value in data.items()}
+    get_tiered_cache().set_fields(key, values, timeout=policy.timeout, delete=delete)
+
+
+async def aread_entry(key: str, local: bool = True) -> CacheEntry | None:
+    return CacheEntry.from_cache(await get_tiered_cache().aget(key, local=local))
+
+
+async def awrite_entry(
+    key: str, data: dict, policy: CachePolicy | None = None, fresh_until: float | None = None
+) -> None:
+    policy = policy or get_policy(key)
+    if fresh_until is None:
+        entry = CacheEntry(data=data, fresh_until=time.time() + policy.fresh_ttl)
+        timeout = policy.timeout
+    else:
+        entry = CacheEntry(data=data, fresh_until=fresh_until)
+        timeout = _restored_timeout(fresh_until, policy)
+    await get_tiered_cache().aset(key, entry.to_cache(), timeout=timeout)
+
+
+async def afresh_result(key: str, local: bool = True) -> ServiceResult | None:
+    """Актуальное значение ключа из кеша."""
+    entry = await aread_entry(key, local=local)
+    if entry is not None and entry.is_fresh:
+        return ServiceResult.ok(entry.data)
+    return None
+
+
+async def aread_fields(fields_by_key: dict[str, list[str]], local: bool = True) -> dict[str, dict[str, CacheEntry]]:
+    values = await get_tiered_cache().aget_fields(fields_by_key, local=local)
+    return {key: _field_entries(key_values, get_policy(key)) for key, key_values in values.items()}
+
+
+async def awrite_fields(
+    key: str, data: dict[str, dict], policy: CachePolicy | None = None, delete: list[str] = ()
+) -> None:
+    policy = policy or get_policy(key)
+    fresh_until = time.time() + policy.fresh_ttl
+    values = {name: CacheEntry(data=value, fresh_until=fresh_until).to_cache() for name, value in data.items()}
+    await get_tiered_cache().aset_fields(key, values, timeout=policy.timeout, delete=delete)
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: ServiceResult | None = None
+    error: BaseException | None = None
+
+
+def _release_session_leases() -> None:
+    # Сессия не ждет чужую пересборку, удерживая собственные блокировки.
+    session = current_session()
+    if session is not None:
+        get_tiered_cache().release_leases(session)
+
+
+async def _arelease_session_leases() -> None:
+    session = current_session()
+    if session is not None:
+        await get_tiered_cache().arelease_leases(session)
+
+
+class SingleFlight:
+    """Пересборка ключа кеша только одним вызывающим.
+
+    Внутри процесса потоки ждут результата первого вызова, между воркерами
+    пересборку сериализует блокировка в Redis.
+    """
+
+    def __init__(self, lock_timeout: float = 60, wait_timeout: float = 20, poll_interval: float = 0.05):
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "SingleFlight":
+        options = settings.WEATHER_CACHE
+        return cls(
+            lock_timeout=options['LOCK_TIMEOUT'],
+            wait_timeout=options['LOCK_WAIT_TIMEOUT'],
+            poll_interval=options['LOCK_POLL_INTERVAL'],
+        )
+
+    def do(self, key: str, loader: Loader, lookup: Lookup, wait: bool = True) -> ServiceResult | None:
+        """Пересборка ключа: первый вызов грузит данные, остальные ждут его результата.
+
+        lookup проверяет, не пересобран ли ключ другим воркером. С wait=False
+        вызов не ждёт чужую пересборку и возвращает None. Ошибку первого вызова
+        получают и ожидающие его; ждут они не дольше wait_timeout и срока запроса.
+        """
+        session = current_session()
+        if session is not None and session.holds_lease(key):
+            # Блокировку Redis взял prefetch вместе с чтением ключа — ждать некого.
+            return loader()
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            if not wait:
+                return None
+            _release_session_leases()
+            if not call.done.wait(bounded(self.wait_timeout)):
+                # Первый вызов завис (например, на обращении к upstream без срока) — грузим сами.
+                logger.warning(f'Timed out waiting for {key} rebuild in process, loading it directly')
+                return loader()
+            if call.error is not None:
+                raise call.error
+            if call.result is None:
+                # Первый вызов шел с wait=False и уступил пересборку другому воркеру — ждем ее сами.
+                return self.do(key, loader, lookup, wait)
+            return call.result
+
+        try:
+            call.result = self._load_exclusive(key, loader, lookup, wait)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def _load_exclusive(self, key: str, loader: Loader, lookup: Lookup, wait: bool) -> ServiceResult | None:
+        lock = cache.lock(f'lock_{key}', timeout=self.lock_timeout)
+        if lock.acquire(blocking=False):
+            return self._load_locked(key, lock, loader, lookup)
+
+        if not wait:
+            return None
+
+        # Ключ пересобирает другой воркер — ждём, пока значение появится в кеше.
+        _release_session_leases()
+        deadline = time.monotonic() + bounded(self.wait_timeout)
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                return result
+            if lock.acquire(blocking=False):
+                # Блокировку отпустили, не записав значение, — пересобираем сами.
+                return self._load_locked(key, lock, loader, lookup)
+
+        logger.warning(f'Timed out waiting for {key} rebuild, loading it directly')
+        return loader()
+
+    @staticmethod
+    def _load_locked(key: str, lock, loader: Loader, lookup: Lookup) -> ServiceResult:
+        try:
+            # Ключ мог пересобрать воркер, только что отпустивший блокировку.
+            return lookup() or loader()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning(f'Cache lock for {key} expired before release')
+
+
+class AsyncSingleFlight:
+    """Асинхронный вариант SingleFlight: задачи event loop ждут первого вызова.
+
+    Блокировка в Redis та же, что у SingleFlight, поэтому синхронные и
+    асинхронные воркеры не пересобирают ключ одновременно.
+    """
+
+    def __init__(self, lock_timeout: float = 60, wait_timeout: float = 20, poll_interval: float = 0.05):
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls: dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_settings(cls) -> "AsyncSingleFlight":
+        options = settings.WEATHER_CACHE
+        return cls(
+            lock_timeout=options['LOCK_TIMEOUT'],
+            wait_timeout=options['LOCK_WAIT_TIMEOUT'],
+            poll_interval=options['LOCK_POLL_INTERVAL'],
+        )
+
+    async def do(self, key: str, loader: AsyncLoader, lookup: AsyncLookup, wait: bool = True) -> ServiceResult | None:
+        session = current_session()
+        if session is not None and session.holds_lease(key):
+            return await loader()
+
+        call = self._calls.get(key)
+        if call is not None:
+            if not wait:
+                return None
+            await _arelease_session_leases()
+            try:
+                result = await asyncio.wait_for(asyncio.shield(call), bounded(self.wait_timeout))
+            except TimeoutError:
+                logger.warning(f'Timed out waiting for {key} rebuild in process, loading it directly')
+                return await loader()
+            if result is None:
+                return await self.do(key, loader, lookup, wait)
+            return result
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._load_exclusive(key, loader, lookup, wait)
+        except asyncio.CancelledError:
+            # Отмена первого вызова (например, клиент отключился) не отменяет ожидающих: они пересобирают ключ сами.
+            call.set_result(None)
+            raise
+        except BaseException as err:
+            call.set_exception(err)
+            # Исключение получает сам вызывающий, ожидающих может и не быть.
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            del self._calls[key]
+
+        return result
+
+    async def _load_exclusive(
+        self, key: str, loader: AsyncLoader, lookup: AsyncLookup, wait: bool
+    ) -> ServiceResult | None:
+        lock = get_async_redis().lock(cache.client.make_key(f'lock_{key}'), timeout=self.lock_timeout)
+        if await lock.acquire(blocking=False):
+            return await self._load_locked(key, lock, loader, lookup)
+
+        if not wait:
+            return None
+
+        await _arelease_session_leases()
+        deadline = time.monotonic() + bounded(self.wait_timeout)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            result = await lookup()
+            if result is not None:
+                return result
+            if await lock.acquire(blocking=False):
+                return await self._load_locked(key, lock, loader, lookup)
+
+        logger.warning(f'Timed out waiting for {key} rebuild, loading it directly')
+        return await loader()
+
+    @staticmethod
+    async def _load_locked(key: str, lock, loader: AsyncLoader, lookup: AsyncLookup) -> ServiceResult:
+        try:
+            return await lookup() or await loader()
+        finally:
+            try:
+                await lock.release()
+            except LockError:
+                logger.warning(f'Cache lock for {key} expired before release')
+
+
+class BackgroundRefresher:
+    """Фоновое обновление устаревших ключей, не более одной задачи на ключ."""
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cache-refresh')
+        self._scheduled: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, key: str, refresh: Callable[[], object]) -> Future:
+        with self._lock:
+            future = self._scheduled.get(key)
+            if future is None:
+                future = self._scheduled[key] = self._executor.submit(self._run, key, refresh)
+            return future
+
+    def _run(self, key: str, refresh: Callable[[], object]) -> None:
+        try:
+            with without_queueing():
+                refresh()
+        except Exception:
+            logger.exception(f'Background refresh of {key} failed')
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._scheduled.pop(key, None)
+
+
+_single_flight: SingleFlight | None = None
+_async_single_flight: AsyncSingleFlight | None = None
+_refresher: BackgroundRefresher | None = None
+_refresh_tasks: dict[str, asyncio.Task] = {}
+_shared_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Общий для процесса экземпляр SingleFlight."""
+    global _single_flight
+
+    if _single_flight is None:
+        with _shared_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight.from_settings()
+    return _single_flight
+
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """Общий для процесса экземпляр AsyncSingleFlight."""
+    global _async_single_flight
+
+    if _async_single_flight is None:
+        with _shared_lock:
+            if _async_single_flight is None:
+                _async_single_flight = AsyncSingleFlight.from_settings()
+    return _async_single_flight
+
+
+def get_refresher() -> BackgroundRefresher:
+    """Общий для процесса пул фонового обновления."""
+    global _refresher
+
+    if _refresher is None:
+        with _shared_lock:
+            if _refresher is None:
+                _refresher = BackgroundRefresher(settings.WEATHER_CACHE['REFRESH_WORKERS'])
+    return _refresher
+
+
+def get_or_load(
+    key: str, loader: Loader, single_flight: SingleFlight | None = None, restore: Restore | None = None
+) -> ServiceResult:
+    """Значение из кеша, а при промахе — результат loader, сохранённый в кеш.
+
+    Устаревшее значение отдаётся сразу, а ключ обновляется в фоне. При промахе
+    сначала опрашивается restore: найденное значение возвращается в кеш со своим
+    сроком актуальности и дальше ведет себя как прочитанное из кеша.
+    """
+    single_flight = single_flight or get_single_flight()
+    policy = get_policy(key)
+
+    def load_and_store() -> ServiceResult:
+        result = loader()
+        if result.is_ok:
+            write_entry(key, result.data, policy)
+        return result
+
+    def lookup() -> ServiceResult | None:
+        # Пересобранное другим воркером значение есть только в Redis.
+        return fresh_result(key, local=False)
+
+    entry = read_entry(key)
+    if entry is None and restore is not None:
+        entry = restore()
+        if entry is not None:
+            write_entry(key, entry.data, policy, fresh_until=entry.fresh_until)
+    if entry is not None:
+        if not entry.is_fresh:
+            get_refresher().schedule(key, lambda: single_flight.do(key, load_and_store, lookup, wait=False))
+        return ServiceResult.ok(entry.data)
+
+    return single_flight.do(key, load_and_store, lookup)
+
+
+def _finish_refresh(key: str, task: asyncio.Task) -> None:
+    _refresh_tasks.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f'Background refresh of {key} failed - {task.exception()}')
+
+
+def _schedule_refresh_task(key: str, refresh: Awaitable[ServiceResult | None]) -> None:
+    async def run() -> ServiceResult | None:
+        # Задача переживает запрос, поэтому его срок и сессия кеша на нее не распространяются.
+        with without_queueing(), request_deadline(None), detached_session():
+            return await refresh
+
+    task = asyncio.create_task(run())
+    _refresh_tasks[key] = task
+    task.add_done_callback(lambda done: _finish_refresh(key, done))
+
+
+async def aget_or_load(
+    key: str, loader: AsyncLoader, single_flight: AsyncSingleFlight | None = None, restore: AsyncRestore | None = None
+) -> ServiceResult:
+    """Асинхронный вариант get_or_load: устаревший ключ обновляется фоновой задачей event loop."""
+    single_flight = single_flight or get_async_single_flight()
+    policy = get_policy(key)
+
+    async def load_and_store() -> ServiceResult:
+        result = await loader()
+        if result.is_ok:
+            await awrite_entry(key, result.data, policy)
+        return result
+
+    async def lookup() -> ServiceResult | None:
+        return await afresh_result(key, local=False)
+
+    entry = await aread_entry(key)
+    if entry is None and restore is not None:
+        entry = await restore()
+        if entry is not None:
+            await awrite_entry(key, entry.data, policy, fresh_until=entry.fresh_until)
+    if entry is not None:
+        if not entry.is_fresh and key not in _refresh_tasks:
+            _schedule_refresh_task(key, single_flight.do(key, load_and_store, lookup, wait=False))
+        return ServiceResult.ok(entry.data)
+
+    return await single_flight.do(key, load_and_store, lookup)
+
+
+def restore_fields(
+    key: str, fields: list[str], restore: RestoreFields, policy: CachePolicy | None = None
+) -> dict[str, CacheEntry]:
+    """Недостающие в кеше поля хеша key из restore; найденные записываются в кеш.
+
+    Запись идет через restore_hash_fields: восстановленные поля не продлевают хеш
+    дольше, чем им осталось жить.
+    """
+    if not fields:
+        return {}
+    policy = policy or get_policy(key)
+    restored = restore(fields)
+    if restored:
+        restore_hash_fields({key: restored}, policy)
+        values = {name: entry.to_cache() for name, entry in restored.items()}
+        timeout = max(_restored_timeout(entry.fresh_until, policy) for entry in restored.values())
+        get_tiered_cache().remember_fields(key, values, timeout=timeout)
+    return restored
+
+
+async def arestore_fields(
+    key: str, fields: list[str], restore: AsyncRestoreFields, policy: CachePolicy | None = None
+) -> dict[str, CacheEntry]:
+    if not fields:
+        return {}
+    policy = policy or get_policy(key)
+    restored = await restore(fields)
+    if restored:
+        await arestore_hash_fields({key: restored}, policy)
+        values = {name: entry.to_cache() for name, entry in restored.items()}
+        timeout = max(_restored_timeout(entry.fresh_until, policy) for entry in restored.values())
+        get_tiered_cache().remember_fields(key, values, timeout=timeout)
+    return restored
+
+
+def get_or_load_fields(
+    key: str,
+    loaders: dict[str, Loader],
+    entries: dict[str, CacheEntry] | None = None,
+    single_flight: SingleFlight | None = None,
+    restore: RestoreFields | None = None,
+) -> dict[str, ServiceResult]:
+    """Вариант get_or_load для полей хеша key: все поля читаются одним HMGET.
+
+    entries — уже прочитанные записи полей, тогда Redis не опрашивается.
+    Отсутствующие поля берутся из restore, оставшиеся грузятся своими loader по одному на поле.
+    """
+    single_flight = single_flight or get_single_flight()
+    policy = get_policy(key)
+    if entries is None:
+        entries = read_fields({key: list(loaders)})[key]
+    if restore is not None:
+        missing = [name for name in loaders if name not in entries]
+        entries = {**entries, **restore_fields(key, missing, restore, policy)}
+
+    def load_and_store(name: str, loader: Loader) -> Loader:
+        def load() -> ServiceResult:
+            result = loader()
+            if result.is_ok:
+                write_fields(key, {name: result.data}, policy)
+            return result
+
+        return load
+
+    def lookup(name: str) -> Lookup:
+        def fresh() -> ServiceResult | None:
+            entry = read_fields({key: [name]}, local=False)[key].get(name)
+            return ServiceResult.ok(entry.data) if entry is not None and entry.is_fresh else None
+
+        return fresh
+
+    results = {}
+    for name, loader in loaders.items():
+        flight_key = f'{key}_{name}'
+        load, fresh = load_and_store(name, loader), lookup(name)
+        entry = entries.get(name)
+        if entry is None:
+            results[name] = single_flight.do(flight_key, load, fresh)
+            continue
+        if not entry.is_fresh:
+            get_refresher().schedule(
+                flight_key,
+                lambda load=load, fresh=fresh, flight_key=flight_key: single_flight.do(
+                    flight_key, load, fresh, wait=False
+                ),
+            )
+        results[name] = ServiceResult.ok(entry.data)
+    return results
+
+
+async def aget_or_load_fields(
+    key: str,
+    loaders: dict[str, AsyncLoader],
+    entries: dict[str, CacheEntry] | None = None,
+    single_flight: AsyncSingleFlight | None = None,
+    restore: AsyncRestoreFields | None = None,
+) -> dict[str, ServiceResult]:
+    """Асинхронный вариант get_or_load_fields."""
+    single_flight = single_flight or get_async_single_flight()
+    policy = get_policy(key)
+    if entries is None:
+        entries = (await aread_fields({key: list(loaders)}))[key]
+    if restore is not None:
+        missing = [name for name in loaders if name not in entries]
+        entries = {**entries, **(await arestore_fields(key, missing, restore, policy))}
+
+    def load_and_store(name: str, loader: AsyncLoader) -> AsyncLoader:
+        async def load() -> ServiceResult:
+            result = await loader()
+            if result.is_ok:
+                await awrite_fields(key, {name: result.data}, policy)
+            return result
+
+        return load
+
+    def lookup(name: str) -> AsyncLookup:
+        async def fresh() -> ServiceResult | None:
+            entry = (await aread_fields({key: [name]}, local=False))[key].get(name)
+            return ServiceResult.ok(entry.data) if entry is not None and entry.is_fresh else None
+
+        return fresh
+
+    results = {}
+    for name, loader in loaders.items():
+        flight_key = f'{key}_{name}'
+        load, fresh = load_and_store(name, loader), lookup(name)
+        entry = entries.get(name)
+        if entry is None:
+            results[name] = await single_flight.do(flight_key, load, fresh)
+            continue
+        if not entry.is_fresh and flight_key not in _refresh_tasks:
+            _schedule_refresh_task(flight_key, single_flight.do(flight_key, load, fresh, wait=False))
+        results[name] = ServiceResult.ok(entry.data)
+    return results
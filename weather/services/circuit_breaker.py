@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Ответы, говорящие о проблеме upstream, а не запроса.
+FAILURE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Автомат отключения одного эндпоинта upstream.
+
+    failure_threshold неудачных вызовов подряд (ошибка, ответ из FAILURE_STATUSES
+    или ответ дольше slow_call_duration) открывают автомат на open_seconds: вызовы
+    сразу отклоняются. Затем пропускается до half_open_probes пробных вызовов:
+    успешный закрывает автомат, неудачный снова открывает.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_duration: float = 5,
+        open_seconds: float = 30,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_duration = slow_call_duration
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """Допуск вызова; CircuitOpen, если автомат открыт или пробные вызовы уже идут."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return
+            self._rejected += 1
+        raise CircuitOpen(f'{self.name} circuit is open')
+
+    def release(self) -> None:
+        """Вызов не состоялся (например, отклонен лимитером): пробный слот освобождается."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record(self, success: bool, duration: float) -> None:
+        """Итог вызова; медленный ответ считается неудачей."""
+        success = success and duration <= self.slow_call_duration
+        with self._lock:
+            if success:
+                if self._state != CLOSED:
+                    logger.info(f'Circuit {self.name} closed')
+                self._state = CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f'Circuit {self.name} opened after {self._failures} failures')
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'state': self._current_state(), 'failures': self._failures, 'rejected': self._rejected}
+
+
+_circuit_breakers: dict[str, CircuitBreaker] | None = None
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breakers() -> dict[str, CircuitBreaker]:
+    """Общие для процесса автоматы по эндпоинтам; пустой словарь, если они выключены."""
+    global _circuit_breakers
+
+    options = settings.OPENWEATHERMAP_CIRCUIT_BREAKER
+    if not options['ENABLED']:
+        return {}
+    if _circuit_breakers is None:
+        with _circuit_breakers_lock:
+            if _circuit_breakers is None:
+                _circuit_breakers = {
+                    name: CircuitBreaker(
+                        name,
+                        failure_threshold=endpoint['FAILURE_THRESHOLD'],
+                        slow_call_duration=endpoint['SLOW_CALL_DURATION'],
+                        open_seconds=endpoint['OPEN_SECONDS'],
+                        half_open_probes=endpoint['HALF_OPEN_PROBES'],
+                    )
+                    for name, endpoint in options['ENDPOINTS'].items()
+                }
+    return _circuit_breakers
@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_deadline: ContextVar[float | None] = ContextVar('upstream_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def request_deadline(seconds: float | None):
+    """Общий срок на все обращения к upstream внутри блока; None — без срока."""
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> float | None:
+    """Сколько секунд осталось до срока или None, если срока нет."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def bounded(seconds: float) -> float:
+    """Ожидание, урезанное до оставшегося срока."""
+    left = time_left()
+    return seconds if left is None else min(seconds, left)
+
+
+def limit_timeout(timeout: float | tuple) -> tuple[float, float]:
+    """Таймауты (connect, read) запроса в пределах оставшегося срока."""
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    left = time_left()
+    if left is None:
+        return connect, read
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+    return min(connect, left), min(read, left)
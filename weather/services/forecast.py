@@ -1,35 +1,223 @@
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+
 from weather.models import ForecastOverride
+from .locations import normalize_city_name
+from .metrics import stage
 from .open_weather_map import WeatherService
+from .overrides import (
+    afind_override,
+    find_override,
+    get_overrides_range,
+    invalidate_overrides,
+    match_override,
+    overrides_cache_key,
+)
+from .tiered_cache import acache_session, cache_session
+
+logger = logging.getLogger(__name__)
+
+OVERRIDE_UPDATE_FIELDS = ['city', 'min_temperature', 'max_temperature', 'updated_at']
+
 
+def _upsert_overrides(
+    overrides: list[ForecastOverride], batch_size: int | None = None, unique_fields: tuple = ('location', 'date')
+) -> None:
+    """Вставка или обновление переопределений одним запросом на пачку.
+
+    MySQL выполняет ON DUPLICATE KEY UPDATE по любому уникальному индексу
+    и не принимает unique_fields, остальные СУБД требуют их явно.
+    """
+    if not connection.features.supports_update_conflicts_with_target:
+        unique_fields = None
+    ForecastOverride.objects.bulk_create(
+        overrides,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=OVERRIDE_UPDATE_FIELDS,
+    )
+    # bulk_create не отправляет сигналы модели, поэтому кеш сбрасывается здесь.
+    dates = [override.date for override in overrides]
+    transaction.on_commit(lambda: invalidate_overrides(dates))
+
+
+def _build_override(location_id: int, data: dict) -> ForecastOverride:
+    return ForecastOverride(
+        location_id=location_id,
+        city=data['city'],
+        date=data['date'],
+        min_temperature=data['min_temperature'],
+        max_temperature=data['max_temperature'],
+    )
 
-def save_forecast_override(data: dict) -> None:
-    """Создание или обновление существующей записи модели ForecastOverride."""
 
-    ForecastOverride.objects.update_or_create(
+def _save_unlinked_override(data: dict) -> None:
+    # Запись по названию города, как до появления мест: применяется по названию, пока
+    # link_forecast_overrides не привяжет ее к месту. Upsert по уникальному индексу (city_key, date);
+    # bulk_create не вызывает pre_save, поэтому city_key задается здесь.
+    override = ForecastOverride(
         city=data['city'],
+        city_key=normalize_city_name(data['city']),
         date=data['date'],
-        defaults={
-            'min_temperature': data['min_temperature'],
-            'max_temperature': data['max_temperature'],
-        },
+        min_temperature=data['min_temperature'],
+        max_temperature=data['max_temperature'],
     )
+    _upsert_overrides([override], unique_fields=('city_key', 'date'))
+
+
+def save_forecast_override(data: dict) -> tuple[bool, dict]:
+    """Создание или обновление записи модели ForecastOverride для места запрошенного города.
+
+    Если место определить не удалось (геокодер или таблица мест недоступны), запись
+    сохраняется по названию города и применяется по нему.
+    """
+
+    coords_result = WeatherService().geo_client.get_coordinates(data['city'])
+    location_id = coords_result.data.get('location_id') if coords_result.is_ok else None
+    if not location_id:
+        logger.warning(f'Location of {data["city"]} is unknown, forecast override is saved by city name')
+        _save_unlinked_override(data)
+        return False, {}
+
+    _upsert_overrides([_build_override(location_id, data)])
+    return False, {}
+
+
+def bulk_save_forecast_overrides(rows: list[dict], batch_size: int = 1000) -> tuple[int, dict]:
+    """Загрузка множества переопределений пачками multi-row upsert.
+
+    Каждый город геокодируется один раз; строки городов, которые не удалось
+    найти, пропускаются и возвращаются в ошибках.
+    """
+    geo_client = WeatherService().geo_client
+    locations, errors = {}, {}
+    for city in dict.fromkeys(row['city'] for row in rows):
+        coords_result = geo_client.get_coordinates(city)
+        location_id = coords_result.data.get('location_id') if coords_result.is_ok else None
+        if location_id:
+            locations[city] = location_id
+        else:
+            errors[city] = coords_result.errors or {'error': 'Location storage is unavailable'}
+
+    # В одной пачке не должно быть двух строк на одно место и дату: побеждает последняя.
+    overrides = {
+        (locations[row['city']], row['date']): _build_override(locations[row['city']], row)
+        for row in rows
+        if row['city'] in locations
+    }
+    with transaction.atomic():
+        _upsert_overrides(list(overrides.values()), batch_size=batch_size)
+
+    return len(overrides), errors
 
 
 def get_forecast(data: dict) -> tuple[bool, dict]:
     """Прогноз погоды на день в запрошенном городе."""
 
     city, date = data['city'], data['date']
-    override = ForecastOverride.objects.filter(city=city, date=date).first()
+    service = WeatherService()
+    with cache_session():
+        # Координаты, переопределения на дату и прогноз места — одним обращением к Redis.
+        service.prefetch(city, keys=[overrides_cache_key(date)], forecast_dates=[date])
+        coords_result = service.geo_client.get_coordinates(city)
+        # Город, который не удалось геокодировать, может иметь переопределение по названию.
+        with stage('overrides'):
+            override = find_override(coords_result.data if coords_result.is_ok else {}, date, city)
+
+        if override:
+            min, max = override
+        elif not coords_result.is_ok:
+            return True, coords_result.errors
+        else:
+            result = service.get_forecast(city, date)
+            if not result.is_ok:
+                return True, result.errors
+
+            min = result.data['min']
+            max = result.data['max']
+
+    return False, {'min_temperature': min, 'max_temperature': max}
+
+
+async def aget_forecast(data: dict) -> tuple[bool, dict]:
+    """Прогноз погоды на день в запрошенном городе (асинхронно)."""
+
+    city, date = data['city'], data['date']
+    service = WeatherService()
+    async with acache_session():
+        await service.aprefetch(city, keys=[overrides_cache_key(date)], forecast_dates=[date])
+        coords_result = await service.geo_client.aget_coordinates(city)
+        with stage('overrides'):
+            override = await afind_override(coords_result.data if coords_result.is_ok else {}, date, city)
 
-    if override:
-        min = override.min_temperature
-        max = override.max_temperature
-    else:
-        result = WeatherService().get_forecast(city, date)
-        if not result.is_ok:
-            return True, result.errors
+        if override:
+            min, max = override
+        elif not coords_result.is_ok:
+            return True, coords_result.errors
+        else:
+            result = await service.aget_forecast(city, date)
+            if not result.is_ok:
+                return True, result.errors
 
-        min = result.data['min']
-        max = result.data['max']
+            min = result.data['min']
+            max = result.data['max']
 
     return False, {'min_temperature': min, 'max_temperature': max}
+
+
+def get_forecast_range(data: dict) -> tuple[bool, dict]:
+    """Прогноз погоды на диапазон дат для одного или нескольких городов."""
+
+    cities, date_from, date_to = data['city'], data['date_from'], data['date_to']
+    dates = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+
+    service = WeatherService()
+    response_data = {}
+    locations = {}
+    for city in cities:
+        coords_result = service.geo_client.get_coordinates(city)
+        if coords_result.is_ok:
+            locations[city] = coords_result.data
+        else:
+            response_data[city] = coords_result.errors
+
+    with stage('overrides'):
+        overrides = get_overrides_range(dates)
+
+    city_overrides = {}
+    missing = {}
+    for city in cities:
+        # Город без места отвечается переопределениями по названию, если они есть на все даты.
+        coords = locations.get(city, {})
+        matched = {day: match_override(day_overrides, coords, city) for day, day_overrides in overrides.items()}
+        city_overrides[city] = {day: override for day, override in matched.items() if override is not None}
+        missing[city] = [day for day in dates if day not in city_overrides[city]]
+    forecasts = service.get_forecast_ranges({city: missing[city] for city in locations if missing[city]})
+
+    for city in cities:
+        if city not in locations and missing[city]:
+            continue
+        results = forecasts.get(city, {})
+
+        failed = next((result for result in results.values() if not result.is_ok), None)
+        if failed:
+            response_data[city] = failed.errors
+            continue
+
+        forecast = []
+        for day in dates:
+            if day in city_overrides[city]:
+                min_temp, max_temp = city_overrides[city][day]
+            else:
+                min_temp, max_temp = results[day].data['min'], results[day].data['max']
+            forecast.append(
+                {'date': day.strftime('%d.%m.%Y'), 'min_temperature': min_temp, 'max_temperature': max_temp}
+            )
+        response_data[city] = forecast
+
+    response_data = {city: response_data[city] for city in cities}
+    is_error = all(isinstance(city_data, dict) for city_data in response_data.values())
+    return is_error, response_data
@@ -0,0 +1,166 @@
+import bisect
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Границы корзин гистограммы в секундах: от 1 мс до ~65 с с шагом √2.
+BUCKETS = tuple(0.001 * 2 ** (step / 2) for step in range(33))
+
+
+class LatencyHistogram:
+    """Гистограмма задержек за скользящее окно: текущее и предыдущее окна по window секунд."""
+
+    def __init__(self, window: float = 60):
+        self.window = window
+        self._current = [0] * (len(BUCKETS) + 1)
+        self._previous = [0] * (len(BUCKETS) + 1)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rotate(self) -> None:
+        elapsed = time.monotonic() - self._started
+        if elapsed < self.window:
+            return
+        self._previous = self._current if elapsed < self.window * 2 else [0] * (len(BUCKETS) + 1)
+        self._current = [0] * (len(BUCKETS) + 1)
+        self._started = time.monotonic()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._rotate()
+            self._current[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def counts(self) -> list[int]:
+        """Число замеров по корзинам BUCKETS (последняя — больше последней границы)."""
+        with self._lock:
+            self._rotate()
+            return [current + previous for current, previous in zip(self._current, self._previous)]
+
+    def percentile(self, percent: float, min_samples: int = 1) -> float | None:
+        """Верхняя граница корзины процентиля или None, если замеров меньше min_samples."""
+        counts = self.counts()
+        total = sum(counts)
+        if not total or total < min_samples:
+            return None
+
+        threshold = total * percent / 100
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= threshold:
+                return BUCKETS[min(index, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+
+class EndpointLatency:
+    """Скользящие гистограммы задержек upstream по эндпоинтам."""
+
+    def __init__(self, window: float = 60):
+        self.window = window
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, endpoint: str) -> LatencyHistogram:
+        histogram = self.histograms.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(endpoint, LatencyHistogram(self.window))
+        return histogram
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        self.histogram(endpoint).observe(seconds)
+
+    def percentile(self, endpoint: str, percent: float, min_samples: int = 1) -> float | None:
+        return self.histogram(endpoint).percentile(percent, min_samples)
+
+
+class Hedging:
+    """Дублирующие запросы: GET без ответа дольше percentile-го процентиля задержки эндпоинта
+    повторяется, и берется первый ответ.
+
+    Каждый запрос добавляет budget_ratio попытки в бюджет (не больше max_credits), копия
+    расходует одну, поэтому копий не больше budget_ratio от всех запросов.
+    """
+
+    def __init__(
+        self,
+        latency: EndpointLatency,
+        percentile: float = 95,
+        min_samples: int = 50,
+        budget_ratio: float = 0.05,
+        max_credits: float = 10,
+    ):
+        self.latency = latency
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.max_credits = max_credits
+        self.counters = Counter()
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, latency: EndpointLatency) -> "Hedging":
+        options = settings.OPENWEATHERMAP_HEDGING
+        return cls(
+            latency,
+            percentile=options['PERCENTILE'],
+            min_samples=options['MIN_SAMPLES'],
+            budget_ratio=options['BUDGET_RATIO'],
+            max_credits=options['MAX_CREDITS'],
+        )
+
+    def delay(self, endpoint: str) -> float | None:
+        """Через сколько секунд отправлять копию; None — пока не дублировать."""
+        with self._lock:
+            self._credits = min(self._credits + self.budget_ratio, self.max_credits)
+        return self.latency.percentile(endpoint, self.percentile, self.min_samples)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._credits < 1:
+                self.counters['budget_exceeded'] += 1
+                return False
+            self._credits -= 1
+            self.counters['hedges'] += 1
+            return True
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.counters['hedge_wins'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: self.counters[name] for name in ('hedges', 'hedge_wins', 'budget_exceeded')}
+
+
+_latency: EndpointLatency | None = None
+_hedging: Hedging | None = None
+_hedging_lock = threading.Lock()
+
+
+def get_endpoint_latency() -> EndpointLatency:
+    """Общие для процесса гистограммы задержек upstream."""
+    global _latency
+
+    if _latency is None:
+        with _hedging_lock:
+            if _latency is None:
+                _latency = EndpointLatency(settings.OPENWEATHERMAP_HTTP['LATENCY_WINDOW'])
+    return _latency
+
+
+def get_hedging() -> Hedging | None:
+    """Общая для процесса политика дублирующих запросов или None, если они выключены."""
+    global _hedging
+
+    if not settings.OPENWEATHERMAP_HEDGING['ENABLED']:
+        return None
+    latency = get_endpoint_latency()
+    if _hedging is None:
+        with _hedging_lock:
+            if _hedging is None:
+                _hedging = Hedging.from_settings(latency)
+    return _hedging
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .async_redis import get_async_redis
+from .locations import normalize_city_name
+
+logger = logging.getLogger(__name__)
+
+CURRENT = 'current'
+FORECAST = 'forecast'
+
+
+class HotCities:
+    """Частота запросов по городам в скользящем окне (sorted set Redis на каждое окно).
+
+    Популярность считается по двум последним окнам, старые окна истекают сами.
+    Запросы копятся в процессе и уходят в Redis одним конвейером не чаще раза
+    в flush_interval секунд, поэтому учет не добавляет запросу обращений к Redis.
+    Накопленное отправляет следующий запрос или, если его нет, таймер.
+    """
+
+    def __init__(self, window: int = 300, flush_interval: float = 1):
+        self.window = window
+        self.flush_interval = flush_interval
+        self._pending: Counter[tuple[str, str]] = Counter()
+        self._next_flush = 0.0
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "HotCities":
+        options = settings.WEATHER_REFRESH
+        return cls(window=options['WINDOW'], flush_interval=options['RECORD_FLUSH_INTERVAL'])
+
+    def _key(self, kind: str, window: int) -> str:
+        return cache.client.make_key(f'hot_cities_{kind}_{window}')
+
+    def _current_window(self) -> int:
+        return int(time.time() // self.window)
+
+    def _add(self, kind: str, cities: list[str]) -> bool:
+        # True — подошло время отправить накопленное в Redis.
+        key = self._key(kind, self._current_window())
+        with self._lock:
+            for city in cities:
+                self._pending[(key, normalize_city_name(city))] += 1
+            now = time.monotonic()
+            if now < self._next_flush:
+                # Без таймера учет воркера, переставшего получать запросы, не дошел бы до Redis.
+                if self._timer is None:
+                    self._timer = threading.Timer(self._next_flush - now, self._flush_on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return False
+            self._next_flush = now + self.flush_interval
+            return True
+
+    def _flush_on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._next_flush = time.monotonic() + self.flush_interval
+        self.flush()
+
+    def _take_pending(self) -> Counter:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            return pending
+
+    def _queue_pending(self, pipeline, pending: Counter) -> None:
+        for (key, city), count in pending.items():
+            pipeline.zincrby(key, count, city)
+        for key in {key for key, _ in pending}:
+            pipeline.expire(key, self.window * 2)
+
+    def record(self, kind: str, cities: list[str]) -> None:
+        """Учет запроса; ошибка Redis не влияет на ответ."""
+        if self._add(kind, cities):
+            self.flush()
+
+    async def arecord(self, kind: str, cities: list[str]) -> None:
+        if self._add(kind, cities):
+            await self.aflush()
+
+    def flush(self) -> None:
+        """Отправка накопленных в процессе запросов в Redis; при ошибке они теряются."""
+        pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            pipeline = get_redis_connection('default').pipeline(transaction=False)
+            self._queue_pending(pipeline, pending)
+            pipeline.execute()
+        except RedisError as err:
+            logger.warning(f'Recording hot cities failed - {err}')
+
+    async def aflush(self) -> None:
+        pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipeline:
+                self._queue_pending(pipeline, pending)
+                await pipeline.execute()
+        except RedisError as err:
+            logger.warning(f'Recording hot cities failed - {err}')
+
+    def top(self, kind: str, limit: int) -> list[str]:
+        """Самые запрашиваемые города по убыванию частоты, включая накопленные в процессе."""
+        self.flush()
+        window = self._current_window()
+        destination = cache.client.make_key(f'hot_cities_{kind}_top')
+        pipeline = get_redis_connection('default').pipeline()
+        pipeline.zunionstore(destination, [self._key(kind, window), self._key(kind, window - 1)])
+        pipeline.zrevrange(destination, 0, limit - 1)
+        pipeline.delete(destination)
+        _, cities, _ = pipeline.execute()
+        return [city.decode() if isinstance(city, bytes) else city for city in cities]
+
+
+_hot_cities: HotCities | None = None
+_hot_cities_lock = threading.Lock()
+
+
+def get_hot_cities() -> HotCities:
+    """Общий для процесса учет популярных городов."""
+    global _hot_cities
+
+    if _hot_cities is None:
+        with _hot_cities_lock:
+            if _hot_cities is None:
+                _hot_cities = HotCities.from_settings()
+    return _hot_cities
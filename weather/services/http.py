@@ -0,0 +1,510 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import FAILURE_STATUSES, CircuitBreaker, get_circuit_breakers
+from .deadline import bounded, limit_timeout
+from .hedging import EndpointLatency, Hedging, get_endpoint_latency, get_hedging
+from .rate_limit import RateLimiter, RateLimitExceeded, get_rate_limiter, without_queueing
+
+RETRY_STATUSES = (502, 503, 504)
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD'})
+
+
+class HttpTransport:
+    """Общий HTTP-транспорт с пулом keep-alive соединений и повторами GET.
+
+    Задержки ответов по эндпоинтам копятся в latency; с hedging медленный GET дублируется.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 32,
+        pool_block: bool = True,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 15,
+        retries: int = 2,
+        backoff_factor: float = 0.3,
+        limiter: RateLimiter | None = None,
+        breakers: dict[str, CircuitBreaker] | None = None,
+        latency: EndpointLatency | None = None,
+        hedging: Hedging | None = None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.limiter = limiter
+        self.breakers = breakers or {}
+        self.latency = latency or EndpointLatency()
+        self.hedging = hedging
+        self._hedge_workers = pool_maxsize
+        # Запрос уходит в пул, только заняв свободный поток: в очереди пула он ждал бы,
+        # а ожидание засчитывалось бы в задержку upstream и само вызывало бы копии.
+        self._hedge_slots = threading.BoundedSemaphore(pool_maxsize)
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+        # Повторы — в _attempts, а не в urllib3: каждая попытка получает только остаток срока запроса.
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    @classmethod
+    def from_settings(cls) -> "HttpTransport":
+        """Создание транспорта по настройкам OPENWEATHERMAP_HTTP."""
+        options = settings.OPENWEATHERMAP_HTTP
+        return cls(
+            pool_connections=options['POOL_CONNECTIONS'],
+            pool_maxsize=options['POOL_MAXSIZE'],
+            pool_block=options['POOL_BLOCK'],
+            connect_timeout=options['CONNECT_TIMEOUT'],
+            read_timeout=options['READ_TIMEOUT'],
+            retries=options['RETRIES'],
+            backoff_factor=options['BACKOFF_FACTOR'],
+            limiter=get_rate_limiter(),
+            breakers=get_circuit_breakers(),
+            latency=get_endpoint_latency(),
+            hedging=get_hedging(),
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        params: dict | None = None,
+        timeout: float | tuple | None = None,
+        endpoint: str | None = None,
+    ) -> requests.Response:
+        """Запрос через пул соединений.
+
+        Для эндпоинта endpoint учитываются автомат отключения (CircuitOpen) и бюджет
+        обращений (RateLimitExceeded); таймауты урезаются до срока запроса (DeadlineExceeded).
+        """
+        breaker = _admit(self.breakers, endpoint)
+        try:
+            if endpoint and self.limiter:
+                self.limiter.acquire(endpoint)
+            timeout = limit_timeout(timeout or self.timeout)
+        except Exception:
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        started = time.monotonic()
+        try:
+            response = self._send(method, url, params, timeout, endpoint)
+        except requests.RequestException:
+            if breaker is not None:
+                breaker.record(False, time.monotonic() - started)
+            raise
+        except Exception:
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        if breaker is not None:
+            breaker.record(response.status_code not in FAILURE_STATUSES, time.monotonic() - started)
+        return response
+
+    def _send(
+        self, method: str, url: str, params: dict | None, timeout: tuple, endpoint: str | None
+    ) -> requests.Response:
+        delay = None
+        if self.hedging is not None and endpoint and method.upper() in IDEMPOTENT_METHODS:
+            delay = self.hedging.delay(endpoint)
+        if delay is None:
+            return self._timed_request(method, url, params, timeout, endpoint)
+
+        # Запрос выполняется в пуле, чтобы не дожидаться его, если копия ответит раньше.
+        # Свободных потоков нет — запрос идет без копии в текущем потоке.
+        if not self._hedge_slots.acquire(blocking=False):
+            return self._timed_request(method, url, params, timeout, endpoint)
+        started = time.monotonic()
+        primary_cancelled = threading.Event()
+        primary = self._submit(method, url, params, timeout, endpoint, primary_cancelled)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+
+        # Копия укладывается в срок основного запроса, а не получает исходный таймаут заново;
+        # срок запроса (request_deadline) в timeout уже учтен.
+        left = timeout[1] - (time.monotonic() - started)
+        if left <= 0 or not self._hedge_slots.acquire(blocking=False):
+            return primary.result()
+        if not self._admit_hedge(endpoint):
+            self._hedge_slots.release()
+            return primary.result()
+
+        hedge_cancelled = threading.Event()
+        hedge = self._submit(method, url, params, (min(timeout[0], left), left), endpoint, hedge_cancelled)
+        done, pending = wait((primary, hedge), return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            # Первый ответ — ошибка: результат решает второй запрос.
+            winner = pending.pop()
+            winner.exception()
+        if winner is hedge and winner.exception() is None:
+            self.hedging.record_win()
+
+        # Проигравший запрос отменяется: его тело не читается, ответ закрывается.
+        loser, loser_cancelled = (hedge, hedge_cancelled) if winner is primary else (primary, primary_cancelled)
+        loser_cancelled.set()
+        loser.cancel()
+        loser.add_done_callback(_close_response)
+        return winner.result()
+
+    def _submit(
+        self,
+        method: str,
+        url: str,
+        params: dict | None,
+        timeout: tuple,
+        endpoint: str | None,
+        cancelled: threading.Event,
+    ) -> Future:
+        """Запрос в пуле под уже занятым слотом; слот освобождается по завершении запроса."""
+        # Контекст копируется, чтобы попытки в потоке пула видели срок запроса.
+        context = contextvars.copy_context()
+        try:
+            future = self._get_executor().submit(
+                context.run, self._timed_request, method, url, params, timeout, endpoint, cancelled
+            )
+        except BaseException:
+            self._hedge_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def _timed_request(
+        self,
+        method: str,
+        url: str,
+        params: dict | None,
+        timeout: tuple,
+        endpoint: str | None,
+        cancelled: threading.Event | None = None,
+    ) -> requests.Response:
+        started = time.monotonic()
+        response = self._attempts(method, url, params, timeout, endpoint, stream=cancelled is not None)
+        if cancelled is not None:
+            # Тело читается, только если ответ еще нужен; иначе соединение закрывается.
+            if cancelled.is_set():
+                response.close()
+                return response
+            # Ответ с stream=True читается здесь, в потоке копии: после чтения тела
+            # соединение возвращается в пул, а задержка учитывает и тело.
+            _ = response.content
+        if endpoint and response.status_code not in FAILURE_STATUSES:
+            self.latency.observe(endpoint, time.monotonic() - started)
+        return response
+
+    def _attempts(
+        self, method: str, url: str, params: dict | None, timeout: tuple, endpoint: str | None, stream: bool = False
+    ) -> requests.Response:
+        """Запрос с повторами GET при 502/503/504 и ошибках соединения или чтения.
+
+        Токен первой попытки берет request; без токена на повтор результатом остается последняя попытка.
+        """
+        attempts = self.retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            # Повтор получает только остаток срока запроса.
+            attempt_timeout = limit_timeout(timeout)
+            try:
+                response = self.session.request(method, url=url, params=params, timeout=attempt_timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if last or not self._admit_retry(endpoint):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last or not self._admit_retry(endpoint):
+                    return response
+                response.close()
+            time.sleep(bounded(self.backoff_factor * 2**attempt))
+
+    def _admit_retry(self, endpoint: str | None) -> bool:
+        """Повтор — отдельное обращение к API: ему тоже нужен токен лимита."""
+        if not endpoint or self.limiter is None:
+            return True
+        try:
+            self.limiter.acquire(endpoint)
+        except RateLimitExceeded:
+            return False
+        return True
+
+    def _admit_hedge(self, endpoint: str) -> bool:
+        """Копия запроса в пределах бюджета копий и лимита обращений, без ожидания токена."""
+        if not self.hedging.try_hedge():
+            return False
+        if self.limiter is None:
+            return True
+        try:
+            with without_queueing():
+                self.limiter.acquire(endpoint)
+        except RateLimitExceeded:
+            return False
+        return True
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._hedge_workers, thread_name_prefix='owm-hedge')
+        return self._executor
+
+    def stats(self) -> dict:
+        """Статистика переиспользования соединений по всем хостам пула."""
+        pools = self.adapter.poolmanager.pools
+        requests_total = new_connections = 0
+        # Контейнер пулов urllib3 не поддерживает итерацию: keys() — копия ключей под его блокировкой.
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_total += pool.num_requests
+            new_connections += pool.num_connections
+
+        return {
+            'requests': requests_total,
+            'new_connections': new_connections,
+            'pool_hits': max(requests_total - new_connections, 0),
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncHttpTransport:
+    """Асинхронный HTTP-транспорт с пулом keep-alive соединений и повторами GET.
+
+    Клиент httpx привязан к event loop, поэтому создаётся отдельно для каждого loop.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 32,
+        max_connections: int = 256,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 15,
+        retries: int = 2,
+        backoff_factor: float = 0.3,
+        limiter: RateLimiter | None = None,
+        breakers: dict[str, CircuitBreaker] | None = None,
+        latency: EndpointLatency | None = None,
+        hedging: Hedging | None = None,
+    ):
+        # Держать открытыми все max_connections не стоит: пул httpcore проверяет каждое
+        # простаивающее соединение при выдаче запроса, и это дорого при сотнях соединений.
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=pool_maxsize)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.limiter = limiter
+        self.breakers = breakers or {}
+        self.latency = latency or EndpointLatency()
+        self.hedging = hedging
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @classmethod
+    def from_settings(cls) -> "AsyncHttpTransport":
+        """Создание транспорта по настройкам OPENWEATHERMAP_HTTP."""
+        options = settings.OPENWEATHERMAP_HTTP
+        return cls(
+            pool_maxsize=options['POOL_MAXSIZE'],
+            max_connections=options['ASYNC_MAX_CONNECTIONS'],
+            connect_timeout=options['CONNECT_TIMEOUT'],
+            read_timeout=options['READ_TIMEOUT'],
+            retries=options['RETRIES'],
+            backoff_factor=options['BACKOFF_FACTOR'],
+            limiter=get_rate_limiter(),
+            breakers=get_circuit_breakers(),
+            latency=get_endpoint_latency(),
+            hedging=get_hedging(),
+        )
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                timeout=self.timeout,
+                transport=httpx.AsyncHTTPTransport(limits=self.limits, retries=self.retries),
+            )
+        return client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: dict | None = None,
+        timeout: float | tuple | None = None,
+        endpoint: str | None = None,
+    ) -> httpx.Response:
+        """Запрос через пул соединений; идемпотентные запросы повторяются при 502/503/504.
+
+        Автомат отключения, бюджет и срок запроса — как у HttpTransport.request.
+        """
+        breaker = _admit(self.breakers, endpoint)
+        try:
+            if endpoint and self.limiter:
+                await self.limiter.aacquire(endpoint)
+        except Exception:
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        started = time.monotonic()
+        try:
+            timeout = timeout or (self.timeout.connect, self.timeout.read)
+            response = await self._send(method, url, params, timeout, endpoint)
+        except httpx.HTTPError:
+            if breaker is not None:
+                breaker.record(False, time.monotonic() - started)
+            raise
+        except Exception:
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        if breaker is not None:
+            breaker.record(response.status_code not in FAILURE_STATUSES, time.monotonic() - started)
+        return response
+
+    async def _send(
+        self, method: str, url: str, params: dict | None, timeout: float | tuple, endpoint: str | None
+    ) -> httpx.Response:
+        delay = None
+        if self.hedging is not None and endpoint and method.upper() in IDEMPOTENT_METHODS:
+            delay = self.hedging.delay(endpoint)
+        if delay is None:
+            return await self._timed_attempts(method, url, params, timeout, endpoint)
+
+        primary = asyncio.create_task(self._timed_attempts(method, url, params, timeout, endpoint))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not await self._admit_hedge(endpoint):
+                return await primary
+
+            hedge = asyncio.create_task(self._timed_attempts(method, url, params, timeout, endpoint))
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedging.record_win()
+                        return task.result()
+            # Оба запроса завершились ошибкой.
+            return primary.result()
+        finally:
+            # Проигравший запрос отменяется.
+            for task in tasks:
+                task.cancel()
+
+    async def _timed_attempts(
+        self, method: str, url: str, params: dict | None, timeout: float | tuple, endpoint: str | None
+    ) -> httpx.Response:
+        started = time.monotonic()
+        response = await self._attempts(method, url, params, timeout, endpoint)
+        if endpoint and response.status_code not in FAILURE_STATUSES:
+            self.latency.observe(endpoint, time.monotonic() - started)
+        return response
+
+    async def _admit_hedge(self, endpoint: str) -> bool:
+        if not self.hedging.try_hedge():
+            return False
+        if self.limiter is None:
+            return True
+        try:
+            with without_queueing():
+                await self.limiter.aacquire(endpoint)
+        except RateLimitExceeded:
+            return False
+        return True
+
+    async def _admit_retry(self, endpoint: str | None) -> bool:
+        if not endpoint or self.limiter is None:
+            return True
+        try:
+            await self.limiter.aacquire(endpoint)
+        except RateLimitExceeded:
+            return False
+        return True
+
+    async def _attempts(
+        self, method: str, url: str, params: dict | None, timeout: float | tuple, endpoint: str | None
+    ) -> httpx.Response:
+        client = self._client()
+        attempts = self.retries + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            # Повтор получает только остаток срока запроса.
+            connect, read = limit_timeout(timeout)
+            response = await client.request(method, url, params=params, timeout=httpx.Timeout(read, connect=connect))
+            if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                return response
+            if not await self._admit_retry(endpoint):
+                return response
+            await response.aclose()
+            await asyncio.sleep(bounded(self.backoff_factor * 2**attempt))
+
+    async def aclose(self) -> None:
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def _close_response(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _admit(breakers: dict[str, CircuitBreaker], endpoint: str | None) -> CircuitBreaker | None:
+    breaker = breakers.get(endpoint) if endpoint else None
+    if breaker is not None:
+        breaker.before_call()
+    return breaker
+
+
+_transport: HttpTransport | None = None
+_async_transport: AsyncHttpTransport | None = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Общий для процесса экземпляр транспорта."""
+    global _transport
+
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport.from_settings()
+    return _transport
+
+
+def get_async_transport() -> AsyncHttpTransport:
+    """Общий для процесса экземпляр асинхронного транспорта."""
+    global _async_transport
+
+    if _async_transport is None:
+        with _transport_lock:
+            if _async_transport is None:
+                _async_transport = AsyncHttpTransport.from_settings()
+    return _async_transport
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import math
+import unicodedata
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from weather.models import CityAlias, GeoLocation
+
+from .result import ServiceResult
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_city_name(city: str) -> str:
+    """Название города для поиска: NFKC, без регистра и лишних пробелов."""
+    return ' '.join(unicodedata.normalize('NFKC', city).split()).casefold()
+
+
+def city_digest(city: str) -> str:
+    """Короткий ключ запроса: нормализованное название без ограничений на длину и символы."""
+    return hashlib.blake2s(normalize_city_name(city).encode(), digest_size=16).hexdigest()
+
+
+def location_key(coords: dict) -> str:
+    """Канонический идентификатор места для ключей кеша.
+
+    Если место не удалось сохранить в БД, идентификатором служат координаты:
+    разные написания одного города геокодируются в одну точку.
+    """
+    if coords.get('location_id'):
+        return str(coords['location_id'])
+    return f'{coords["lat"]}_{coords["lon"]}'
+
+
+def grid_cell(coords: dict) -> tuple[int, int] | None:
+    """Ячейка сетки WEATHER_GRID, в которую попадает точка, или None, если сетка выключена."""
+    options = settings.WEATHER_GRID
+    if not options['ENABLED']:
+        return None
+    size = options['CELL_DEGREES']
+    return math.floor(coords['lat'] / size), math.floor(coords['lon'] / size)
+
+
+def weather_location(coords: dict) -> str:
+    """Идентификатор места в ключах погоды: ячейка сетки, если она включена, иначе location_key.
+
+    Размер ячейки входит в ключ, поэтому смена настройки не смешивает значения.
+    """
+    cell = grid_cell(coords)
+    if cell is None:
+        return location_key(coords)
+    return f'grid{settings.WEATHER_GRID["CELL_DEGREES"]:g}_{cell[0]}_{cell[1]}'
+
+
+def weather_coords(coords: dict) -> dict:
+    """Координаты запроса погоды к API: центр ячейки сетки, чтобы ответ не зависел
+    от того, какое место ячейки запросили первым; без сетки — сами координаты.
+    """
+    cell = grid_cell(coords)
+    if cell is None:
+        return coords
+    size = settings.WEATHER_GRID['CELL_DEGREES']
+    return {'lat': round((cell[0] + 0.5) * size, 6), 'lon': round((cell[1] + 0.5) * size, 6)}
+
+
+def _to_result(location: GeoLocation) -> ServiceResult:
+    return ServiceResult.ok({'lat': location.latitude, 'lon': location.longitude, 'location_id': location.pk})
+
+
+def find_location(city: str) -> ServiceResult | None:
+    """Сохраненные координаты города по алиасу."""
+    alias = CityAlias.objects.select_related('location').filter(alias=normalize_city_name(city)).first()
+    return _to_result(alias.location) if alias else None
+
+
+async def afind_location(city: str) -> ServiceResult | None:
+    """Сохраненные координаты города по алиасу (асинхронно)."""
+    alias = await CityAlias.objects.select_related('location').filter(alias=normalize_city_name(city)).afirst()
+    return _to_result(alias.location) if alias else None
+
+
+def save_location(city: str, data: dict) -> ServiceResult:
+    """Сохранение координат города после успешного геокодинга.
+
+    Запрос запоминается как алиас места с теми же координатами.
+    Ошибка записи не мешает ответу: координаты уже получены от API.
+    """
+    try:
+        # get_or_create сам обрабатывает гонку за уникальные координаты.
+        location, _ = GeoLocation.objects.get_or_create(
+            latitude=data['lat'], longitude=data['lon'], defaults={'name': city.strip()}
+        )
+        CityAlias.objects.update_or_create(alias=normalize_city_name(city), defaults={'location': location})
+        return _to_result(location)
+    except DatabaseError as err:
+        logger.warning(f'Saving location {city} failed - {err}')
+        return ServiceResult.ok(data)
+
+
+async def asave_location(city: str, data: dict) -> ServiceResult:
+    """Сохранение координат города после успешного геокодинга (асинхронно)."""
+    try:
+        location, _ = await GeoLocation.objects.aget_or_create(
+            latitude=data['lat'], longitude=data['lon'], defaults={'name': city.strip()}
+        )
+        await CityAlias.objects.aupdate_or_create(alias=normalize_city_name(city), defaults={'location': location})
+        return _to_result(location)
+    except DatabaseError as err:
+        logger.warning(f'Saving location {city} failed - {err}')
+        return ServiceResult.ok(data)
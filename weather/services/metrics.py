@@ -0,0 +1,279 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitOpen
+from .deadline import DeadlineExceeded
+from .rate_limit import RateLimitExceeded
+
+# Границы корзин гистограмм в секундах (метка le).
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Семейства ключей кеша для счетчиков попаданий; более длинные префиксы раньше.
+KEY_FAMILIES = (
+    'geo_coords',
+    'geo_location',
+    'current_weather',
+    'forecast_daily',
+    'forecast',
+    'overrides',
+    'response_generation',
+    'response',
+)
+
+STAGE_DURATION = 'weather_stage_duration_seconds'
+REQUEST_DURATION = 'weather_request_duration_seconds'
+REQUESTS = 'weather_requests_total'
+REQUESTS_IN_FLIGHT = 'weather_requests_in_flight'
+CACHE_LOOKUPS = 'weather_cache_lookups_total'
+UPSTREAM_RESPONSES = 'weather_upstream_responses_total'
+UPSTREAM_IN_FLIGHT = 'weather_upstream_in_flight'
+
+# Тип и описание метрик реестра.
+DESCRIPTIONS = {
+    STAGE_DURATION: ('histogram', 'Duration of request stages'),
+    REQUEST_DURATION: ('histogram', 'Duration of API requests by route'),
+    REQUESTS: ('counter', 'API responses by route and status'),
+    REQUESTS_IN_FLIGHT: ('gauge', 'API requests being processed'),
+    CACHE_LOOKUPS: ('counter', 'Cache lookups by key family and result (l1_hit, l2_hit, miss)'),
+    UPSTREAM_RESPONSES: ('counter', 'OpenWeatherMap responses by endpoint and status (rejected, error)'),
+    UPSTREAM_IN_FLIGHT: ('gauge', 'OpenWeatherMap requests in flight by endpoint'),
+}
+
+# Длительность стадий текущего запроса для заголовка Server-Timing: стадия -> секунды.
+_timings: ContextVar[dict[str, float] | None] = ContextVar('weather_stage_timings', default=None)
+
+
+def key_family(key: str) -> str:
+    for family in KEY_FAMILIES:
+        if key.startswith(family):
+            return family
+    return 'other'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Метрики процесса: счетчики, показатели и накопительные гистограммы с метками.
+
+    Метки — кортеж пар (имя, значение). Значения других компонентов (лимитер,
+    автоматы, hedging, кеш) собираются при выдаче.
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.gauges = Counter()
+        # (имя, метки) -> [счетчики корзин..., +Inf, сумма]
+        self.histograms: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1) -> None:
+        with self._lock:
+            self.counters[name, labels] += value
+
+    def add(self, name: str, labels: tuple = (), delta: float = 1) -> None:
+        with self._lock:
+            self.gauges[name, labels] += delta
+
+    def observe(self, name: str, labels: tuple, seconds: float) -> None:
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    def samples(self) -> dict[str, list[tuple[str, tuple, float]]]:
+        """Значения по метрикам: имя -> [(суффикс, метки, значение)]."""
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append(('', labels, value))
+            for (name, labels), value in self.gauges.items():
+                samples.setdefault(name, []).append(('', labels, value))
+            for (name, labels), histogram in self.histograms.items():
+                rows = samples.setdefault(name, [])
+                seen = 0
+                for bound, count in zip((*BUCKETS, '+Inf'), histogram[:-1]):
+                    seen += count
+                    rows.append(('_bucket', labels + (('le', bound),), seen))
+                rows.append(('_sum', labels, histogram[-1]))
+                rows.append(('_count', labels, seen))
+        return samples
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        descriptions = dict(DESCRIPTIONS)
+        samples = self.samples()
+        for name, kind, description, rows in _collect_components():
+            descriptions[name] = (kind, description)
+            samples.setdefault(name, []).extend(rows)
+
+        lines = []
+        for name in sorted(samples):
+            kind, description = descriptions.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples[name]:
+                lines.append(f'{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _collect_components() -> list[tuple[str, str, str, list]]:
+    """Счетчики лимитера, автоматов отключения, hedging, пула соединений, уровней кеша и снимков."""
+    from .circuit_breaker import get_circuit_breakers
+    from .hedging import get_hedging
+    from .http import get_transport
+    from .rate_limit import get_rate_limiter
+    from .snapshots import get_snapshot_writer
+    from .tiered_cache import get_tiered_cache
+
+    collected = []
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        rows = [
+            ('', (('budget', budget), ('decision', decision)), count)
+            for budget, decisions in limiter.stats().items()
+            for decision, count in decisions.items()
+        ]
+        collected.append(('weather_rate_limit_decisions_total', 'counter', 'Rate limiter decisions', rows))
+
+    states, rejected = [], []
+    for endpoint, breaker in get_circuit_breakers().items():
+        stats = breaker.stats()
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            states.append(('', (('endpoint', endpoint), ('state', state)), int(stats['state'] == state)))
+        rejected.append(('', (('endpoint', endpoint),), stats['rejected']))
+    if states:
+        collected.append(('weather_circuit_breaker_state', 'gauge', 'Circuit breaker state', states))
+        collected.append(('weather_circuit_breaker_rejected_total', 'counter', 'Calls rejected by breaker', rejected))
+
+    hedging = get_hedging()
+    if hedging is not None:
+        rows = [('', (('event', event),), count) for event, count in hedging.stats().items()]
+        collected.append(('weather_hedging_total', 'counter', 'Hedged requests', rows))
+
+    pool = get_transport().stats()
+    rows = [('', (('event', event),), pool[event]) for event in ('requests', 'new_connections')]
+    collected.append(('weather_http_pool_total', 'counter', 'Upstream connection pool usage', rows))
+
+    tiered_cache = get_tiered_cache().stats()
+    rows = [
+        ('', (('tier', tier), ('event', event)), count)
+        for tier in ('l1', 'l2')
+        for event, count in tiered_cache[tier].items()
+        if event not in ('size', 'max_size')
+    ]
+    collected.append(('weather_tiered_cache_total', 'counter', 'Tiered cache events', rows))
+    collected.append(
+        ('weather_local_cache_size', 'gauge', 'Entries in L1 cache', [('', (), tiered_cache['l1']['size'])])
+    )
+
+    writer = get_snapshot_writer()
+    if writer is not None:
+        rows = [('', (('event', event),), count) for event, count in writer.stats().items()]
+        collected.append(('weather_snapshots_total', 'counter', 'Weather snapshots written, dropped, failed', rows))
+    return collected
+
+
+_metrics: Metrics | None = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics | None:
+    """Общий для процесса реестр метрик или None, если метрики выключены."""
+    global _metrics
+
+    if not settings.WEATHER_METRICS['ENABLED']:
+        return None
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+@contextmanager
+def stage(name: str):
+    """Замер стадии запроса: гистограмма стадий и заголовок Server-Timing."""
+    metrics = get_metrics()
+    if metrics is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe(STAGE_DURATION, (('stage', name),), elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def upstream_call(endpoint: str):
+    """Стадия upstream_{endpoint}, число запросов в полете и счетчик ответов по статусам.
+
+    Вызывающий записывает статус ответа в outcome['status']; быстрый отказ
+    (автомат, лимит, срок) учитывается как rejected, исключение — как error.
+    """
+    metrics = get_metrics()
+    outcome = {'status': 'error'}
+    if metrics is None:
+        yield outcome
+        return
+
+    labels = (('endpoint', endpoint),)
+    metrics.add(UPSTREAM_IN_FLIGHT, labels)
+    try:
+        with stage(f'upstream_{endpoint}'):
+            yield outcome
+    except (CircuitOpen, DeadlineExceeded, RateLimitExceeded):
+        outcome['status'] = 'rejected'
+        raise
+    finally:
+        metrics.add(UPSTREAM_IN_FLIGHT, labels, -1)
+        metrics.inc(UPSTREAM_RESPONSES, labels + (('status', outcome['status']),))
+
+
+def record_cache_lookup(key: str, result: str) -> None:
+    """Учет обращения к кешу: result — l1_hit, l2_hit или miss."""
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.inc(CACHE_LOOKUPS, (('family', key_family(key)), ('result', result)))
+
+
+def start_timings() -> object:
+    """Начало учета стадий запроса; возвращает токен для finish_timings."""
+    return _timings.set({})
+
+
+def finish_timings(token) -> dict[str, float]:
+    timings = _timings.get() or {}
+    _timings.reset(token)
+    return timings
+
+
+def server_timing(timings: dict[str, float]) -> str:
+    """Значение заголовка Server-Timing: длительности стадий в миллисекундах."""
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items())
@@ -1,84 +1,230 @@
+import asyncio
+import contextvars
 import os
-from dataclasses import dataclass, field
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, date, datetime, timedelta
+from functools import partial
 import logging
 
+import httpx
 import requests
+from django.conf import settings
+from django.db import close_old_connections
 from dotenv import load_dotenv
-from django.core.cache import cache
+
+from .caching import (
+    CacheEntry,
+    aget_or_load,
+    aget_or_load_fields,
+    aprefetch,
+    get_or_load,
+    get_or_load_fields,
+    get_policy,
+    get_single_flight,
+    prefetch,
+    read_fields,
+    restore_fields,
+    write_entry,
+    write_fields,
+)
+from .circuit_breaker import CircuitOpen
+from .deadline import DeadlineExceeded
+from .http import AsyncHttpTransport, HttpTransport, get_async_transport, get_transport
+from .metrics import stage, upstream_call
+from .payload import loads, log_body
+from .locations import (
+    afind_location,
+    asave_location,
+    city_digest,
+    find_location,
+    save_location,
+    weather_coords,
+    weather_location,
+)
+from .rate_limit import GEO, ONECALL, RateLimitExceeded
+from .result import ServiceResult
+from .snapshots import (
+    acurrent_entry,
+    aforecast_entries,
+    current_entry,
+    forecast_entries,
+    record_current,
+    record_forecast,
+)
+from .tiered_cache import acache_session, cache_session, get_tiered_cache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Сколько прошедших дней удалять из хеша прогноза: хеш живет меньше суток с последней записи,
+# а локальная дата места отличается от даты сервера не больше чем на день.
+PAST_FORECAST_DAYS = 3
+# One Call daily отдает прогноз на сегодня и 7 дней вперед; дальние дни берутся из day_summary.
+DAILY_FORECAST_DAYS = 8
+# Формат даты в полях хеша прогноза.
+FORECAST_FIELD_FORMAT = '%d.%m.%Y'
 
-@dataclass
-class ServiceResult:
-    status: str
-    data: dict = field(default_factory=dict)
-    errors: dict = field(default_factory=dict)
-
-    @classmethod
-    def ok(cls, data: dict) -> "ServiceResult":
-        """Создание экземпляра с успешным результатом."""
-        return cls(status='ok', data=data)
-
-    @classmethod
-    def fail(cls, error: str) -> "ServiceResult":
-        """Создание экземпляра с неудачным результатом."""
-        return cls(status='fail', errors={'error': error})
-
-    @property
-    def is_ok(self) -> bool:
-        return self.status == 'ok'
+CURRENT_WEATHER_PREFIX = 'current_weather_'
+FORECAST_PREFIX = 'forecast_'
 
 
 class OpenWeatherBase:
     BASE_URL: str = 'https://api.openweathermap.org'
-    DEFAULT_REQUEST_TIMEOUT: int = 15
+    # Эндпоинт API: бюджет в OPENWEATHERMAP_RATE_LIMIT и автомат в OPENWEATHERMAP_CIRCUIT_BREAKER.
+    ENDPOINT: str | None = None
 
-    def __init__(self):
+    def __init__(self, transport: HttpTransport | None = None, async_transport: AsyncHttpTransport | None = None):
         self.api_key = os.getenv('OPENWEATHERMAP_API_KEY')
+        self.transport = transport or get_transport()
+        self.async_transport = async_transport or get_async_transport()
+
+    def _request_params(self, params: dict | None) -> dict:
+        if not params:
+            params = {}
+
+        params['appid'] = self.api_key
+        params['units'] = 'metric'
+        return params
+
+    def _decode(self, method: str, url: str, status: int, body: bytes, started: float) -> dict | list | None:
+        latency_ms = round((time.monotonic() - started) * 1000, 1)
+        # Тело ответа (десятки КБ у One Call) в лог не пишется: только сводка и выборочно тело в DEBUG.
+        logger.info(
+            f'OpenWeatherMap response - endpoint={self.ENDPOINT} status={status} bytes={len(body)} '
+            f'latency_ms={latency_ms}',
+            extra={'endpoint': self.ENDPOINT, 'status': status, 'bytes': len(body), 'latency_ms': latency_ms},
+        )
+        log_body(method, url, body, settings.OPENWEATHERMAP_HTTP['LOG_BODY_SAMPLE_RATE'])
+        try:
+            return loads(body)
+        except ValueError as err:
+            logger.error(f'{method} request to {url} returned invalid JSON - {err}')
+            return
 
     def _api_request(
-        self, url: str, method: str = 'get', params: dict | None = None, timeout: int = DEFAULT_REQUEST_TIMEOUT
-    ) -> requests.Response | None:
-        """Запрос к OpenWeatherMap API."""
+        self, url: str, method: str = 'get', params: dict | None = None, timeout: float | tuple | None = None
+    ) -> dict | list | None:
+        """Запрос к OpenWeatherMap API; тело ответа разбирается один раз."""
         try:
-            if not params:
-                params = {}
-
-            params['appid'] = self.api_key
-            params['units'] = 'metric'
+            params = self._request_params(params)
 
-            response = requests.request(method, url=url, params=params, timeout=timeout)
-            logger.info(f'OpenWeatherMap response - {response.status_code}, {response.text}')
+            started = time.monotonic()
+            with upstream_call(self.ENDPOINT) as call:
+                response = self.transport.request(method, url, params=params, timeout=timeout, endpoint=self.ENDPOINT)
+                call['status'] = response.status_code
             response.raise_for_status()
-            return response
+            return self._decode(method, url, response.status_code, response.content, started)
+        except (CircuitOpen, DeadlineExceeded, RateLimitExceeded) as err:
+            # Быстрый отказ: устаревшее значение, если оно есть, отдаст кеш.
+            logger.warning(f'{method} request to {url} rejected - {err}')
+            return
         except requests.RequestException as err:
             logger.error(f'{method} request to {url} error - {err}')
             return
 
+    async def _aapi_request(
+        self, url: str, method: str = 'get', params: dict | None = None, timeout: float | tuple | None = None
+    ) -> dict | list | None:
+        """Асинхронный запрос к OpenWeatherMap API."""
+        try:
+            params = self._request_params(params)
+
+            started = time.monotonic()
+            with upstream_call(self.ENDPOINT) as call:
+                response = await self.async_transport.request(
+                    method, url, params=params, timeout=timeout, endpoint=self.ENDPOINT
+                )
+                call['status'] = response.status_code
+            response.raise_for_status()
+            return self._decode(method, url, response.status_code, response.content, started)
+        except (CircuitOpen, DeadlineExceeded, RateLimitExceeded) as err:
+            logger.warning(f'{method} request to {url} rejected - {err}')
+            return
+        except httpx.HTTPError as err:
+            logger.error(f'{method} request to {url} error - {err}')
+            return
+
 
 class GeoService(OpenWeatherBase):
     """Геосервис OpenWeatherMap."""
 
-    def __init__(self):
-        super().__init__()
+    ENDPOINT = GEO
+
+    def __init__(self, transport: HttpTransport | None = None, async_transport: AsyncHttpTransport | None = None):
+        super().__init__(transport, async_transport)
         self.geo_url = f'{self.BASE_URL}/geo/1.0/direct'
 
+    @staticmethod
+    def cache_key(city: str) -> str:
+        # Разные написания города после нормализации дают один ключ.
+        return f'geo_coords_{city_digest(city)}'
+
+    @staticmethod
+    def location_link_key(city: str) -> str:
+        # Место города строкой: по ней prefetch читает ключи места в том же обращении к Redis.
+        return f'geo_location_{city_digest(city)}'
+
     def get_coordinates(self, city: str) -> ServiceResult:
-        """Координаты запрошенного города."""
-        cache_key = f'geo_coords_{city}'
-        cached = cache.get(cache_key)
-        if cached:
-            return ServiceResult.ok(cached)
-
-        params = {'q': city, 'limit': 1}
-        response = self._api_request(self.geo_url, params=params)
-        if not response:
+        """Координаты запрошенного города: кеш, затем таблица GeoLocation, затем API."""
+        with stage('geocoding'):
+            result = get_or_load(self.cache_key(city), lambda: self._load_coordinates(city))
+        self._link_location(city, result)
+        return result
+
+    async def aget_coordinates(self, city: str) -> ServiceResult:
+        """Координаты запрошенного города (асинхронно)."""
+        with stage('geocoding'):
+            result = await aget_or_load(self.cache_key(city), lambda: self._aload_coordinates(city))
+        self._link_location(city, result)
+        return result
+
+    def _link_location(self, city: str, result: ServiceResult) -> None:
+        if result.is_ok:
+            timeout = get_policy(self.cache_key(city)).timeout
+            get_tiered_cache().set_link(self.location_link_key(city), weather_location(result.data), timeout)
+
+    def _load_coordinates(self, city: str) -> ServiceResult:
+        stored = find_location(city)
+        if stored:
+            return stored
+
+        result = self._fetch_coordinates(city)
+        if result.is_ok:
+            return save_location(city, result.data)
+        return result
+
+    async def _aload_coordinates(self, city: str) -> ServiceResult:
+        stored = await afind_location(city)
+        if stored:
+            return stored
+
+        result = await self._afetch_coordinates(city)
+        if result.is_ok:
+            return await asave_location(city, result.data)
+        return result
+
+    def _fetch_coordinates(self, city: str) -> ServiceResult:
+        data = self._api_request(self.geo_url, params=self._coordinates_params(city))
+        if data is None:
             return ServiceResult.fail('Geocoding error')
 
-        data = response.json()
+        return self._parse_coordinates(city, data)
+
+    async def _afetch_coordinates(self, city: str) -> ServiceResult:
+        data = await self._aapi_request(self.geo_url, params=self._coordinates_params(city))
+        if data is None:
+            return ServiceResult.fail('Geocoding error')
+
+        return self._parse_coordinates(city, data)
+
+    @staticmethod
+    def _coordinates_params(city: str) -> dict:
+        return {'q': city, 'limit': 1}
+
+    @staticmethod
+    def _parse_coordinates(city: str, data: list) -> ServiceResult:
         if not data:
             return ServiceResult.fail(f'City {city} not found.')
 
@@ -93,76 +239,275 @@ class GeoService(OpenWeatherBase):
             longitude_key: city_data[longitude_key],
         }
 
-        cache.set(cache_key, result_data)
         return ServiceResult.ok(result_data)
 
 
 class WeatherService(OpenWeatherBase):
     """Сервис погоды OpenWeatherMap."""
 
-    def __init__(self):
-        super().__init__()
-        self.geo_client = GeoService()
+    ENDPOINT = ONECALL
+
+    def __init__(self, transport: HttpTransport | None = None, async_transport: AsyncHttpTransport | None = None):
+        super().__init__(transport, async_transport)
+        self.geo_client = GeoService(self.transport, self.async_transport)
         self.weather_url = f'{self.BASE_URL}/data/3.0/onecall'
+        self.day_summary_url = f'{self.weather_url}/day_summary'
+
+    @staticmethod
+    def current_weather_cache_key(coords: dict) -> str:
+        return f'{CURRENT_WEATHER_PREFIX}{weather_location(coords)}'
+
+    @staticmethod
+    def forecast_cache_key(coords: dict) -> str:
+        # Прогноз места хранится одним хешем Redis: поле на дату, время жизни общее.
+        return f'{FORECAST_PREFIX}{weather_location(coords)}'
+
+    @staticmethod
+    def forecast_field(target_date: date) -> str:
+        return target_date.strftime(FORECAST_FIELD_FORMAT)
+
+    def _restore_current_weather(self, coords: dict) -> CacheEntry | None:
+        # Запасной уровень кеша: последний снимок из WeatherSnapshot.
+        return current_entry(weather_location(coords), get_policy(self.current_weather_cache_key(coords)))
+
+    async def _arestore_current_weather(self, coords: dict) -> CacheEntry | None:
+        return await acurrent_entry(weather_location(coords), get_policy(self.current_weather_cache_key(coords)))
+
+    def _restore_forecast(self, coords: dict, fields: list[str]) -> dict[str, CacheEntry]:
+        days = [datetime.strptime(field, FORECAST_FIELD_FORMAT).date() for field in fields]
+        entries = forecast_entries(weather_location(coords), days, get_policy(self.forecast_cache_key(coords)))
+        return {self.forecast_field(day): entry for day, entry in entries.items()}
+
+    async def _arestore_forecast(self, coords: dict, fields: list[str]) -> dict[str, CacheEntry]:
+        days = [datetime.strptime(field, FORECAST_FIELD_FORMAT).date() for field in fields]
+        entries = await aforecast_entries(weather_location(coords), days, get_policy(self.forecast_cache_key(coords)))
+        return {self.forecast_field(day): entry for day, entry in entries.items()}
+
+    def _prefetch_args(self, city: str, keys: list[str], current: bool, forecast_dates: list[date]) -> dict:
+        linked = {}
+        if current:
+            linked[CURRENT_WEATHER_PREFIX] = None
+        if forecast_dates:
+            linked[FORECAST_PREFIX] = [self.forecast_field(day) for day in forecast_dates]
+        return {
+            'keys': [self.geo_client.cache_key(city), *keys],
+            'link': self.geo_client.location_link_key(city),
+            'linked': linked,
+        }
+
+    def prefetch(self, city: str, keys: list[str] = (), current: bool = False, forecast_dates: list[date] = ()) -> None:
+        """Чтение заранее ключей запроса по городу внутри cache_session: координаты, keys,
+        текущая погода и прогноз места на forecast_dates — одним обращением к Redis.
+        """
+        prefetch(**self._prefetch_args(city, keys, current, forecast_dates))
+
+    async def aprefetch(
+        self, city: str, keys: list[str] = (), current: bool = False, forecast_dates: list[date] = ()
+    ) -> None:
+        await aprefetch(**self._prefetch_args(city, keys, current, forecast_dates))
 
     def get_current_weather(self, city: str) -> ServiceResult:
         """Текущая температура и локальное время в запрошенном городе."""
-        cache_key = f'current_weather_{city}'
-        cached = cache.get(cache_key)
-        if cached:
-            return ServiceResult.ok(cached)
-
-        coords_result = self.geo_client.get_coordinates(city)
-        if not coords_result.ok:
-            return coords_result
-
-        params = {
-            'lat': coords_result.data['lat'],
-            'lon': coords_result.data['lon'],
-            'exclude': 'minutely,hourly,daily,alerts',
-        }
+        with cache_session():
+            self.prefetch(city, current=True)
+            coords_result = self.geo_client.get_coordinates(city)
+            if not coords_result.is_ok:
+                return coords_result
+
+            coords = coords_result.data
+            key = self.current_weather_cache_key(coords)
+            # Без ссылки на место ключ погоды не прочитан заранее — читаем его вместе с блокировкой.
+            prefetch([key])
+            return get_or_load(
+                key, lambda: self._fetch_current_weather(coords), restore=lambda: self._restore_current_weather(coords)
+            )
+
+    async def aget_current_weather(self, city: str) -> ServiceResult:
+        """Текущая температура и локальное время в запрошенном городе (асинхронно)."""
+        async with acache_session():
+            await self.aprefetch(city, current=True)
+            coords_result = await self.geo_client.aget_coordinates(city)
+            if not coords_result.is_ok:
+                return coords_result
+
+            coords = coords_result.data
+            key = self.current_weather_cache_key(coords)
+            await aprefetch([key])
+            return await aget_or_load(
+                key,
+                lambda: self._afetch_current_weather(coords),
+                restore=lambda: self._arestore_current_weather(coords),
+            )
+
+    def get_current_weather_bulk(self, cities: list[str], concurrency: int | None = None) -> dict[str, ServiceResult]:
+        """Текущая погода в нескольких городах, города запрашиваются параллельно.
+
+        Ошибка по одному городу не влияет на остальные.
+        """
+        concurrency = concurrency or settings.WEATHER_BULK_CONCURRENCY
+        main_thread = threading.current_thread()
+
+        def fetch(city: str) -> ServiceResult:
+            try:
+                return self.get_current_weather(city)
+            except Exception:
+                logger.exception(f'Current weather for {city} failed')
+                return ServiceResult.fail('Error retrieving current weather data')
+            finally:
+                # Соединения с БД, открытые в потоках пула, закрываются вместе с задачей.
+                if threading.current_thread() is not main_thread:
+                    close_old_connections()
+
+        if len(cities) <= 1:
+            return {city: fetch(city) for city in cities}
+
+        # Потоки пула работают в контексте запроса, в том числе с его сроком.
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(cities))) as executor:
+            return dict(zip(cities, executor.map(lambda city: context.copy().run(fetch, city), cities)))
+
+    async def aget_current_weather_bulk(
+        self, cities: list[str], concurrency: int | None = None
+    ) -> dict[str, ServiceResult]:
+        """Текущая погода в нескольких городах (асинхронно)."""
+        semaphore = asyncio.Semaphore(concurrency or settings.WEATHER_BULK_CONCURRENCY)
+
+        async def fetch(city: str) -> ServiceResult:
+            async with semaphore:
+                try:
+                    return await self.aget_current_weather(city)
+                except Exception:
+                    logger.exception(f'Current weather for {city} failed')
+                    return ServiceResult.fail('Error retrieving current weather data')
+
+        return dict(zip(cities, await asyncio.gather(*(fetch(city) for city in cities))))
+
+    def refresh_current_weather(self, coords: dict) -> ServiceResult:
+        """Обновление текущей погоды места в кеше в обход актуального значения."""
+        result = self._fetch_current_weather(coords)
+        if result.is_ok:
+            write_entry(self.current_weather_cache_key(coords), result.data)
+        return result
+
+    def _fetch_current_weather(self, coords: dict) -> ServiceResult:
+        data = self._api_request(self.weather_url, params=self._current_weather_params(coords))
+        if data is None:
+            return ServiceResult.fail('Error retrieving current weather data')
 
-        response = self._api_request(self.weather_url, params=params)
-        if not response:
+        return self._record_current_weather(coords, self._parse_current_weather(data))
+
+    async def _afetch_current_weather(self, coords: dict) -> ServiceResult:
+        data = await self._aapi_request(self.weather_url, params=self._current_weather_params(coords))
+        if data is None:
             return ServiceResult.fail('Error retrieving current weather data')
 
-        data = response.json()
+        return self._record_current_weather(coords, self._parse_current_weather(data))
+
+    @staticmethod
+    def _record_current_weather(coords: dict, result: ServiceResult) -> ServiceResult:
+        if result.is_ok:
+            record_current(weather_location(coords), result.data)
+        return result
+
+    @staticmethod
+    def _current_weather_params(coords: dict) -> dict:
+        coords = weather_coords(coords)
+        return {
+            'lat': coords['lat'],
+            'lon': coords['lon'],
+            'exclude': 'minutely,hourly,daily,alerts',
+        }
+
+    @staticmethod
+    def _parse_current_weather(data: dict) -> ServiceResult:
         current = data.get('current')
         timezone_offset = data.get('timezone_offset', 0)
         if not current:
             return ServiceResult.fail('Error retrieving current weather data')
 
-        local_time = datetime.utcfromtimestamp(current['dt'] + timezone_offset).strftime('%H:%M')
+        local_time = datetime.fromtimestamp(current['dt'] + timezone_offset, tz=UTC).strftime('%H:%M')
         result_data = {
             'temperature': current['temp'],
             'local_time': local_time,
         }
 
-        cache.set(cache_key, result_data)
         return ServiceResult.ok(result_data)
 
     def get_forecast(self, city: str, target_date: datetime) -> ServiceResult:
         """Прогноз погоды по дате (min и max температура)."""
-        cache_key = f'forecast_{city}_{target_date.strftime("%d.%m.%Y")}'
-        cached = cache.get(cache_key)
-        if cached:
-            return ServiceResult.ok(cached)
-
-        coords_result = self.geo_client.get_coordinates(city)
-        if not coords_result.ok:
-            return coords_result
-
-        url = f'{self.weather_url}/day_summary'
-        params = {
-            'lat': coords_result.data['lat'],
-            'lon': coords_result.data['lon'],
+        with cache_session():
+            self.prefetch(city, forecast_dates=[target_date])
+            coords_result = self.geo_client.get_coordinates(city)
+            if not coords_result.is_ok:
+                return coords_result
+
+            coords = coords_result.data
+            prefetch(fields={self.forecast_cache_key(coords): [self.forecast_field(target_date)]})
+            return self._get_forecast(coords, target_date)
+
+    async def aget_forecast(self, city: str, target_date: datetime) -> ServiceResult:
+        """Прогноз погоды по дате (асинхронно)."""
+        async with acache_session():
+            await self.aprefetch(city, forecast_dates=[target_date])
+            coords_result = await self.geo_client.aget_coordinates(city)
+            if not coords_result.is_ok:
+                return coords_result
+
+            coords = coords_result.data
+            key, field = self.forecast_cache_key(coords), self.forecast_field(target_date)
+            await aprefetch(fields={key: [field]})
+            loaders = {field: lambda: self._afetch_forecast(coords, target_date)}
+            results = await aget_or_load_fields(
+                key, loaders, restore=lambda fields: self._arestore_forecast(coords, fields)
+            )
+            return results[field]
+
+    def _get_forecast(self, coords: dict, target_date: date) -> ServiceResult:
+        return self._get_forecasts(coords, [target_date])[target_date]
+
+    def _get_forecasts(self, coords: dict, dates: list[date], entries: dict | None = None) -> dict[date, ServiceResult]:
+        fields = {self.forecast_field(day): day for day in dates}
+        loaders = {field: (lambda day=day: self._fetch_forecast(coords, day)) for field, day in fields.items()}
+        results = get_or_load_fields(
+            self.forecast_cache_key(coords),
+            loaders,
+            entries,
+            restore=lambda fields: self._restore_forecast(coords, fields),
+        )
+        return {day: results[field] for field, day in fields.items()}
+
+    def _fetch_forecast(self, coords: dict, target_date: datetime) -> ServiceResult:
+        data = self._api_request(self.day_summary_url, params=self._forecast_params(coords, target_date))
+        if data is None:
+            return ServiceResult.fail('Error getting weather forecast')
+
+        return self._record_forecast(coords, target_date, self._parse_forecast(data))
+
+    async def _afetch_forecast(self, coords: dict, target_date: datetime) -> ServiceResult:
+        params = self._forecast_params(coords, target_date)
+        data = await self._aapi_request(self.day_summary_url, params=params)
+        if data is None:
+            return ServiceResult.fail('Error getting weather forecast')
+
+        return self._record_forecast(coords, target_date, self._parse_forecast(data))
+
+    @staticmethod
+    def _record_forecast(coords: dict, target_date: date, result: ServiceResult) -> ServiceResult:
+        if result.is_ok:
+            record_forecast(weather_location(coords), {target_date: result.data})
+        return result
+
+    @staticmethod
+    def _forecast_params(coords: dict, target_date: date) -> dict:
+        coords = weather_coords(coords)
+        return {
+            'lat': coords['lat'],
+            'lon': coords['lon'],
             'date': target_date.strftime('%Y.%m.%d'),
         }
-        response = self._api_request(url, params=params)
-        if not response:
-            return ServiceResult.fail('Error getting weather forecast')
 
-        data = response.json()
+    @staticmethod
+    def _parse_forecast(data: dict) -> ServiceResult:
         temperature = data.get('temperature')
         if not temperature:
             return ServiceResult.fail('Error getting weather forecast')
@@ -172,5 +517,109 @@ class WeatherService(OpenWeatherBase):
             'max': temperature['max'],
         }
 
-        cache.set(cache_key, result_data)
+        return ServiceResult.ok(result_data)
+
+    def get_forecast_range(self, city: str, dates: list[date]) -> dict[date, ServiceResult]:
+        """Прогноз погоды на несколько дат.
+
+        Отсутствующие в кеше дни берутся одним запросом One Call (daily) и
+        сохраняются в кеш по дням, оставшиеся запрашиваются через day_summary.
+        """
+        return self.get_forecast_ranges({city: dates})[city]
+
+    def get_forecast_ranges(self, ranges: dict[str, list[date]]) -> dict[str, dict[date, ServiceResult]]:
+        """Прогноз на несколько дат для нескольких городов.
+
+        Хеши прогнозов всех городов читаются одним конвейером HMGET.
+        """
+        results = {}
+        locations = {}
+        for city, dates in ranges.items():
+            coords_result = self.geo_client.get_coordinates(city)
+            if coords_result.is_ok:
+                locations[city] = coords_result.data
+            else:
+                results[city] = {day: coords_result for day in dates}
+
+        entries = read_fields(
+            {
+                self.forecast_cache_key(coords): [self.forecast_field(day) for day in ranges[city]]
+                for city, coords in locations.items()
+            }
+        )
+        for city, coords in locations.items():
+            dates = ranges[city]
+            key = self.forecast_cache_key(coords)
+            city_entries = entries[key]
+            # Дни, которых нет в Redis, сначала ищутся среди снимков, и только затем запрашиваются у API.
+            fields = [self.forecast_field(day) for day in dates if self.forecast_field(day) not in city_entries]
+            restored = restore_fields(key, fields, partial(self._restore_forecast, coords))
+            city_entries = {**city_entries, **restored}
+            horizon = date.today() + timedelta(days=DAILY_FORECAST_DAYS)
+            daily = [day for day in dates if day < horizon and self.forecast_field(day) not in city_entries]
+            if daily:
+                self._prefetch_daily_forecast(coords, daily)
+                # Прогноз на эти дни записан в хеш — читаем его заново; дни за горизонтом daily
+                # загружаются через day_summary по одному.
+                city_entries = None
+            results[city] = self._get_forecasts(coords, dates, city_entries)
+        return results
+
+    def _prefetch_daily_forecast(self, coords: dict, dates: list[date]) -> ServiceResult | None:
+        # dates — только дни в пределах DAILY_FORECAST_DAYS: другой воркер записывает ровно их.
+        cache_key = self.forecast_cache_key(coords)
+        fields = [self.forecast_field(day) for day in dates]
+
+        def lookup() -> ServiceResult | None:
+            if len(read_fields({cache_key: fields}, local=False)[cache_key]) == len(fields):
+                return ServiceResult.ok({})
+            return None
+
+        return get_single_flight().do(
+            f'forecast_daily_{weather_location(coords)}', lambda: self._fetch_daily_forecast(coords), lookup
+        )
+
+    def refresh_daily_forecast(self, coords: dict) -> ServiceResult:
+        """Обновление прогноза места на все дни One Call (daily) одним запросом."""
+        return self._fetch_daily_forecast(coords)
+
+    def _fetch_daily_forecast(self, coords: dict) -> ServiceResult:
+        data = self._api_request(self.weather_url, params=self._daily_forecast_params(coords))
+        if data is None:
+            return ServiceResult.fail('Error getting weather forecast')
+
+        result = self._parse_daily_forecast(data)
+        if result.is_ok:
+            record_forecast(weather_location(coords), result.data)
+            # Хеш живет, пока в него пишут, поэтому прошедшие дни удаляются при записи.
+            today = date.today()
+            past = [self.forecast_field(today - timedelta(days=offset)) for offset in range(1, PAST_FORECAST_DAYS + 1)]
+            days = {self.forecast_field(day): day_data for day, day_data in result.data.items()}
+            write_fields(self.forecast_cache_key(coords), days, delete=[field for field in past if field not in days])
+        return result
+
+    @staticmethod
+    def _daily_forecast_params(coords: dict) -> dict:
+        coords = weather_coords(coords)
+        return {
+            'lat': coords['lat'],
+            'lon': coords['lon'],
+            'exclude': 'current,minutely,hourly,alerts',
+        }
+
+    @staticmethod
+    def _parse_daily_forecast(data: dict) -> ServiceResult:
+        daily = data.get('daily')
+        timezone_offset = data.get('timezone_offset', 0)
+        if not daily:
+            return ServiceResult.fail('Error getting weather forecast')
+
+        result_data = {}
+        for item in daily:
+            temperature = item.get('temp')
+            if not temperature or 'dt' not in item:
+                continue
+            day = datetime.fromtimestamp(item['dt'] + timezone_offset, tz=UTC).date()
+            result_data[day] = {'min': temperature['min'], 'max': temperature['max']}
+
         return ServiceResult.ok(result_data)
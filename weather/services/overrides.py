@@ -0,0 +1,106 @@
+from datetime import date
+
+from asgiref.sync import sync_to_async
+
+from weather.models import ForecastOverride
+
+from .caching import aget_or_load, get_or_load, get_policy, read_entry, write_entry
+from .locations import normalize_city_name
+from .response_cache import invalidate_responses
+from .result import ServiceResult
+from .tiered_cache import get_tiered_cache
+
+
+def overrides_cache_key(day: date) -> str:
+    return f'overrides_{day.strftime("%d.%m.%Y")}'
+
+
+def city_override_key(city: str) -> str:
+    # Переопределение без места (сохранено до появления таблицы мест или без геокодера) ищется по названию.
+    return f'city:{normalize_city_name(city)}'
+
+
+def _load_overrides(days: list[date]) -> dict[date, dict]:
+    # Ключи словаря — строки: значение кеша остается простым JSON-совместимым словарем.
+    overrides = {day: {} for day in days}
+    rows = ForecastOverride.objects.filter(date__in=days).values_list(
+        'date', 'location_id', 'city', 'min_temperature', 'max_temperature', 'updated_at'
+    )
+    for day, location_id, city, min_temperature, max_temperature, updated_at in rows:
+        key = str(location_id) if location_id else city_override_key(city)
+        overrides[day][key] = [min_temperature, max_temperature, updated_at.timestamp()]
+    return overrides
+
+
+def _load_day(day: date) -> ServiceResult:
+    return ServiceResult.ok(_load_overrides([day])[day])
+
+
+def get_overrides(day: date) -> dict[str, list]:
+    """Переопределения прогноза на дату: id места (или city:название для записей без места) -> [min, max, время записи].
+
+    Хранится один ключ на дату со всеми переопределенными местами, поэтому
+    отсутствие переопределения (самый частый случай) тоже отвечается из кеша.
+    """
+    return get_or_load(overrides_cache_key(day), lambda: _load_day(day)).data
+
+
+async def aget_overrides(day: date) -> dict[str, list]:
+    """Переопределения прогноза на дату (асинхронно)."""
+
+    async def load() -> ServiceResult:
+        return await sync_to_async(_load_day)(day)
+
+    return (await aget_or_load(overrides_cache_key(day), load)).data
+
+
+def get_overrides_range(days: list[date]) -> dict[date, dict[str, list]]:
+    """Переопределения на несколько дат; отсутствующие в кеше даты читаются одним запросом."""
+    overrides = {}
+    for day in days:
+        entry = read_entry(overrides_cache_key(day))
+        if entry is not None and entry.is_fresh:
+            overrides[day] = entry.data
+
+    missing = [day for day in days if day not in overrides]
+    if missing:
+        loaded = _load_overrides(missing)
+        policy = get_policy(overrides_cache_key(missing[0]))
+        for day, day_overrides in loaded.items():
+            write_entry(overrides_cache_key(day), day_overrides, policy)
+        overrides.update(loaded)
+
+    return overrides
+
+
+def match_override(day_overrides: dict[str, list], coords: dict, city: str) -> list | None:
+    """[min, max] из переопределений на дату по месту города или по названию.
+
+    Пока link_forecast_overrides не привязал запись по названию, у места и даты могут быть обе
+    записи: действует более новая (например, сохраненная по названию при недоступном геокодере).
+    """
+    location_id = coords.get('location_id')
+    by_location = day_overrides.get(str(location_id)) if location_id else None
+    by_name = day_overrides.get(city_override_key(city))
+    candidates = [override for override in (by_location, by_name) if override is not None]
+    if not candidates:
+        return None
+    # Значения кеша, записанные до появления updated_at, — [min, max]: они считаются старше.
+    return max(candidates, key=lambda override: override[2:])[:2]
+
+
+def find_override(coords: dict, day: date, city: str) -> list | None:
+    """[min, max] переопределения для запрошенного города или None."""
+    return match_override(get_overrides(day), coords, city)
+
+
+async def afind_override(coords: dict, day: date, city: str) -> list | None:
+    return match_override(await aget_overrides(day), coords, city)
+
+
+def invalidate_overrides(days) -> None:
+    """Сброс кеша переопределений на даты и готовых ответов во всех воркерах."""
+    tiered_cache = get_tiered_cache()
+    for day in set(days):
+        tiered_cache.delete(overrides_cache_key(day))
+    invalidate_responses()
@@ -0,0 +1,18 @@
+import logging
+import random
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+def loads(body: bytes) -> dict | list:
+    """JSON из тела ответа (orjson)."""
+    return orjson.loads(body)
+
+
+def log_body(method: str, url: str, body: bytes, sample_rate: float) -> None:
+    """Тело ответа в DEBUG-лог для доли sample_rate ответов."""
+    if sample_rate <= 0 or not logger.isEnabledFor(logging.DEBUG) or random.random() >= sample_rate:
+        return
+    logger.debug(f'{method} {url} response body - {body.decode(errors="replace")}')
@@ -0,0 +1,166 @@
+import cProfile
+import hmac
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import UTC, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Заголовок запроса с токеном: запрос профилируется вне выборки, с ним же скачиваются профили.
+PROFILE_HEADER = 'X-Weather-Profile'
+# Заголовок ответа с идентификатором сохраненного профиля.
+PROFILE_ID_HEADER = 'X-Weather-Profile-Id'
+
+SAMPLED = 'sampled'
+REQUESTED = 'requested'
+
+
+class ProfileStore:
+    """Кольцевой буфер профилей в Redis, общий для воркеров: список описаний
+    последних size профилей и ключ с данными на каждый профиль (живет ttl секунд).
+    """
+
+    def __init__(self, size: int = 20, ttl: int = 60 * 60 * 24):
+        self.size = size
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls) -> "ProfileStore":
+        options = settings.WEATHER_PROFILING
+        return cls(size=options['BUFFER_SIZE'], ttl=options['TTL'])
+
+    @staticmethod
+    def _index_key() -> str:
+        return cache.client.make_key('profiles')
+
+    @staticmethod
+    def _data_key(profile_id: str) -> str:
+        return cache.client.make_key(f'profile_{profile_id}')
+
+    def save(self, info: dict, data: bytes) -> None:
+        """Запись профиля; старейший вытесняется из списка, его данные истекают сами."""
+        pipeline = get_redis_connection('default').pipeline()
+        pipeline.set(self._data_key(info['id']), data, ex=self.ttl)
+        pipeline.lpush(self._index_key(), json.dumps(info))
+        pipeline.ltrim(self._index_key(), 0, self.size - 1)
+        pipeline.execute()
+
+    def list(self) -> list[dict]:
+        """Описания профилей, новые первыми."""
+        return [json.loads(item) for item in get_redis_connection('default').lrange(self._index_key(), 0, -1)]
+
+    def get(self, profile_id: str) -> bytes | None:
+        return get_redis_connection('default').get(self._data_key(profile_id))
+
+
+class _LoadedStats:
+    # pstats.Stats принимает объект с create_stats() и stats — так же, как cProfile.Profile.
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+def render_text(data: bytes, limit: int = 40) -> str:
+    """Текстовая сводка профиля: limit функций с наибольшим накопленным временем."""
+    stream = io.StringIO()
+    stats = pstats.Stats(_LoadedStats(marshal.loads(data)), stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
+
+
+def has_token(request, token: str) -> bool:
+    header = request.headers.get(PROFILE_HEADER)
+    return bool(token and header and hmac.compare_digest(header.encode(), token.encode()))
+
+
+def is_authorized(request) -> bool:
+    """Токен WEATHER_PROFILING['TOKEN'] в заголовке X-Weather-Profile или сотрудник в сессии."""
+    if has_token(request, settings.WEATHER_PROFILING['TOKEN']):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+class RequestProfiler:
+    """Профилирование cProfile выбранных запросов.
+
+    Запрос профилируется с вероятностью sample_rate или по заголовку с токеном.
+    Профилировщик в процессе один: пока он занят, остальные запросы проходят без него.
+    """
+
+    def __init__(self, store: ProfileStore, sample_rate: float = 0.0, token: str = '', paths: tuple = ()):
+        self.store = store
+        self.sample_rate = sample_rate
+        self.token = token
+        self.paths = frozenset(paths)
+        self._busy = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "RequestProfiler":
+        options = settings.WEATHER_PROFILING
+        return cls(
+            ProfileStore.from_settings(),
+            sample_rate=options['SAMPLE_RATE'],
+            token=options['TOKEN'],
+            paths=options['PATHS'],
+        )
+
+    def reason(self, request) -> str | None:
+        """Почему запрос профилируется (SAMPLED, REQUESTED) или None."""
+        if request.path_info not in self.paths:
+            return None
+        if has_token(request, self.token):
+            return REQUESTED
+        if self.sample_rate and random.random() < self.sample_rate:
+            return SAMPLED
+        return None
+
+    def profile(self, request, get_response, reason: str):
+        if not self._busy.acquire(blocking=False):
+            return get_response(request)
+
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - started
+        finally:
+            self._busy.release()
+
+        profiler.create_stats()
+        info = {
+            'id': uuid.uuid4().hex,
+            'created': datetime.now(UTC).isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'reason': reason,
+        }
+        try:
+            self.store.save(info, marshal.dumps(profiler.stats))
+        except RedisError as err:
+            logger.warning(f'Saving profile of {info["path"]} failed - {err}')
+            return response
+
+        logger.info(f'Request profiled - id={info["id"]} path={info["path"]} duration_ms={info["duration_ms"]}')
+        response[PROFILE_ID_HEADER] = info['id']
+        return response
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import NoScriptError, RedisError
+
+from .async_redis import get_async_redis
+from .deadline import bounded
+
+logger = logging.getLogger(__name__)
+
+GEO = 'geo'
+ONECALL = 'onecall'
+
+# Token bucket: ARGV — токенов в секунду и емкость. Время берется у Redis, чтобы часы
+# воркеров не влияли на пополнение. Возвращает {1, 0} при выдаче токена или {0, ожидание в секундах}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode()).hexdigest()
+
+_queue_timeout: ContextVar[float | None] = ContextVar('rate_limit_queue_timeout', default=None)
+
+
+@contextmanager
+def without_queueing():
+    """Вызовы внутри блока не ждут токен: фоновому обновлению есть что отдать из кеша."""
+    token = _queue_timeout.set(0)
+    try:
+        yield
+    finally:
+        _queue_timeout.reset(token)
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimiter:
+    """Общий для всех воркеров лимит обращений к upstream: token bucket в Redis на каждый бюджет.
+
+    При исчерпанном бюджете устаревшее значение отдается из кеша (stale-while-revalidate),
+    промах ждет токен не дольше queue_timeout, затем вызов отклоняется.
+    """
+
+    def __init__(self, budgets: dict[str, dict], queue_timeout: float = 2):
+        self.budgets = budgets
+        self.queue_timeout = queue_timeout
+        self.counters = Counter()
+        self._script = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "RateLimiter":
+        options = settings.OPENWEATHERMAP_RATE_LIMIT
+        return cls(budgets=options['BUDGETS'], queue_timeout=options['QUEUE_TIMEOUT'])
+
+    def _args(self, budget: str) -> tuple[list, list]:
+        options = self.budgets[budget]
+        return [cache.client.make_key(f'rate_limit_{budget}')], [options['PER_MINUTE'] / 60, options['BURST']]
+
+    def _timeout(self) -> float:
+        override = _queue_timeout.get()
+        return bounded(self.queue_timeout if override is None else override)
+
+    def _record(self, budget: str, decision: str) -> None:
+        with self._lock:
+            self.counters[(budget, decision)] += 1
+
+    def _take(self, budget: str) -> tuple[bool, float]:
+        if self._script is None:
+            self._script = get_redis_connection('default').register_script(TOKEN_BUCKET_SCRIPT)
+        keys, args = self._args(budget)
+        allowed, wait = self._script(keys=keys, args=args)
+        return bool(allowed), float(wait)
+
+    async def _atake(self, budget: str) -> tuple[bool, float]:
+        client = get_async_redis()
+        keys, args = self._args(budget)
+        try:
+            allowed, wait = await client.evalsha(TOKEN_BUCKET_SHA, len(keys), *keys, *args)
+        except NoScriptError:
+            allowed, wait = await client.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+        return bool(allowed), float(wait)
+
+    def acquire(self, budget: str) -> None:
+        """Токен бюджета; RateLimitExceeded, если его не удалось получить за время ожидания."""
+        if budget not in self.budgets:
+            return
+
+        deadline = time.monotonic() + self._timeout()
+        waited = False
+        while True:
+            try:
+                allowed, wait = self._take(budget)
+            except RedisError as err:
+                # Недоступность Redis не должна останавливать обращения к API.
+                logger.warning(f'Rate limiter error, call admitted - {err}')
+                return self._record(budget, 'limiter_error')
+
+            if allowed:
+                return self._record(budget, 'queued' if waited else 'admitted')
+            if time.monotonic() + wait > deadline:
+                self._record(budget, 'rejected')
+                raise RateLimitExceeded(f'{budget} budget exhausted')
+
+            waited = True
+            time.sleep(wait)
+
+    async def aacquire(self, budget: str) -> None:
+        """Асинхронный вариант acquire."""
+        if budget not in self.budgets:
+            return
+
+        deadline = time.monotonic() + self._timeout()
+        waited = False
+        while True:
+            try:
+                allowed, wait = await self._atake(budget)
+            except RedisError as err:
+                logger.warning(f'Rate limiter error, call admitted - {err}')
+                return self._record(budget, 'limiter_error')
+
+            if allowed:
+                return self._record(budget, 'queued' if waited else 'admitted')
+            if time.monotonic() + wait > deadline:
+                self._record(budget, 'rejected')
+                raise RateLimitExceeded(f'{budget} budget exhausted')
+
+            waited = True
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        """Решения о допуске по бюджетам: admitted, queued, rejected, limiter_error."""
+        with self._lock:
+            stats = {budget: {} for budget in self.budgets}
+            for (budget, decision), count in self.counters.items():
+                stats.setdefault(budget, {})[decision] = count
+            return stats
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Общий для процесса лимитер или None, если ограничение выключено."""
+    global _rate_limiter
+
+    if not settings.OPENWEATHERMAP_RATE_LIMIT['ENABLED']:
+        return None
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter.from_settings()
+    return _rate_limiter
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .caching import read_entry, read_fields
+from .hot_cities import CURRENT, FORECAST, HotCities, get_hot_cities
+from .open_weather_map import DAILY_FORECAST_DAYS, WeatherService
+from .rate_limit import without_queueing
+
+logger = logging.getLogger(__name__)
+
+
+class CallBudget:
+    """Не больше limit обращений к upstream за скользящую минуту."""
+
+    def __init__(self, limit: int, period: float = 60):
+        self.limit = limit
+        self.period = period
+        self._calls: deque[float] = deque()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        while self._calls and self._calls[0] <= now - self.period:
+            self._calls.popleft()
+        if len(self._calls) >= self.limit:
+            return False
+        self._calls.append(now)
+        return True
+
+
+class RefreshScheduler:
+    """Заблаговременное обновление кеша для самых запрашиваемых городов.
+
+    Ключ обновляется, если до конца его актуальности осталось меньше
+    refresh_ahead секунд, в пределах бюджета обращений к upstream.
+    """
+
+    def __init__(
+        self,
+        service: WeatherService | None = None,
+        hot_cities: HotCities | None = None,
+        top_n: int = 50,
+        calls_per_minute: int = 60,
+        refresh_ahead: float = 120,
+        interval: float = 15,
+    ):
+        self.service = service or WeatherService()
+        self.hot_cities = hot_cities or get_hot_cities()
+        self.top_n = top_n
+        self.budget = CallBudget(calls_per_minute)
+        self.refresh_ahead = refresh_ahead
+        self.interval = interval
+
+    @classmethod
+    def from_settings(cls) -> "RefreshScheduler":
+        options = settings.WEATHER_REFRESH
+        return cls(
+            top_n=options['TOP_N'],
+            calls_per_minute=options['CALLS_PER_MINUTE'],
+            refresh_ahead=options['REFRESH_AHEAD'],
+            interval=options['INTERVAL'],
+        )
+
+    def _expiring(self, key: str) -> bool:
+        entry = read_entry(key, local=False)
+        return entry is None or entry.fresh_until - time.time() < self.refresh_ahead
+
+    def _expiring_fields(self, key: str, fields: list[str]) -> bool:
+        entries = read_fields({key: fields}, local=False)[key]
+        return any(
+            field not in entries or entries[field].fresh_until - time.time() < self.refresh_ahead for field in fields
+        )
+
+    def run_once(self) -> Counter:
+        """Один проход по популярным городам; возвращает счетчики обновлений."""
+        stats = Counter()
+        with without_queueing():
+            for kind, refresh in ((CURRENT, self._refresh_current), (FORECAST, self._refresh_forecast)):
+                for city in self.hot_cities.top(kind, self.top_n):
+                    coords_result = self.service.geo_client.get_coordinates(city)
+                    if not coords_result.is_ok:
+                        stats['geocoding_failed'] += 1
+                        continue
+                    stats[refresh(coords_result.data)] += 1
+        return stats
+
+    def _refresh_current(self, coords: dict) -> str:
+        if not self._expiring(self.service.current_weather_cache_key(coords)):
+            return 'current_fresh'
+        if not self.budget.try_acquire():
+            return 'budget_exceeded'
+        return 'current_refreshed' if self.service.refresh_current_weather(coords).is_ok else 'current_failed'
+
+    def _refresh_forecast(self, coords: dict) -> str:
+        today = date.today()
+        fields = [self.service.forecast_field(today + timedelta(days=offset)) for offset in range(DAILY_FORECAST_DAYS)]
+        if not self._expiring_fields(self.service.forecast_cache_key(coords), fields):
+            return 'forecast_fresh'
+        if not self.budget.try_acquire():
+            return 'budget_exceeded'
+        return 'forecast_refreshed' if self.service.refresh_daily_forecast(coords).is_ok else 'forecast_failed'
+
+    def run(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                stats = self.run_once()
+                logger.info(f'Refresh pass finished - {dict(stats)}')
+            except Exception:
+                logger.exception('Refresh pass failed')
+            finally:
+                close_old_connections()
+            stop.wait(max(self.interval - (time.monotonic() - started), 0))
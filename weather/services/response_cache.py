@@ -0,0 +1,107 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .async_redis import get_async_redis
+from .locations import normalize_city_name
+from .tiered_cache import get_tiered_cache
+
+# Поколение ответов: смена значения делает недоступными все ранее сохраненные ответы.
+GENERATION_KEY = 'response_generation'
+# Заголовки, которые выставляются заново при каждой отдаче ответа из кеша.
+FRESH_HEADERS = {'content-length', 'date', 'etag', 'last-modified', 'server-timing'}
+# Заголовки сохраненного ответа, которые повторяются и в ответе 304 (RFC 9110, 15.4.5).
+NOT_MODIFIED_HEADERS = {'cache-control', 'content-location', 'expires', 'vary'}
+
+
+def route_options(request: HttpRequest) -> dict | None:
+    """Настройки кеширования ответа для запроса или None, если ответ не кешируется."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    return settings.WEATHER_RESPONSE_CACHE['ROUTES'].get(request.path_info)
+
+
+def cache_key(request: HttpRequest, options: dict, generation: int) -> str:
+    """Ключ ответа по нормализованным параметрам запроса и заголовку Accept.
+
+    DRF выбирает формат ответа по ?format= (он среди параметров) и по Accept,
+    поэтому ответы в разных форматах хранятся под разными ключами.
+    """
+    params = []
+    for name in sorted(request.GET):
+        values = request.GET.getlist(name)
+        if name == 'city':
+            values = [normalize_city_name(value) for value in values]
+        params.append(f'{name}={",".join(value.strip() for value in values)}')
+    accept = ' '.join(request.headers.get('Accept', '').split())
+    digest = hashlib.blake2s(f'{"&".join(params)}\n{accept}'.encode(), digest_size=16).hexdigest()
+    return f'response_{options["NAME"]}_{generation}_{digest}'
+
+
+def generation() -> int:
+    tiered_cache = get_tiered_cache()
+    value = tiered_cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        value = tiered_cache.get(GENERATION_KEY, local=False) or 0
+    return value
+
+
+async def ageneration() -> int:
+    tiered_cache = get_tiered_cache()
+    value = await tiered_cache.aget(GENERATION_KEY)
+    if value is None:
+        await get_async_redis().set(cache.client.make_key(GENERATION_KEY), cache.client.encode(0), nx=True)
+        value = await tiered_cache.aget(GENERATION_KEY, local=False) or 0
+    return value
+
+
+def invalidate_responses() -> None:
+    """Сброс всех сохраненных ответов во всех воркерах."""
+    get_tiered_cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def make_entry(response: HttpResponse) -> dict | None:
+    """Готовый ответ для кеша: тело, заголовки (Content-Type, Vary, Allow...) и валидаторы."""
+    if response.status_code != 200 or response.streaming or response.has_header('Set-Cookie'):
+        return None
+
+    body = response.content
+    return {
+        'body': body,
+        'headers': [(name, value) for name, value in response.items() if name.lower() not in FRESH_HEADERS],
+        'etag': quote_etag(hashlib.blake2s(body, digest_size=8).hexdigest()),
+        'last_modified': int(time.time()),
+    }
+
+
+def set_validators(response: HttpResponse, entry: dict) -> HttpResponse:
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    return response
+
+
+def not_modified(request: HttpRequest, entry: dict) -> bool:
+    """Условный GET: клиенту уже известна эта версия ответа."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or entry['etag'] in (tag.strip() for tag in if_none_match.split(','))
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and entry['last_modified'] <= if_modified_since
+
+
+def cached_response(request: HttpRequest, entry: dict) -> HttpResponse:
+    if not_modified(request, entry):
+        response = HttpResponseNotModified()
+        headers = [(name, value) for name, value in entry['headers'] if name.lower() in NOT_MODIFIED_HEADERS]
+    else:
+        response = HttpResponse(entry['body'])
+        headers = entry['headers']
+    for name, value in headers:
+        response[name] = value
+    return set_validators(response, entry)
@@ -0,0 +1,22 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ServiceResult:
+    status: str
+    data: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    @classmethod
+    def ok(cls, data: dict) -> "ServiceResult":
+        """Создание экземпляра с успешным результатом."""
+        return cls(status='ok', data=data)
+
+    @classmethod
+    def fail(cls, error: str) -> "ServiceResult":
+        """Создание экземпляра с неудачным результатом."""
+        return cls(status='fail', errors={'error': error})
+
+    @property
+    def is_ok(self) -> bool:
+        return self.status == 'ok'
@@ -0,0 +1,270 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import UTC, date, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections, connections, router
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from weather.models import WeatherSnapshot
+
+from .caching import CacheEntry, CachePolicy
+
+logger = logging.getLogger(__name__)
+
+# Секция для строк позже последнего дня, у которого есть своя секция.
+MAX_PARTITION = 'pmax'
+# Ключ кеша, по которому обслуживание таблицы выполняет один процесс за интервал.
+MAINTENANCE_KEY = 'weather_snapshots_maintenance'
+
+
+def partition_name(day: date) -> str:
+    return f'p{day:%Y%m%d}'
+
+
+class SnapshotWriter:
+    """Запись снимков в БД фоновым потоком: запрос только ставит строки в очередь.
+
+    Поток пишет все накопившиеся строки одним bulk_create (не больше batch_size).
+    Снимок — лишь запасной источник, поэтому при переполненной очереди или ошибке
+    БД он теряется. Раз в maintenance_interval поток удаляет старые снимки.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        max_queue: int = 10000,
+        retention_days: int = 7,
+        partitions_ahead: int = 3,
+        maintenance_interval: float = 3600,
+    ):
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.partitions_ahead = partitions_ahead
+        self.maintenance_interval = maintenance_interval
+        self.counters = Counter()
+        self._next_maintenance = 0.0
+        self._queue: queue.Queue[WeatherSnapshot] = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='weather-snapshots', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls) -> "SnapshotWriter":
+        options = settings.WEATHER_SNAPSHOTS
+        return cls(
+            batch_size=options['BATCH_SIZE'],
+            max_queue=options['MAX_QUEUE'],
+            retention_days=options['RETENTION_DAYS'],
+            partitions_ahead=options['PARTITIONS_AHEAD'],
+            maintenance_interval=options['MAINTENANCE_INTERVAL'],
+        )
+
+    def add(self, snapshots: list[WeatherSnapshot]) -> None:
+        for snapshot in snapshots:
+            try:
+                self._queue.put_nowait(snapshot)
+            except queue.Full:
+                self.counters['dropped'] += 1
+
+    def flush(self) -> None:
+        """Ожидание записи снимков, уже поставленных в очередь."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        return {event: self.counters[event] for event in ('written', 'dropped', 'failed')}
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self._maintain()
+            except Exception:
+                # Поток переживает любую ошибку пачки: без него очередь заполнится и снимки молча пропадут.
+                logger.exception(f'Weather snapshots writer failed on a batch of {len(batch)}')
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list[WeatherSnapshot]) -> None:
+        try:
+            WeatherSnapshot.objects.bulk_create(batch)
+        except DatabaseError as err:
+            self.counters['failed'] += len(batch)
+            logger.warning(f'Writing {len(batch)} weather snapshots failed - {err}')
+            return
+        self.counters['written'] += len(batch)
+
+    def _maintain(self) -> None:
+        now = time.monotonic()
+        if now < self._next_maintenance:
+            return
+        self._next_maintenance = now + self.maintenance_interval
+
+        try:
+            if not cache.add(MAINTENANCE_KEY, 1, timeout=self.maintenance_interval):
+                return
+            pruned = prune_snapshots(self.retention_days, self.partitions_ahead)
+        except (DatabaseError, RedisError) as err:
+            logger.warning(f'Weather snapshots maintenance failed - {err}')
+            return
+        logger.info(f'Weather snapshots pruned - {pruned}')
+
+
+_writer: SnapshotWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_snapshot_writer() -> SnapshotWriter | None:
+    """Общая для процесса запись снимков или None, если WEATHER_SNAPSHOTS выключены."""
+    global _writer
+
+    if not settings.WEATHER_SNAPSHOTS['ENABLED']:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SnapshotWriter.from_settings()
+    return _writer
+
+
+def record_current(location: str, data: dict) -> None:
+    """Снимок текущей погоды места в очередь на запись."""
+    writer = get_snapshot_writer()
+    if writer is not None:
+        snapshot = WeatherSnapshot(
+            location=location, kind=WeatherSnapshot.CURRENT, data=data, fetched_at=timezone.now()
+        )
+        writer.add([snapshot])
+
+
+def record_forecast(location: str, days: dict[date, dict]) -> None:
+    """Снимки прогноза места по дням в очередь на запись."""
+    writer = get_snapshot_writer()
+    if writer is not None:
+        fetched_at = timezone.now()
+        writer.add(
+            [
+                WeatherSnapshot(
+                    location=location, kind=WeatherSnapshot.FORECAST, date=day, data=data, fetched_at=fetched_at
+                )
+                for day, data in days.items()
+            ]
+        )
+
+
+def _entry(snapshot: WeatherSnapshot, policy: CachePolicy) -> CacheEntry:
+    return CacheEntry(data=snapshot.data, fresh_until=snapshot.fetched_at.timestamp() + policy.fresh_ttl)
+
+
+def _recent(location: str, kind: str, policy: CachePolicy):
+    # Снимок старше срока хранения ключа кеша не отдается: в Redis его бы уже не было.
+    since = timezone.now() - timedelta(seconds=policy.timeout)
+    return WeatherSnapshot.objects.filter(location=location, kind=kind, fetched_at__gt=since)
+
+
+def current_entry(location: str, policy: CachePolicy) -> CacheEntry | None:
+    """Последний снимок текущей погоды места как запись кеша по политике policy."""
+    if not settings.WEATHER_SNAPSHOTS['ENABLED']:
+        return None
+    try:
+        snapshot = _recent(location, WeatherSnapshot.CURRENT, policy).order_by('-fetched_at').first()
+    except DatabaseError as err:
+        logger.warning(f'Reading current weather snapshot of {location} failed - {err}')
+        return None
+    return _entry(snapshot, policy) if snapshot else None
+
+
+async def acurrent_entry(location: str, policy: CachePolicy) -> CacheEntry | None:
+    if not settings.WEATHER_SNAPSHOTS['ENABLED']:
+        return None
+    try:
+        snapshot = await _recent(location, WeatherSnapshot.CURRENT, policy).order_by('-fetched_at').afirst()
+    except DatabaseError as err:
+        logger.warning(f'Reading current weather snapshot of {location} failed - {err}')
+        return None
+    return _entry(snapshot, policy) if snapshot else None
+
+
+def forecast_entries(location: str, days: list[date], policy: CachePolicy) -> dict[date, CacheEntry]:
+    """Последние снимки прогноза места на days как записи кеша по политике policy."""
+    if not settings.WEATHER_SNAPSHOTS['ENABLED']:
+        return {}
+    snapshots = _recent(location, WeatherSnapshot.FORECAST, policy).filter(date__in=days).order_by('fetched_at')
+    try:
+        latest = {snapshot.date: snapshot for snapshot in snapshots}
+    except DatabaseError as err:
+        logger.warning(f'Reading forecast snapshots of {location} failed - {err}')
+        return {}
+    return {day: _entry(snapshot, policy) for day, snapshot in latest.items()}
+
+
+async def aforecast_entries(location: str, days: list[date], policy: CachePolicy) -> dict[date, CacheEntry]:
+    if not settings.WEATHER_SNAPSHOTS['ENABLED']:
+        return {}
+    snapshots = _recent(location, WeatherSnapshot.FORECAST, policy).filter(date__in=days).order_by('fetched_at')
+    try:
+        latest = {snapshot.date: snapshot async for snapshot in snapshots}
+    except DatabaseError as err:
+        logger.warning(f'Reading forecast snapshots of {location} failed - {err}')
+        return {}
+    return {day: _entry(snapshot, policy) for day, snapshot in latest.items()}
+
+
+def _partitions(connection) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL',
+            [WeatherSnapshot._meta.db_table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def prune_snapshots(retention_days: int, partitions_ahead: int = 0) -> dict:
+    """Удаление снимков старше retention_days дней.
+
+    Секционированная таблица MySQL теряет секции прошедших дней целиком, а секции
+    на partitions_ahead дней вперед выделяются из pmax, пока она пуста. В других
+    БД строки удаляются запросом.
+    """
+    # Секции делят строки по дням UTC: так MySQL хранит fetched_at при USE_TZ.
+    today = timezone.now().date()
+    cutoff = today - timedelta(days=retention_days)
+    connection = connections[router.db_for_write(WeatherSnapshot)]
+    partitions = _partitions(connection) if connection.vendor == 'mysql' else []
+    if MAX_PARTITION not in partitions:
+        since = datetime.combine(cutoff, datetime.min.time(), tzinfo=UTC)
+        deleted, _ = WeatherSnapshot.objects.filter(fetched_at__lt=since).delete()
+        return {'deleted_rows': deleted}
+
+    days = [datetime.strptime(name[1:], '%Y%m%d').date() for name in partitions if name != MAX_PARTITION]
+    expired = [partition_name(day) for day in days if day < cutoff]
+    last = max(days, default=today - timedelta(days=1))
+    added = [last + timedelta(days=offset) for offset in range(1, (today - last).days + partitions_ahead + 1)]
+
+    table = connection.ops.quote_name(WeatherSnapshot._meta.db_table)
+    with connection.cursor() as cursor:
+        if expired:
+            cursor.execute(f'ALTER TABLE {table} DROP PARTITION {", ".join(expired)}')
+        if added:
+            definitions = [
+                f"PARTITION {partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1)}'))"
+                for day in added
+            ]
+            cursor.execute(
+                f'ALTER TABLE {table} REORGANIZE PARTITION {MAX_PARTITION} INTO '
+                f'({", ".join(definitions)}, PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE)'
+            )
+    return {'dropped_partitions': len(expired), 'added_partitions': len(added)}
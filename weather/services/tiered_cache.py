@@ -0,0 +1,796 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import NoScriptError, RedisError
+
+from .async_redis import get_async_redis
+from .metrics import record_cache_lookup, stage
+
+logger = logging.getLogger(__name__)
+
+# Недоступность Redis (в том числе обрыв сокета) не должна ронять запрос; ошибки в коде не глотаются.
+REDIS_ERRORS = (RedisError, ConnectionError, TimeoutError)
+
+# Чтение ключей запроса одним обращением. ARGV: токен блокировок, срок блокировки в мс,
+# префикс ключей django-redis, ключ ссылки на место (или ''), затем описания чтений:
+# режим (key — готовый ключ, linked — префикс ключа места из ссылки), имя, число полей хеша, поля.
+# На каждый отсутствующий ключ или поле берется блокировка SingleFlight (lock_{ключ} или
+# lock_{ключ}_{поле}). Ключи собираются в скрипте, поэтому он рассчитан на один сервер Redis
+# и формат ключей django-redis по умолчанию.
+PREFETCH_SCRIPT = """
+local token, ttl, base, link = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local location = false
+if link ~= '' then
+    location = redis.call('GET', base .. link)
+end
+local result = {location}
+
+local function lease(flight)
+    if redis.call('SET', base .. 'lock_' .. flight, token, 'NX', 'PX', ttl) then
+        return 1
+    end
+    return 0
+end
+
+local function read(key, first, count)
+    if count == 0 then
+        local value = redis.call('GET', base .. key)
+        table.insert(result, value)
+        table.insert(result, value and 0 or lease(key))
+        return
+    end
+    for index = first, first + count - 1 do
+        local value = redis.call('HGET', base .. key, ARGV[index])
+        table.insert(result, value)
+        table.insert(result, value and 0 or lease(key .. '_' .. ARGV[index]))
+    end
+end
+
+local index = 5
+while index <= #ARGV do
+    local mode, name, count = ARGV[index], ARGV[index + 1], tonumber(ARGV[index + 2])
+    if mode == 'key' then
+        read(name, index + 3, count)
+    elseif location then
+        read(name .. location, index + 3, count)
+    end
+    index = index + 3 + count
+end
+return result
+"""
+
+PREFETCH_SHA = hashlib.sha1(PREFETCH_SCRIPT.encode()).hexdigest()
+
+# Снятие блокировки только ее владельцем, как у redis-py Lock.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheSession:
+    """Обращения одного запроса к Redis.
+
+    Ключи, которые понадобятся запросу, читаются заранее одним скриптом вместе с
+    блокировками SingleFlight на отсутствующие, а записи, снятие блокировок и
+    инвалидация L1 копятся и уходят одним конвейером в конце запроса.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        # None — ключа или поля нет в Redis.
+        self.values: dict[str, object] = {}
+        self.fields: dict[str, dict[str, object]] = {}
+        self.links: dict[str, str | None] = {}
+        self.leases: set[str] = set()
+        self.writes: dict[str, tuple[object, float | None]] = {}
+        self.field_writes: dict[str, tuple[dict, float | None, set]] = {}
+        self.link_writes: dict[str, tuple[str, float | None]] = {}
+        self._lock = threading.Lock()
+
+    def holds_lease(self, key: str) -> bool:
+        return key in self.leases
+
+    def write(self, key: str, value, timeout: float | None) -> None:
+        with self._lock:
+            self.values[key] = value
+            self.writes[key] = (value, timeout)
+
+    def write_fields(self, key: str, values: dict, timeout: float | None, delete: list[str]) -> None:
+        with self._lock:
+            fields = self.fields.setdefault(key, {})
+            fields.update(values)
+            for field in delete:
+                fields[field] = None
+
+            pending, _, deleted = self.field_writes.get(key, ({}, None, set()))
+            pending = {field: value for field, value in pending.items() if field not in delete}
+            self.field_writes[key] = ({**pending, **values}, timeout, (deleted | set(delete)) - set(values))
+
+    def remember_fields(self, key: str, values: dict) -> None:
+        # Поля уже в Redis: запрос видит их без повторной записи.
+        with self._lock:
+            self.fields.setdefault(key, {}).update(values)
+
+    def write_link(self, key: str, location: str, timeout: float | None) -> None:
+        with self._lock:
+            self.links[key] = location
+            self.link_writes[key] = (location, timeout)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self.values.pop(key, None)
+            self.writes.pop(key, None)
+
+    def take_pending(self) -> tuple[dict, dict, dict, set]:
+        """Накопленные записи и блокировки; сессия после этого пуста."""
+        with self._lock:
+            pending = (self.writes, self.field_writes, self.link_writes, self.leases)
+            self.writes, self.field_writes, self.link_writes, self.leases = {}, {}, {}, set()
+            return pending
+
+    def remember(self, values: dict, fields: dict[str, dict], links: dict, leases: set[str]) -> None:
+        with self._lock:
+            self.values.update(values)
+            for key, key_fields in fields.items():
+                self.fields.setdefault(key, {}).update(key_fields)
+            self.links.update(links)
+            self.leases |= leases
+
+
+_session: ContextVar[CacheSession | None] = ContextVar('cache_session', default=None)
+
+
+def current_session() -> CacheSession | None:
+    return _session.get()
+
+
+@contextmanager
+def cache_session():
+    """Обращения к кешу внутри блока идут через одну CacheSession; вложенные блоки используют внешнюю."""
+    session = _session.get()
+    if session is not None:
+        yield session
+        return
+
+    session = CacheSession()
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+        get_tiered_cache().flush(session)
+
+
+@asynccontextmanager
+async def acache_session():
+    """Асинхронный вариант cache_session."""
+    session = _session.get()
+    if session is not None:
+        yield session
+        return
+
+    session = CacheSession()
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+        await get_tiered_cache().aflush(session)
+
+
+@contextmanager
+def detached_session():
+    """Записи внутри блока идут в Redis сразу: фоновая задача переживает сессию запроса."""
+    token = _session.set(None)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class LocalCache:
+    """Ограниченный по размеру LRU-кеш процесса с временем жизни записей."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.counters = Counter()
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.counters['misses'] += 1
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.counters['misses'] += 1
+                self.counters['expirations'] += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.counters['hits'] += 1
+            return value
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.counters['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """Двухуровневый кеш: LRU процесса (L1) перед Redis (L2).
+
+    Запись в L2 публикуется в канал Redis, и остальные процессы удаляют
+    ключ из своего L1.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30, channel: str = 'weather_cache_invalidate'):
+        self.local = LocalCache(max_size=max_size, ttl=ttl)
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.counters = Counter()
+        self._listener: threading.Thread | None = None
+        self._listener_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.subscribed = threading.Event()
+
+    @classmethod
+    def from_settings(cls) -> "TieredCache":
+        options = settings.WEATHER_CACHE['LOCAL']
+        return cls(max_size=options['MAX_SIZE'], ttl=options['TTL'], channel=options['INVALIDATION_CHANNEL'])
+
+    def get(self, key: str, local: bool = True):
+        """Значение ключа; с local=False L1 пропускается."""
+        self.start_listener()
+        session = _session.get()
+        if local and session is not None and key in session.values:
+            return session.values[key]
+        if local:
+            value = self.local.get(key)
+            if value is not None:
+                record_cache_lookup(key, 'l1_hit')
+                return value
+
+        with stage('redis'):
+            value = cache.get(key)
+        if value is None:
+            self.counters['misses'] += 1
+            record_cache_lookup(key, 'miss')
+            return None
+
+        self.counters['hits'] += 1
+        record_cache_lookup(key, 'l2_hit')
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value, timeout: float | None = None) -> None:
+        session = _session.get()
+        if session is not None:
+            session.write(key, value, timeout)
+            self.local.set(key, value, timeout)
+            return
+
+        cache.set(key, value, timeout=timeout)
+        self.local.set(key, value, timeout)
+        self._publish(key)
+
+    def delete(self, key: str) -> None:
+        session = _session.get()
+        if session is not None:
+            session.discard(key)
+        cache.delete(key)
+        self.local.delete(key)
+        self._publish(key)
+
+    async def aget(self, key: str, local: bool = True):
+        """Асинхронный вариант get: L2 читается через redis.asyncio в формате django-redis."""
+        self.start_listener()
+        session = _session.get()
+        if local and session is not None and key in session.values:
+            return session.values[key]
+        if local:
+            value = self.local.get(key)
+            if value is not None:
+                record_cache_lookup(key, 'l1_hit')
+                return value
+
+        with stage('redis'):
+            raw = await get_async_redis().get(cache.client.make_key(key))
+        if raw is None:
+            self.counters['misses'] += 1
+            record_cache_lookup(key, 'miss')
+            return None
+
+        value = cache.client.decode(raw)
+        self.counters['hits'] += 1
+        record_cache_lookup(key, 'l2_hit')
+        self.local.set(key, value)
+        return value
+
+    async def aset(self, key: str, value, timeout: float | None = None) -> None:
+        session = _session.get()
+        if session is not None:
+            session.write(key, value, timeout)
+            self.local.set(key, value, timeout)
+            return
+
+        milliseconds = None if timeout is None else int(timeout * 1000)
+        await get_async_redis().set(cache.client.make_key(key), cache.client.encode(value), px=milliseconds)
+        self.local.set(key, value, timeout)
+        await self._apublish(key)
+
+    async def adelete(self, key: str) -> None:
+        session = _session.get()
+        if session is not None:
+            session.discard(key)
+        await get_async_redis().delete(cache.client.make_key(key))
+        self.local.delete(key)
+        await self._apublish(key)
+
+    @staticmethod
+    def _field_key(key: str, field: str) -> str:
+        # Поле хеша в L1 и в сообщениях инвалидации — отдельный ключ.
+        return f'{key}:{field}'
+
+    def _local_fields(self, fields_by_key: dict[str, list[str]], local: bool) -> tuple[dict, dict]:
+        session = _session.get() if local else None
+        values = {key: {} for key in fields_by_key}
+        missing = {}
+        for key, fields in fields_by_key.items():
+            known = session.fields.get(key, {}) if session is not None else {}
+            for field in fields:
+                if field in known:
+                    if known[field] is not None:
+                        values[key][field] = known[field]
+                    continue
+                value = self.local.get(self._field_key(key, field)) if local else None
+                if value is None:
+                    missing.setdefault(key, []).append(field)
+                else:
+                    record_cache_lookup(key, 'l1_hit')
+                    values[key][field] = value
+        return values, missing
+
+    def _store_fields(self, values: dict, missing: dict, replies: list) -> dict[str, dict]:
+        for (key, fields), raw_values in zip(missing.items(), replies):
+            for field, raw in zip(fields, raw_values):
+                if raw is None:
+                    self.counters['misses'] += 1
+                    record_cache_lookup(key, 'miss')
+                    continue
+                value = cache.client.decode(raw)
+                self.counters['hits'] += 1
+                record_cache_lookup(key, 'l2_hit')
+                values[key][field] = value
+                self.local.set(self._field_key(key, field), value)
+        return values
+
+    def get_fields(self, fields_by_key: dict[str, list[str]], local: bool = True) -> dict[str, dict]:
+        """Поля нескольких хешей: HMGET по каждому хешу одним конвейером Redis."""
+        self.start_listener()
+        values, missing = self._local_fields(fields_by_key, local)
+        if not missing:
+            return values
+
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        for key, fields in missing.items():
+            pipeline.hmget(cache.client.make_key(key), fields)
+        with stage('redis'):
+            replies = pipeline.execute()
+        return self._store_fields(values, missing, replies)
+
+    def set_fields(
+        self, key: str, values: dict[str, object], timeout: float | None = None, delete: list[str] = ()
+    ) -> None:
+        """Запись полей хеша; время жизни задается хешу целиком, поля delete удаляются."""
+        session = _session.get()
+        if session is not None:
+            session.write_fields(key, values, timeout, delete)
+            self._update_local_fields(key, values, timeout, delete)
+            return
+
+        redis_key = cache.client.make_key(key)
+        pipeline = get_redis_connection('default').pipeline()
+        if delete:
+            pipeline.hdel(redis_key, *delete)
+        pipeline.hset(redis_key, mapping={field: cache.client.encode(value) for field, value in values.items()})
+        if timeout is not None:
+            pipeline.expire(redis_key, math.ceil(timeout))
+        pipeline.execute()
+        self._update_local_fields(key, values, timeout, delete)
+        self._publish_many([self._field_key(key, field) for field in [*values, *delete]])
+
+    async def aget_fields(self, fields_by_key: dict[str, list[str]], local: bool = True) -> dict[str, dict]:
+        self.start_listener()
+        values, missing = self._local_fields(fields_by_key, local)
+        if not missing:
+            return values
+
+        async with get_async_redis().pipeline(transaction=False) as pipeline:
+            for key, fields in missing.items():
+                pipeline.hmget(cache.client.make_key(key), fields)
+            with stage('redis'):
+                replies = await pipeline.execute()
+        return self._store_fields(values, missing, replies)
+
+    async def aset_fields(
+        self, key: str, values: dict[str, object], timeout: float | None = None, delete: list[str] = ()
+    ) -> None:
+        session = _session.get()
+        if session is not None:
+            session.write_fields(key, values, timeout, delete)
+            self._update_local_fields(key, values, timeout, delete)
+            return
+
+        redis_key = cache.client.make_key(key)
+        async with get_async_redis().pipeline(transaction=True) as pipeline:
+            if delete:
+                pipeline.hdel(redis_key, *delete)
+            pipeline.hset(redis_key, mapping={field: cache.client.encode(value) for field, value in values.items()})
+            if timeout is not None:
+                pipeline.expire(redis_key, math.ceil(timeout))
+            await pipeline.execute()
+        self._update_local_fields(key, values, timeout, delete)
+        await self._apublish_many([self._field_key(key, field) for field in [*values, *delete]])
+
+    def remember_fields(self, key: str, values: dict[str, object], timeout: float | None = None) -> None:
+        """Поля хеша, записанные в Redis в обход set_fields: попадают в сессию запроса и L1."""
+        session = _session.get()
+        if session is not None:
+            session.remember_fields(key, values)
+        self._update_local_fields(key, values, timeout, ())
+
+    def _update_local_fields(self, key: str, values: dict, timeout: float | None, delete: list[str]) -> None:
+        for field, value in values.items():
+            self.local.set(self._field_key(key, field), value, timeout)
+        for field in delete:
+            self.local.delete(self._field_key(key, field))
+
+    def set_link(self, key: str, location: str, timeout: float | None = None) -> None:
+        """Ссылка ключа города на место, по которой prefetch находит ключи места.
+
+        Пишется вместе с остальными записями сессии и только если prefetch прочитал другую.
+        """
+        session = _session.get()
+        if session is None or key not in session.links or session.links[key] == location:
+            return
+        session.write_link(key, location, timeout)
+        self.local.set(key, location, timeout)
+
+    def prefetch(
+        self,
+        session: CacheSession,
+        keys: list[str] = (),
+        fields: dict[str, list[str]] | None = None,
+        link: str | None = None,
+        linked: dict[str, list[str] | None] | None = None,
+        lock_timeout: float = 60,
+    ) -> None:
+        """Чтение ключей запроса в сессию: из L1, остальное — одним скриптом Redis.
+
+        linked — префиксы ключей места, на которое указывает ссылка link, и поля хеша
+        (None — обычный ключ). На отсутствующие ключи и поля сразу берутся блокировки
+        SingleFlight со сроком lock_timeout.
+        """
+        self.start_listener()
+        prepared = self._prefetch_args(session, keys, fields, link, linked, lock_timeout)
+        if prepared is None:
+            return
+
+        args, specs, link = prepared
+        client = get_redis_connection('default')
+        try:
+            with stage('redis'):
+                try:
+                    replies = client.evalsha(PREFETCH_SHA, 0, *args)
+                except NoScriptError:
+                    replies = client.eval(PREFETCH_SCRIPT, 0, *args)
+        except REDIS_ERRORS as err:
+            # Без предварительного чтения запрос обращается к ключам по одному.
+            logger.warning(f'Cache prefetch failed - {err}')
+            return
+        self._store_prefetched(session, specs, link, replies)
+
+    async def aprefetch(
+        self,
+        session: CacheSession,
+        keys: list[str] = (),
+        fields: dict[str, list[str]] | None = None,
+        link: str | None = None,
+        linked: dict[str, list[str] | None] | None = None,
+        lock_timeout: float = 60,
+    ) -> None:
+        self.start_listener()
+        prepared = self._prefetch_args(session, keys, fields, link, linked, lock_timeout)
+        if prepared is None:
+            return
+
+        args, specs, link = prepared
+        client = get_async_redis()
+        try:
+            with stage('redis'):
+                try:
+                    replies = await client.evalsha(PREFETCH_SHA, 0, *args)
+                except NoScriptError:
+                    replies = await client.eval(PREFETCH_SCRIPT, 0, *args)
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache prefetch failed - {err}')
+            return
+        self._store_prefetched(session, specs, link, replies)
+
+    def _prefetch_args(
+        self,
+        session: CacheSession,
+        keys: list[str],
+        fields: dict[str, list[str]] | None,
+        link: str | None,
+        linked: dict[str, list[str] | None] | None,
+        lock_timeout: float,
+    ) -> tuple[list, list, str | None] | None:
+        keys, fields, linked = list(keys), dict(fields or {}), dict(linked or {})
+        if link is not None:
+            location = session.links.get(link, self.local.get(link))
+            if location is not None or link in session.links:
+                # Место уже известно — ключи места читаются как обычные.
+                for prefix, linked_fields in linked.items():
+                    if location is None:
+                        break
+                    if linked_fields is None:
+                        keys.append(f'{prefix}{location}')
+                    else:
+                        fields[f'{prefix}{location}'] = linked_fields
+                session.remember({}, {}, {link: location}, set())
+                link, linked = None, {}
+
+        found_values, found_fields, specs = {}, {}, []
+        for key in keys:
+            if key in session.values:
+                continue
+            value = self.local.get(key)
+            if value is None:
+                specs.append(('key', key, []))
+            else:
+                record_cache_lookup(key, 'l1_hit')
+                found_values[key] = value
+        for key, key_fields in fields.items():
+            known = session.fields.get(key, {})
+            missing = []
+            for field in key_fields:
+                if field in known:
+                    continue
+                value = self.local.get(self._field_key(key, field))
+                if value is None:
+                    missing.append(field)
+                else:
+                    record_cache_lookup(key, 'l1_hit')
+                    found_fields.setdefault(key, {})[field] = value
+            if missing:
+                specs.append(('key', key, missing))
+        for prefix, linked_fields in linked.items():
+            specs.append(('linked', prefix, linked_fields or []))
+
+        session.remember(found_values, found_fields, {}, set())
+        if not specs and link is None:
+            return None
+
+        args = [session.token, int(lock_timeout * 1000), cache.client.make_key(''), link or '']
+        for mode, name, spec_fields in specs:
+            args += [mode, name, len(spec_fields), *spec_fields]
+        return args, specs, link
+
+    def _store_prefetched(self, session: CacheSession, specs: list, link: str | None, replies: list) -> None:
+        location, links = None, {}
+        if link is not None:
+            location = replies[0].decode() if replies[0] is not None else None
+            links[link] = location
+            if location is not None:
+                self.local.set(link, location)
+
+        values, fields, leases = {}, {}, set()
+        replies = iter(replies[1:])
+        for mode, name, spec_fields in specs:
+            if mode == 'linked':
+                if location is None:
+                    continue
+                name = f'{name}{location}'
+            for field in spec_fields or [None]:
+                raw, leased = next(replies), next(replies)
+                value = None if raw is None else cache.client.decode(raw)
+                self.counters['misses' if value is None else 'hits'] += 1
+                record_cache_lookup(name, 'miss' if value is None else 'l2_hit')
+                if field is None:
+                    values[name] = value
+                    local_key, flight = name, name
+                else:
+                    fields.setdefault(name, {})[field] = value
+                    local_key, flight = self._field_key(name, field), f'{name}_{field}'
+                if value is not None:
+                    self.local.set(local_key, value)
+                if leased:
+                    leases.add(flight)
+        session.remember(values, fields, links, leases)
+
+    def flush(self, session: CacheSession) -> None:
+        """Записи сессии, снятие ее блокировок и инвалидация L1 — одним конвейером."""
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        if not self._queue_flush(pipeline, session):
+            return
+        try:
+            with stage('redis'):
+                pipeline.execute()
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache session flush failed - {err}')
+
+    async def aflush(self, session: CacheSession) -> None:
+        async with get_async_redis().pipeline(transaction=False) as pipeline:
+            if not self._queue_flush(pipeline, session):
+                return
+            try:
+                with stage('redis'):
+                    await pipeline.execute()
+            except REDIS_ERRORS as err:
+                logger.warning(f'Cache session flush failed - {err}')
+
+    def release_leases(self, session: CacheSession) -> None:
+        """Досрочная отправка записей сессии и снятие ее блокировок: перед ожиданием чужой блокировки.
+
+        Иначе два запроса, каждый из которых ждет ключ, заблокированный другим,
+        простояли бы до конца ожидания SingleFlight.
+        """
+        if session.leases:
+            self.flush(session)
+
+    async def arelease_leases(self, session: CacheSession) -> None:
+        if session.leases:
+            await self.aflush(session)
+
+    def _queue_flush(self, pipeline, session: CacheSession) -> bool:
+        writes, field_writes, link_writes, leases = session.take_pending()
+        if not (writes or field_writes or link_writes or leases):
+            return False
+
+        def milliseconds(timeout: float | None) -> int | None:
+            return None if timeout is None else int(timeout * 1000)
+
+        published = [*writes, *link_writes]
+        for key, (value, timeout) in writes.items():
+            pipeline.set(cache.client.make_key(key), cache.client.encode(value), px=milliseconds(timeout))
+        for key, (values, timeout, delete) in field_writes.items():
+            redis_key = cache.client.make_key(key)
+            if delete:
+                pipeline.hdel(redis_key, *delete)
+            if values:
+                pipeline.hset(redis_key, mapping={field: cache.client.encode(value) for field, value in values.items()})
+            if timeout is not None:
+                pipeline.expire(redis_key, math.ceil(timeout))
+            published += [self._field_key(key, field) for field in [*values, *delete]]
+        for key, (location, timeout) in link_writes.items():
+            pipeline.set(cache.client.make_key(key), location, px=milliseconds(timeout))
+        # Блокировки снимаются после записей: ожидающие воркеры сразу находят значение.
+        for flight in leases:
+            pipeline.eval(RELEASE_SCRIPT, 1, cache.client.make_key(f'lock_{flight}'), session.token)
+        for key in published:
+            pipeline.publish(self.channel, f'{self.origin}:{key}')
+        return True
+
+    def stats(self) -> dict:
+        """Счетчики попаданий, промахов и вытеснений по уровням."""
+        return {
+            'l1': {**dict(self.local.counters), 'size': len(self.local), 'max_size': self.local.max_size},
+            'l2': dict(self.counters),
+        }
+
+    def _publish(self, key: str) -> None:
+        try:
+            get_redis_connection('default').publish(self.channel, f'{self.origin}:{key}')
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache invalidation publish for {key} failed - {err}')
+
+    async def _apublish(self, key: str) -> None:
+        try:
+            await get_async_redis().publish(self.channel, f'{self.origin}:{key}')
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache invalidation publish for {key} failed - {err}')
+
+    def _publish_many(self, keys: list[str]) -> None:
+        try:
+            pipeline = get_redis_connection('default').pipeline(transaction=False)
+            for key in keys:
+                pipeline.publish(self.channel, f'{self.origin}:{key}')
+            pipeline.execute()
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache invalidation publish for {len(keys)} keys failed - {err}')
+
+    async def _apublish_many(self, keys: list[str]) -> None:
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipeline:
+                for key in keys:
+                    pipeline.publish(self.channel, f'{self.origin}:{key}')
+                await pipeline.execute()
+        except REDIS_ERRORS as err:
+            logger.warning(f'Cache invalidation publish for {len(keys)} keys failed - {err}')
+
+    def start_listener(self) -> None:
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+                self._listener.start()
+
+    def stop_listener(self) -> None:
+        self._stopped.set()
+
+    def _listen(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.subscribed.set()
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._handle(message['data'])
+                pubsub.close()
+            except REDIS_ERRORS as err:
+                # Сообщения могли быть потеряны — L1 больше не согласован с Redis.
+                logger.warning(f'Cache invalidation listener error - {err}')
+                self.subscribed.clear()
+                self.local.clear()
+                self._stopped.wait(1.0)
+
+    def _handle(self, data: bytes | str) -> None:
+        if isinstance(data, bytes):
+            data = data.decode()
+        origin, _, key = data.partition(':')
+        if origin != self.origin:
+            self.local.delete(key)
+
+
+_tiered_cache: TieredCache | None = None
+_tiered_cache_lock = threading.Lock()
+
+
+def get_tiered_cache() -> TieredCache:
+    """Общий для процесса двухуровневый кеш."""
+    global _tiered_cache
+
+    if _tiered_cache is None:
+        with _tiered_cache_lock:
+            if _tiered_cache is None:
+                _tiered_cache = TieredCache.from_settings()
+    return _tiered_cache
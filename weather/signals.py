@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import ForecastOverride
+from .services.locations import normalize_city_name
+from .services.overrides import invalidate_overrides
+
+
+@receiver(pre_save, sender=ForecastOverride)
+def set_override_city_key(sender, instance: ForecastOverride, **kwargs):
+    """Ключ уникальности записи без места; привязанная запись уникальна по месту и дате."""
+    instance.city_key = normalize_city_name(instance.city) if instance.location_id is None else None
+
+
+@receiver(pre_save, sender=ForecastOverride)
+def remember_override_date(sender, instance: ForecastOverride, **kwargs):
+    """Дата записи до изменения: при переносе на другую дату сбрасываются обе."""
+    instance._previous_date = (
+        sender.objects.filter(pk=instance.pk).values_list('date', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver([post_save, post_delete], sender=ForecastOverride)
+def forecast_override_changed(sender, instance: ForecastOverride, **kwargs):
+    """Сброс кеша переопределений после записи через модель (в том числе из админки)."""
+    dates = [instance.date]
+    previous = getattr(instance, '_previous_date', None)
+    if previous is not None:
+        dates.append(previous)
+    # До коммита другой воркер успел бы снова закешировать старые данные.
+    transaction.on_commit(lambda: invalidate_overrides(dates))
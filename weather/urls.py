@@ -1,8 +1,25 @@
 from django.urls import path
 
-from .views import CurrentWeatherView, ForecastWeatherView
+from .views import (
+    CurrentWeatherAsyncView,
+    CurrentWeatherBulkAsyncView,
+    CurrentWeatherBulkView,
+    CurrentWeatherView,
+    ForecastRangeView,
+    ForecastWeatherAsyncView,
+    ForecastWeatherView,
+    ProfileDownloadView,
+    ProfileListView,
+)
 
 urlpatterns = [
     path('current/', CurrentWeatherView.as_view(), name='current-weather'),
+    path('current/bulk/', CurrentWeatherBulkView.as_view(), name='current-weather-bulk'),
     path('forecast/', ForecastWeatherView.as_view(), name='forecast-weather'),
+    path('forecast/range/', ForecastRangeView.as_view(), name='forecast-range'),
+    path('async/current/', CurrentWeatherAsyncView.as_view(), name='current-weather-async'),
+    path('async/current/bulk/', CurrentWeatherBulkAsyncView.as_view(), name='current-weather-bulk-async'),
+    path('async/forecast/', ForecastWeatherAsyncView.as_view(), name='forecast-weather-async'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<slug:profile_id>/', ProfileDownloadView.as_view(), name='profile-download'),
 ]
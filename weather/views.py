@@ -1,10 +1,21 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views import View
 from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .serializers import ForecastRequestSerializer, ForecastOverrideSerializer
+from .serializers import (
+    CurrentWeatherBulkRequestSerializer,
+    ForecastOverrideSerializer,
+    ForecastRangeRequestSerializer,
+    ForecastRequestSerializer,
+)
+from .services.forecast import aget_forecast, get_forecast, get_forecast_range, save_forecast_override
+from .services.hot_cities import CURRENT, FORECAST, get_hot_cities
+from .services.metrics import get_metrics, stage
 from .services.open_weather_map import WeatherService
-from .services.forecast import save_forecast_override, get_forecast
+from .services.profiling import ProfileStore, is_authorized, render_text
 
 
 class CurrentWeatherView(APIView):
@@ -14,6 +25,7 @@ class CurrentWeatherView(APIView):
         if not city:
             return Response({'detail': 'city parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        get_hot_cities().record(CURRENT, [city])
         result = WeatherService().get_current_weather(city)
         if not result.is_ok:
             return Response(result.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -21,12 +33,34 @@ class CurrentWeatherView(APIView):
         return Response(result.data)
 
 
+def bulk_response_data(results: dict) -> tuple[bool, dict]:
+    data = {city: result.data if result.is_ok else result.errors for city, result in results.items()}
+    is_error = not any(result.is_ok for result in results.values())
+    return is_error, data
+
+
+class CurrentWeatherBulkView(APIView):
+    def get(self, request):
+        """Текущая погода в нескольких городах."""
+        serializer = CurrentWeatherBulkRequestSerializer(data=request.query_params)
+        with stage('validation'):
+            serializer.is_valid(raise_exception=True)
+
+        get_hot_cities().record(CURRENT, serializer.validated_data['city'])
+        results = WeatherService().get_current_weather_bulk(serializer.validated_data['city'])
+        is_error, data = bulk_response_data(results)
+
+        return Response(data, status=status.HTTP_400_BAD_REQUEST if is_error else status.HTTP_200_OK)
+
+
 class ForecastWeatherView(APIView):
     def get(self, request):
         """Прогноз погоды на день в запрошенном городе."""
         serializer = ForecastRequestSerializer(data=request.query_params)
-        serializer.is_valid(raise_exception=True)
+        with stage('validation'):
+            serializer.is_valid(raise_exception=True)
 
+        get_hot_cities().record(FORECAST, [serializer.validated_data['city']])
         is_error, data = get_forecast(serializer.validated_data)
 
         return Response(data, status=status.HTTP_400_BAD_REQUEST if is_error else status.HTTP_200_OK)
@@ -34,8 +68,107 @@ class ForecastWeatherView(APIView):
     def post(self, request):
         """Запись прогноза погоды для города."""
         serializer = ForecastOverrideSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        with stage('validation'):
+            serializer.is_valid(raise_exception=True)
 
-        save_forecast_override(serializer.validated_data)
+        is_error, errors = save_forecast_override(serializer.validated_data)
+        if is_error:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'detail': 'Forecast saved successfully'}, status=status.HTTP_200_OK)
+
+
+class ForecastRangeView(APIView):
+    def get(self, request):
+        """Прогноз погоды на диапазон дат для одного или нескольких городов."""
+        serializer = ForecastRangeRequestSerializer(data=request.query_params)
+        with stage('validation'):
+            serializer.is_valid(raise_exception=True)
+
+        get_hot_cities().record(FORECAST, serializer.validated_data['city'])
+        is_error, data = get_forecast_range(serializer.validated_data)
+
+        return Response(data, status=status.HTTP_400_BAD_REQUEST if is_error else status.HTTP_200_OK)
+
+
+class CurrentWeatherAsyncView(View):
+    async def get(self, request):
+        """Текущая погода в запрошенном городе (асинхронный обработчик для ASGI)."""
+        city = request.GET.get('city')
+        if not city:
+            return JsonResponse({'detail': 'city parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        await get_hot_cities().arecord(CURRENT, [city])
+        result = await WeatherService().aget_current_weather(city)
+        if not result.is_ok:
+            return JsonResponse(result.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return JsonResponse(result.data)
+
+
+class CurrentWeatherBulkAsyncView(View):
+    async def get(self, request):
+        """Текущая погода в нескольких городах (асинхронный обработчик для ASGI)."""
+        serializer = CurrentWeatherBulkRequestSerializer(data=request.GET)
+        with stage('validation'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        await get_hot_cities().arecord(CURRENT, serializer.validated_data['city'])
+        results = await WeatherService().aget_current_weather_bulk(serializer.validated_data['city'])
+        is_error, data = bulk_response_data(results)
+
+        return JsonResponse(data, status=status.HTTP_400_BAD_REQUEST if is_error else status.HTTP_200_OK)
+
+
+class ForecastWeatherAsyncView(View):
+    async def get(self, request):
+        """Прогноз погоды на день в запрошенном городе (асинхронный обработчик для ASGI)."""
+        serializer = ForecastRequestSerializer(data=request.GET)
+        with stage('validation'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        await get_hot_cities().arecord(FORECAST, [serializer.validated_data['city']])
+        is_error, data = await aget_forecast(serializer.validated_data)
+
+        return JsonResponse(data, status=status.HTTP_400_BAD_REQUEST if is_error else status.HTTP_200_OK)
+
+
+class MetricsView(View):
+    def get(self, request):
+        """Метрики процесса в текстовом формате Prometheus."""
+        metrics = get_metrics()
+        if metrics is None:
+            raise Http404
+
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileView(View):
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.WEATHER_PROFILING['ENABLED'] or not is_authorized(request):
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ProfileListView(ProfileView):
+    def get(self, request):
+        """Сохраненные профили запросов, новые первыми."""
+        return JsonResponse({'profiles': ProfileStore.from_settings().list()})
+
+
+class ProfileDownloadView(ProfileView):
+    def get(self, request, profile_id):
+        """Профиль в формате pstats (snakeviz, python -m pstats) или сводкой с ?format=text."""
+        data = ProfileStore.from_settings().get(profile_id)
+        if data is None:
+            raise Http404
+
+        if request.GET.get('format') == 'text':
+            return HttpResponse(render_text(data), content_type='text/plain; charset=utf-8')
+        response = HttpResponse(data, content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+        return response